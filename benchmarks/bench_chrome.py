@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Benchmark — Chrome padrão vs. perfil enxuto (browser_pool.opcoes_chrome).
+
+Abre as mesmas URLs com os dois perfis e mede: tempo do driver.get(),
+DOMContentLoaded, número de recursos baixados e bytes transferidos.
+Não precisa de credenciais: por padrão mede a página de login do portal.
+
+Uso: cd jarvis && python benchmarks/bench_chrome.py [--url URL ...] [--repeticoes 5]
+     (--url pode apontar para o portal local de benchmarks/portal_local.py)
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+
+import browser_pool  # noqa: E402
+from portal_http import PORTAL_URL  # noqa: E402
+
+_JS_METRICAS = """
+const nav = performance.getEntriesByType('navigation')[0] || {};
+const recursos = performance.getEntriesByType('resource');
+return {
+    dom_ms: nav.domContentLoadedEventEnd || 0,
+    recursos: recursos.length,
+    bytes: recursos.reduce((t, r) => t + (r.transferSize || 0), 0) + (nav.transferSize || 0),
+};
+"""
+
+
+def medir_perfil(enxuto: bool, urls: list[str], repeticoes: int) -> dict:
+    driver = browser_pool.criar_driver(headless=True, enxuto=enxuto)
+    amostras = {"get_ms": [], "dom_ms": [], "recursos": [], "bytes": []}
+    try:
+        for _ in range(repeticoes):
+            for url in urls:
+                driver.execute_cdp_cmd("Network.clearBrowserCache", {})
+                inicio = time.perf_counter()
+                driver.get(url)
+                amostras["get_ms"].append((time.perf_counter() - inicio) * 1000)
+                metricas = driver.execute_script(_JS_METRICAS)
+                for chave in ("dom_ms", "recursos", "bytes"):
+                    amostras[chave].append(metricas[chave])
+    finally:
+        driver.quit()
+    return {chave: statistics.median(valores) for chave, valores in amostras.items()}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--url", action="append", help=f"URL a medir (padrão: {PORTAL_URL})")
+    ap.add_argument("--repeticoes", type=int, default=5)
+    args = ap.parse_args()
+    urls = args.url or [PORTAL_URL]
+
+    print(f"URLs: {', '.join(urls)} | repetições: {args.repeticoes} (medianas)\n")
+    print(f"{'perfil':<8} {'get()':>9} {'DOM pronto':>11} {'recursos':>9} {'KB':>8}")
+    resultados = {}
+    for nome, enxuto in (("padrão", False), ("enxuto", True)):
+        r = resultados[nome] = medir_perfil(enxuto, urls, args.repeticoes)
+        print(f"{nome:<8} {r['get_ms']:>7.0f}ms {r['dom_ms']:>9.0f}ms {r['recursos']:>9.0f} {r['bytes'] / 1024:>8.0f}")
+
+    antes, depois = resultados["padrão"], resultados["enxuto"]
+    if depois["get_ms"]:
+        print(f"\nGanho: {antes['get_ms'] / depois['get_ms']:.1f}× no get(), "
+              f"{(antes['bytes'] - depois['bytes']) / 1024:.0f} KB a menos por página")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+Benchmark dos parsers do portal (fam_scraper.py) com páginas de tamanho crescente.
+
+Para cada parser e tamanho mede: tempo (mediana das repetições), pico de
+memória e blocos alocados (tracemalloc) durante a chamada. Os resultados
+podem virar baseline em JSON; nas rodadas seguintes, qualquer caso que
+piorar mais que --limite (tempo ou memória) é marcado como regressão e o
+script sai com código 1 (útil em CI).
+
+Tempos absolutos variam de máquina para máquina, então antes dos casos
+roda um laço de calibração no mesmo processo e a comparação usa o tempo
+de cada caso em múltiplos dele ("rel"), não os milissegundos.
+
+Uso: cd jarvis && python benchmarks/bench_parsers.py                 # compara com a baseline
+     python benchmarks/bench_parsers.py --salvar                      # grava nova baseline
+     python benchmarks/bench_parsers.py --rapido --limite 0.5         # tamanhos menores
+
+A baseline não é versionada: grave a sua (local ou no CI) antes de comparar.
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import fam_scraper  # noqa: E402
+import paginas  # noqa: E402
+
+BASELINE = os.path.join(os.path.dirname(__file__), "baselines", "parsers.json")
+
+
+def _grade_crua(slots_por_dia: int) -> dict:
+    """Entrada de _agrupar_grade: vários slots (aula, matéria, prof) por dia."""
+    aulas = ["P1", "01", "02", "03", "04"]
+    return {
+        str(dia): [(aulas[i % 5], f"Matéria {i // 2}", f"Professor {i}") for i in range(slots_por_dia)]
+        for dia in range(6)
+    }
+
+
+def casos(rapido: bool = False) -> list[tuple[str, str, object, tuple]]:
+    """[(parser, tamanho, função, args)] — tamanhos crescentes por parser."""
+    disciplinas = (10, 50) if rapido else (10, 50, 100, 200)
+    semestres = (2, 5) if rapido else (2, 5, 10, 20)
+    materias = (1, 4) if rapido else (1, 4, 8)
+    slots = (10, 100) if rapido else (10, 100, 1000)
+
+    lista = []
+    for n in disciplinas:
+        html = paginas.pagina_notas(disciplinas=n)
+        lista.append(("parse_notas_html", f"{n} disciplinas", fam_scraper.parse_notas_html, (html,)))
+        lista.append(("parse_info_aluno", f"{n} disciplinas", fam_scraper.parse_info_aluno, (html,)))
+        lista.append(("parse_pagina_notas", f"{n} disciplinas", fam_scraper.parse_pagina_notas, (html,)))
+    for m in materias:
+        html = paginas.pagina_grade(materias_por_celula=m)
+        lista.append(("parse_grade_html", f"{m} matéria(s)/célula", fam_scraper.parse_grade_html, (html,)))
+    for n in slots:
+        lista.append(("_agrupar_grade", f"{n} slots/dia", fam_scraper._agrupar_grade, (_grade_crua(n),)))
+    for n in semestres:
+        html = paginas.pagina_historico(semestres=n)
+        lista.append(("parse_historico_html", f"{n} semestres", fam_scraper.parse_historico_html, (html,)))
+    return lista
+
+
+def calibrar(repeticoes: int) -> float:
+    """Mediana (ms) de um laço fixo de Python puro — a régua da máquina atual."""
+    def laco():
+        total = 0
+        for i in range(200_000):
+            total += i % 7
+        return total
+
+    laco()
+    tempos = []
+    for _ in range(max(5, repeticoes)):
+        inicio = time.perf_counter()
+        laco()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+
+def medir(funcao, args, repeticoes: int) -> dict:
+    """Tempo (mediana, ms), pico de memória (KB) e blocos alocados numa chamada."""
+    funcao(*args)  # aquece caches (regex, imports preguiçosos)
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao(*args)
+        tempos.append((time.perf_counter() - inicio) * 1000)
+
+    tracemalloc.start()
+    antes = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    resultado = funcao(*args)
+    _, pico = tracemalloc.get_traced_memory()
+    depois = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    blocos = sum(max(0, s.count_diff) for s in depois.compare_to(antes, "filename"))
+    del resultado
+
+    return {"ms": round(statistics.median(tempos), 3), "pico_kb": round(pico / 1024, 1), "blocos": blocos}
+
+
+def comparar(atual: dict, base: dict, limite: float) -> list[str]:
+    """Casos que pioraram mais que `limite` (fração) em tempo relativo ou pico de memória."""
+    regressoes = []
+    for chave, med in atual.items():
+        ref = base.get(chave)
+        if not ref or "rel" not in ref:
+            continue
+        for metrica in ("rel", "pico_kb"):
+            if ref[metrica] and med[metrica] > ref[metrica] * (1 + limite):
+                regressoes.append(
+                    f"{chave}: {metrica} {ref[metrica]} → {med[metrica]} "
+                    f"(+{(med[metrica] / ref[metrica] - 1):.0%})"
+                )
+    return regressoes
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--repeticoes", type=int, default=15)
+    ap.add_argument("--limite", type=float, default=0.25, help="Piora tolerada (0.25 = 25%%)")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--salvar", action="store_true", help="Grava os resultados como nova baseline")
+    ap.add_argument("--rapido", action="store_true", help="Só os tamanhos menores")
+    args = ap.parse_args()
+
+    print(f"Parser HTML: {fam_scraper.PARSER_HTML} | Python {platform.python_version()} | "
+          f"repetições: {args.repeticoes}\n")
+    calibracao = calibrar(args.repeticoes)
+    print(f"Calibração: {calibracao:.2f} ms (rel = ms / calibração)\n")
+    print(f"{'parser':<22} {'tamanho':<22} {'ms':>9} {'rel':>8} {'pico KB':>9} {'blocos':>8}")
+
+    resultados = {}
+    for parser, tamanho, funcao, fargs in casos(args.rapido):
+        med = medir(funcao, fargs, args.repeticoes)
+        med["rel"] = round(med["ms"] / calibracao, 3)
+        resultados[f"{parser} [{tamanho}]"] = med
+        print(f"{parser:<22} {tamanho:<22} {med['ms']:>9.2f} {med['rel']:>8.2f} "
+              f"{med['pico_kb']:>9.0f} {med['blocos']:>8}")
+
+    if args.salvar:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({
+                "parser_html": fam_scraper.PARSER_HTML,
+                "python": platform.python_version(),
+                "maquina": platform.machine(),
+                "calibracao_ms": round(calibracao, 3),
+                "resultados": resultados,
+            }, f, ensure_ascii=False, indent=2)
+        print(f"\nBaseline salva em {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"\nSem baseline em {args.baseline} — rode com --salvar primeiro.")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        base = json.load(f)
+    if base.get("parser_html") != fam_scraper.PARSER_HTML:
+        print(f"\n⚠ Baseline gravada com {base.get('parser_html')} — comparação pouco útil.")
+
+    regressoes = comparar(resultados, base.get("resultados", {}), args.limite)
+    if regressoes:
+        print(f"\n❌ {len(regressoes)} regressão(ões) acima de {args.limite:.0%}:")
+        for r in regressoes:
+            print(f"  {r}")
+        return 1
+    print(f"\n✅ Sem regressões acima de {args.limite:.0%} em relação à baseline.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark — parse completo vs. parse restrito à tabela (recorte/SoupStrainer).
+
+Compara, para notas/grade/histórico, o DOM inteiro (como era antes) com o
+_soup_pagina() usado hoje pelos parsers: tempo médio e pico de memória
+(tracemalloc) de montar a árvore + rodar o parser.
+
+Uso: cd jarvis && python benchmarks/bench_recorte.py [--repeticoes 20]
+Usa as capturas de logs/capturas/ (FAM_CAPTURA=on) se existirem.
+"""
+
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+from bs4 import BeautifulSoup  # noqa: E402
+
+import fam_scraper  # noqa: E402
+from paginas import carregar_paginas  # noqa: E402
+
+PARSERS = {
+    "notas": fam_scraper.parse_pagina_notas,
+    "grade": fam_scraper.parse_grade_html,
+    "historico": fam_scraper.parse_historico_html,
+}
+
+
+def _completo(html):
+    return BeautifulSoup(html, fam_scraper.PARSER_HTML)
+
+
+def _restrito(pagina):
+    return lambda html: fam_scraper._soup_pagina(html, pagina)
+
+
+def medir(montar, parser, html, repeticoes):
+    """(ms médio, pico de memória em KB) de montar a árvore + parsear."""
+    inicio = time.perf_counter()
+    for _ in range(repeticoes):
+        parser(montar(html))
+    ms = (time.perf_counter() - inicio) * 1000 / repeticoes
+
+    tracemalloc.start()
+    parser(montar(html))
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return ms, pico / 1024
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--repeticoes", type=int, default=20)
+    args = ap.parse_args()
+
+    print(f"Parser HTML: {fam_scraper.PARSER_HTML} | repetições: {args.repeticoes}\n")
+    print(f"{'página':<10} {'origem':<10} {'KB':>6} | {'completo':>16} | {'restrito':>16} | ganho")
+    for pagina, (origem, html) in carregar_paginas().items():
+        parser = PARSERS[pagina]
+        ms_c, kb_c = medir(_completo, parser, html, args.repeticoes)
+        ms_r, kb_r = medir(_restrito(pagina), parser, html, args.repeticoes)
+        print(
+            f"{pagina:<10} {origem:<10} {len(html) / 1024:>6.0f} | "
+            f"{ms_c:>6.1f} ms {kb_c:>6.0f} KB | {ms_r:>6.1f} ms {kb_r:>6.0f} KB | "
+            f"{ms_c / ms_r:.1f}× tempo, {kb_c / kb_r:.1f}× memória"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""
+Benchmark ponta a ponta do scraper (caminho HTTP) contra o portal local.
+
+Sobe benchmarks/portal_local.py numa thread, aponta o scraper para ele
+(FAM_PORTAL_URL) e roda N "usuários" em paralelo, cada um fazendo login +
+notas + grade + histórico + detalhes das atividades, como o job periódico.
+Mostra latência por usuário (p50/p95), vazão e o que o portal recebeu.
+
+Uso: cd jarvis && python benchmarks/bench_scraper.py --usuarios 20 --paralelo 4 --latencia-ms 300
+     python -m cProfile -s cumtime benchmarks/bench_scraper.py ...   # perfil
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "src"))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import portal_local  # noqa: E402
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--usuarios", type=int, default=20)
+    ap.add_argument("--paralelo", type=int, default=4)
+    ap.add_argument("--latencia-ms", type=float, default=200)
+    ap.add_argument("--jitter-ms", type=float, default=100)
+    ap.add_argument("--taxa-erro", type=float, default=0.0)
+    ap.add_argument("--taxa-expira", type=float, default=0.0)
+    ap.add_argument("--atividades", type=int, default=10)
+    args = ap.parse_args()
+
+    config = portal_local.ConfigPortal(args.latencia_ms, args.jitter_ms, args.taxa_erro,
+                                       args.taxa_expira, args.atividades)
+    servidor, url = portal_local.iniciar(0, config)
+
+    # O scraper lê FAM_PORTAL_URL na importação
+    os.environ["FAM_PORTAL_URL"] = url
+    os.environ.setdefault("FAM_CAPTURA", "off")
+    from fam_scraper import FAMScraper
+
+    links = [urljoin(url, f"fam/pg_portal.php?frame=frame_atividade.php&id={i}")
+             for i in range(1, args.atividades + 1)]
+
+    def usuario(n):
+        inicio = time.perf_counter()
+        scraper = FAMScraper(f"aluno{n}", config.senha, headless=False)
+        ok = False
+        try:
+            if scraper.fazer_login():
+                notas, _ = scraper.extrair_notas()
+                grade = scraper.extrair_grade()
+                historico = scraper.extrair_historico()
+                detalhes = scraper.extrair_detalhes_atividades(links)
+                ok = bool(notas and grade and historico) and len(detalhes) == len(links)
+        finally:
+            scraper.close()
+        return time.perf_counter() - inicio, ok
+
+    print(f"Portal local: {url} | latência {args.latencia_ms}±{args.jitter_ms} ms | "
+          f"erro {args.taxa_erro:.0%} | expira {args.taxa_expira:.0%}")
+    print(f"{args.usuarios} usuários, {args.paralelo} em paralelo, {args.atividades} atividades cada\n")
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.paralelo) as executor:
+        resultados = list(executor.map(usuario, range(args.usuarios)))
+    total = time.perf_counter() - inicio
+    servidor.shutdown()
+
+    tempos = sorted(t for t, _ in resultados)
+    falhas = sum(1 for _, ok in resultados if not ok)
+    p95 = tempos[min(len(tempos) - 1, int(len(tempos) * 0.95))]
+    print(f"Total: {total:.1f}s | vazão: {args.usuarios / total:.2f} usuários/s | falhas: {falhas}")
+    print(f"Por usuário: p50 {statistics.median(tempos):.2f}s | p95 {p95:.2f}s | máx {tempos[-1]:.2f}s")
+    print(f"Portal recebeu: {dict(sorted(config.contagem.items()))}")
+    return 1 if falhas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
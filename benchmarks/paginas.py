@@ -0,0 +1,162 @@
+"""
+Páginas sintéticas no formato do portal FAM, para benchmarks sem internet.
+
+O portal embrulha as tabelas de dados em muita navegação (menus, frames,
+scripts). Aqui a mesma coisa é gerada com tamanho controlável; quando houver
+HTML capturado (FAM_CAPTURA=on → logs/capturas/), prefira ele — ver
+carregar_paginas().
+"""
+
+import glob
+import gzip
+import os
+
+RAIZ = os.path.join(os.path.dirname(__file__), "..")
+
+# Capturas gravadas pelo scraper (src/captura.py)
+CAPTURAS = os.path.join(RAIZ, "logs", "capturas")
+
+
+def captura_mais_recente(pagina: str) -> str | None:
+    """HTML da captura mais recente da página (qualquer usuário), ou None."""
+    arquivos = glob.glob(os.path.join(CAPTURAS, "*", pagina, "*.html.gz"))
+    if not arquivos:
+        return None
+    with gzip.open(max(arquivos, key=os.path.getmtime), "rt", encoding="utf-8") as f:
+        return f.read()
+
+
+def _navegacao(itens: int = 120) -> str:
+    """Menu lateral + cabeçalho + scripts, como nas páginas reais."""
+    links = "".join(
+        f'<tr><td class="LinhaImpar"><a href="pg_portal.php?frame=item{i}.php">Item {i}</a></td></tr>'
+        for i in range(itens)
+    )
+    scripts = "".join(f"<script>function f{i}(){{return {i};}}</script>" for i in range(itens // 4))
+    return (
+        '<table class="cabecalho"><tr><td><img src="logo.png"></td>'
+        '<td><font class="login-u">57-05-B</font> <font class="login-u">Bloco 2 - Sala 073</font></td></tr></table>'
+        f'<table class="menu">{links}</table>{scripts}'
+    )
+
+
+def _documento(conteudo: str, itens: int) -> str:
+    return (
+        '<html><head><meta charset="utf-8"><title>Portal FAM</title></head><body>'
+        f"{_navegacao(itens)}<div class='conteudo'>{conteudo}</div>"
+        f"{_navegacao(itens // 2)}</body></html>"
+    )
+
+
+def pagina_notas(disciplinas: int = 8, itens: int = 120) -> str:
+    linhas = "".join(
+        "<tr>"
+        + f"<td>{1000 + i}</td><td>Disciplina {i} - Ciência da Computação</td>"
+        + "".join("<td>7,5</td>" for _ in range(9))
+        + '<td class="ColunaMP">7,5</td><td></td><td></td><td class="ColunaMF">7,5</td>'
+        + "<td>20</td><td>2</td></tr>"
+        for i in range(disciplinas)
+    )
+    curso = '<table><tr><td class="LinhaPar">Ciência da Computação</td></tr></table>'
+    return _documento(f'{curso}<table class="GradeNotas">{linhas}</table>', itens)
+
+
+def pagina_grade(itens: int = 120, materias_por_celula: int = 1) -> str:
+    linhas = "<tr><td>Aula</td>" + "".join(f"<td>{d}</td>" for d in ("SEG", "TER", "QUA", "QUI", "SEX", "SAB")) + "</tr>"
+    for aula in ("P1", "01", "02", "03", "04"):
+        celulas = "".join(
+            '<td class="GradeNotas"><table>'
+            + "".join(
+                '<tr><td class="LinhaPar">'
+                f'Matéria {dia}.{m}<br><br><font class="MensagensAtv">Professor {dia}(1{dia})</font>'
+                "</td></tr>"
+                for m in range(materias_por_celula)
+            )
+            + "</table></td>"
+            for dia in range(6)
+        )
+        linhas += f'<tr><td class="GradeNotas">{aula}</td>{celulas}</tr>'
+    return _documento(f'<table class="Grade"><tbody>{linhas}</tbody></table>', itens)
+
+
+def pagina_historico(semestres: int = 8, itens: int = 120) -> str:
+    linhas = ""
+    for sem in range(1, semestres + 1):
+        linhas += f'<tr><td colspan="10">SEMESTRE {sem:02d}</td></tr>'
+        linhas += "<tr>" + "".join(
+            f"<td>{c}</td>" for c in ("ANO", "DISCIPLINA", "CARGA", "N1", "N2", "N3", "AR", "MÉDIA", "FALTAS", "SITUAÇÃO")
+        ) + "</tr>"
+        for i in range(6):
+            linhas += "<tr>" + "".join(
+                f"<td>{c}</td>" for c in
+                ("2024", f"{2000 + sem * 10 + i} Disciplina {sem}.{i}", "80", "7", "7", "7", "", "7,0", "2", "APROVADO")
+            ) + "</tr>"
+    return _documento(f'<table class="Grade">{linhas}</table>', itens)
+
+
+def pagina_login(erro: str = "") -> str:
+    """Formulário de login com os mesmos nomes de campo do portal real."""
+    aviso = f'<font color="red">{erro}</font>' if erro else ""
+    return (
+        '<html><head><meta charset="utf-8"><title>Portal FAM</title></head><body>'
+        f'{aviso}<form method="post" action="valida_login.php">'
+        '<input type="hidden" name="token" value="bench">'
+        '<input type="text" name="user"><input type="password" name="senha">'
+        '<button type="submit" name="login" value="Entrar">Entrar</button>'
+        '<input type="submit" name="esqueci" value="Esqueci minha senha">'
+        "</form></body></html>"
+    )
+
+
+def pagina_inicio(itens: int = 120) -> str:
+    atalho = '<a href="pg_portal.php?frame=frame_avisos.php&atividades=X">Atividades</a>'
+    return _documento(f"<p>Bem-vindo ao portal</p>{atalho}", itens)
+
+
+def pagina_atividades(quantidade: int = 10, itens: int = 120) -> str:
+    """Lista de atividades (tr.lovelyrow1/2) no layout que extrair_atividades lê."""
+    linhas = ""
+    for i in range(1, quantidade + 1):
+        linhas += (
+            f'<tr class="lovelyrow{1 + i % 2}" '
+            f"onclick=\"location.href='pg_portal.php?frame=frame_atividade.php&id={i}'\">"
+            '<td class="nicepadding"><table>'
+            f'<tr><td width="5%">•</td><td width="95%">Atividade {i}</td></tr>'
+            f'<tr><td></td><td class="Mensagens" width="95%">Disciplina {i % 5}</td></tr>'
+            '</table><table><tr><td class="MensagensAtv">'
+            "Criado por: Professor || Período de Vigência: 01/03/2025 a 30/03/2025"
+            "</td></tr></table></td>"
+            '<td class="nicepadding"><table><tr><td>Trabalho</td>'
+            '<td class="MensagensAtv">Pendente</td></tr></table></td>'
+            f'<td class="nicepadding"><div>{i % 28 + 1:02d}/04/2025</div></td></tr>'
+        )
+    return _documento(f"<table>{linhas}</table>", itens)
+
+
+def pagina_detalhe_atividade(numero: int) -> str:
+    """Página de uma atividade: descrição + materiais (input mat_link)."""
+    materiais = "".join(
+        f'<tr><td>material{numero}-{m}.pdf</td><td>PDF</td>'
+        f'<td><input type="hidden" name="mat_link" value="arquivos/{numero}-{m}.pdf"></td></tr>'
+        for m in range(2)
+    )
+    return (
+        '<html><head><meta charset="utf-8"></head><body><table>'
+        f"<tr><td>Descrição da Atividade:<br>Entregar a lista {numero}.<br>"
+        f"Valendo 1 ponto.<br>Material Associado</td></tr>{materiais}"
+        "</table></body></html>"
+    )
+
+
+def carregar_paginas() -> dict[str, tuple[str, str]]:
+    """{pagina: (origem, html)} — capturada se existir, senão sintética."""
+    sinteticas = {
+        "notas": pagina_notas,
+        "grade": pagina_grade,
+        "historico": pagina_historico,
+    }
+    paginas = {}
+    for nome, gerar in sinteticas.items():
+        html = captura_mais_recente(nome)
+        paginas[nome] = ("capturada", html) if html else ("sintética", gerar())
+    return paginas
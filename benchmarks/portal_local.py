@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+Portal FAM local — servidor HTTP que imita o famportal.com.br para benchmarks.
+
+Reproduz o formulário de login (valida_login.php + cookie de sessão), o
+pg_portal.php com os frames de notas, grade, extrato e atividades e as
+páginas de detalhe de atividade. O conteúdo vem de benchmarks/paginas.py
+(capturas reais se existirem, senão páginas sintéticas).
+
+Lentidão e falhas do portal real são simuladas com:
+  --latencia-ms / --jitter-ms   atraso por requisição
+  --taxa-erro                   fração de respostas 503
+  --taxa-expira                 fração de páginas que devolvem o login (sessão caiu)
+
+Uso: cd jarvis && python benchmarks/portal_local.py --porta 8765 --latencia-ms 300
+     FAM_PORTAL_URL=http://127.0.0.1:8765/ python src/monitor.py
+"""
+
+import argparse
+import random
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import paginas
+
+# Frame do pg_portal.php → chave da página em carregar_paginas()
+_FRAMES = {
+    "frame_alu_notas.php": "notas",
+    "frame_alu_gradealuno.php": "grade",
+    "frame_alu_extrato_notas.php": "historico",
+}
+
+
+class ConfigPortal:
+    """Parâmetros do portal simulado (compartilhados entre as threads do servidor)."""
+
+    def __init__(self, latencia_ms=0, jitter_ms=0, taxa_erro=0.0, taxa_expira=0.0,
+                 atividades=10, senha="senha"):
+        self.latencia_ms = latencia_ms
+        self.jitter_ms = jitter_ms
+        self.taxa_erro = taxa_erro
+        self.taxa_expira = taxa_expira
+        self.atividades = atividades
+        self.senha = senha
+        self.paginas = {nome: html for nome, (_, html) in paginas.carregar_paginas().items()}
+        self.sessoes: set[str] = set()
+        self.contagem: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def contar(self, chave: str):
+        with self._lock:
+            self.contagem[chave] = self.contagem.get(chave, 0) + 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    config: ConfigPortal
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    # ── Respostas ────────────────────────────────────────────────────────────
+
+    def _enviar(self, status: int, html: str = "", cabecalhos: dict | None = None):
+        corpo = html.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "text/html; charset=utf-8")
+        self.send_header("Content-Length", str(len(corpo)))
+        for nome, valor in (cabecalhos or {}).items():
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _simular_portal(self) -> bool:
+        """Aplica latência e erro injetado. False se já respondeu com erro."""
+        cfg = self.config
+        atraso = cfg.latencia_ms + random.uniform(0, cfg.jitter_ms)
+        if atraso:
+            time.sleep(atraso / 1000)
+        if random.random() < cfg.taxa_erro:
+            cfg.contar("erro_503")
+            self._enviar(503, "<html>Serviço indisponível</html>")
+            return False
+        return True
+
+    def _sessao(self) -> str | None:
+        for parte in self.headers.get("Cookie", "").split(";"):
+            nome, _, valor = parte.strip().partition("=")
+            if nome == "PHPSESSID" and valor in self.config.sessoes:
+                return valor
+        return None
+
+    # ── Rotas ────────────────────────────────────────────────────────────────
+
+    def do_GET(self):
+        if not self._simular_portal():
+            return
+        cfg = self.config
+        url = urlsplit(self.path)
+        if url.path in ("/", "/index.php"):
+            cfg.contar("login_form")
+            return self._enviar(200, paginas.pagina_login())
+        if url.path != "/fam/pg_portal.php":
+            return self._enviar(404, "<html>404</html>")
+
+        if not self._sessao() or random.random() < cfg.taxa_expira:
+            cfg.contar("sessao_expirada")
+            return self._enviar(200, paginas.pagina_login())
+
+        params = {k: v[0] for k, v in parse_qs(url.query).items()}
+        frame = params.get("frame", "")
+        if frame in _FRAMES:
+            pagina = _FRAMES[frame]
+            html = cfg.paginas[pagina]
+        elif frame == "frame_avisos.php":
+            pagina = "atividades"
+            html = paginas.pagina_atividades(cfg.atividades)
+        elif frame == "frame_atividade.php":
+            pagina = "detalhe"
+            html = paginas.pagina_detalhe_atividade(int(params.get("id", "0") or 0))
+        else:
+            pagina = "inicio"
+            html = paginas.pagina_inicio()
+        cfg.contar(pagina)
+        self._enviar(200, html)
+
+    def do_POST(self):
+        if not self._simular_portal():
+            return
+        cfg = self.config
+        tamanho = int(self.headers.get("Content-Length", "0") or 0)
+        dados = {k: v[0] for k, v in parse_qs(self.rfile.read(tamanho).decode("utf-8")).items()}
+        if urlsplit(self.path).path != "/valida_login.php":
+            return self._enviar(404, "<html>404</html>")
+        if not dados.get("user") or dados.get("senha") != cfg.senha or "login" not in dados:
+            cfg.contar("login_recusado")
+            return self._enviar(200, paginas.pagina_login("Usuário ou senha inválidos"))
+
+        sessao = secrets.token_hex(16)
+        with cfg._lock:
+            cfg.sessoes.add(sessao)
+        cfg.contar("login_ok")
+        self._enviar(302, cabecalhos={
+            "Location": "/fam/pg_portal.php",
+            "Set-Cookie": f"PHPSESSID={sessao}; Path=/",
+        })
+
+
+def iniciar(porta: int = 0, config: ConfigPortal | None = None) -> tuple[ThreadingHTTPServer, str]:
+    """Sobe o portal numa thread. Retorna (servidor, url_base). porta=0 escolhe uma livre."""
+    config = config or ConfigPortal()
+    handler = type("HandlerPortal", (_Handler,), {"config": config})
+    servidor = ThreadingHTTPServer(("127.0.0.1", porta), handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="portal-local", daemon=True).start()
+    return servidor, f"http://127.0.0.1:{servidor.server_address[1]}/"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--porta", type=int, default=8765)
+    ap.add_argument("--latencia-ms", type=float, default=0)
+    ap.add_argument("--jitter-ms", type=float, default=0)
+    ap.add_argument("--taxa-erro", type=float, default=0.0)
+    ap.add_argument("--taxa-expira", type=float, default=0.0)
+    ap.add_argument("--atividades", type=int, default=10)
+    ap.add_argument("--senha", default="senha", help="Senha aceita (qualquer usuário)")
+    args = ap.parse_args()
+
+    config = ConfigPortal(args.latencia_ms, args.jitter_ms, args.taxa_erro, args.taxa_expira,
+                          args.atividades, args.senha)
+    servidor, url = iniciar(args.porta, config)
+    print(f"Portal local em {url} (senha: {args.senha}) — Ctrl+C para parar")
+    print(f"Use: FAM_PORTAL_URL={url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        servidor.shutdown()
+        print(f"Requisições: {config.contagem}")
+
+
+if __name__ == "__main__":
+    main()
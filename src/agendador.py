@@ -0,0 +1,265 @@
+"""
+Agendador de scrapes do portal FAM — workers fixos com classes de prioridade.
+
+Todo scrape bloqueante (PortalSync) passa por aqui em vez do executor padrão
+do asyncio, que é dividido com chamadas de IA, pagamentos e banco. O número
+de workers é o teto de sessões simultâneas no portal (e de Chromes abertos).
+
+Prioridades: comandos interativos > cadastro > jobs de fundo. Tarefas de
+fundo nunca ocupam os workers reservados aos interativos e só começam
+quando não há ninguém de prioridade maior esperando; um scrape já em
+andamento não é interrompido (não há como matar o Chrome no meio), mas o
+job pode consultar `deve_ceder()` entre usuários.
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+INTERATIVO, CADASTRO, FUNDO = 0, 1, 2
+NOMES_PRIORIDADE = {INTERATIVO: "interativo", CADASTRO: "cadastro", FUNDO: "fundo"}
+
+WORKERS = int(os.getenv("FAM_SCRAPE_WORKERS", "2"))
+# Workers que tarefas de fundo não podem ocupar (sempre livres para comandos)
+RESERVA_INTERATIVA = int(os.getenv("FAM_SCRAPE_RESERVA_INTERATIVA", "1"))
+# Duração presumida de um scrape até haver medições (segundos)
+DURACAO_INICIAL = 20.0
+
+
+class Tarefa:
+    """Scrape enfileirado: `futuro` recebe o resultado; posição/ETA na entrada da fila."""
+
+    def __init__(self, funcao, args, kwargs, prioridade: int):
+        self.funcao = funcao
+        self.args = args
+        self.kwargs = kwargs
+        self.prioridade = prioridade
+        self.futuro: Future = Future()
+        self.posicao = 0
+        self.eta = 0.0
+
+
+class AgendadorScrape:
+    """Fila de prioridade + `workers` threads dedicadas a scrapes."""
+
+    def __init__(self, workers: int = WORKERS, reserva_interativa: int = RESERVA_INTERATIVA):
+        self.workers = max(1, workers)
+        self.limite_fundo = max(1, self.workers - max(0, reserva_interativa))
+        self._cond = threading.Condition()
+        self._fila: list[tuple[int, int, Tarefa]] = []
+        self._seq = itertools.count()
+        self._rodando = {p: 0 for p in NOMES_PRIORIDADE}
+        self._duracao = {p: DURACAO_INICIAL for p in NOMES_PRIORIDADE}
+        self._concluidas = 0
+        self._threads: list[threading.Thread] = []
+        self._parar = False
+
+    # ── Fila ────────────────────────────────────────────────────────────────
+
+    def submeter(self, funcao, *args, prioridade: int = INTERATIVO, **kwargs) -> Tarefa:
+        """Enfileira `funcao(*args, **kwargs)`. Retorna a Tarefa (posição 0 = começa já)."""
+        tarefa = Tarefa(funcao, args, kwargs, prioridade)
+        with self._cond:
+            if self._parar:
+                raise RuntimeError("Agendador de scrapes encerrado")
+            self._iniciar_workers()
+            # Quem sai antes desta tarefa: fila de prioridade ≤ + os que já rodam
+            frente = sum(1 for p, _, _ in self._fila if p <= prioridade)
+            ocupados = sum(self._rodando.values())
+            if frente + ocupados >= self.workers or not self._pode_iniciar(prioridade):
+                tarefa.posicao = frente + 1
+                tarefa.eta = self._estimar(tarefa.posicao, prioridade)
+            heapq.heappush(self._fila, (prioridade, next(self._seq), tarefa))
+            self._cond.notify()
+        if tarefa.posicao:
+            logger.info("Agendador: %s na fila (posição %d, ~%.0fs)",
+                        NOMES_PRIORIDADE[prioridade], tarefa.posicao, tarefa.eta)
+        return tarefa
+
+    async def executar(self, funcao, *args, prioridade: int = INTERATIVO, ao_enfileirar=None, **kwargs):
+        """Versão async: espera o resultado sem ocupar o executor padrão.
+
+        ao_enfileirar: coroutine (posicao, eta_segundos) chamada se a tarefa
+        tiver que esperar na fila (ex.: avisar o usuário).
+        """
+        tarefa = self.submeter(funcao, *args, prioridade=prioridade, **kwargs)
+        if tarefa.posicao and ao_enfileirar:
+            try:
+                await ao_enfileirar(tarefa.posicao, tarefa.eta)
+            except Exception as e:
+                logger.warning("Agendador: erro ao avisar posição na fila: %s", e)
+        return await asyncio.wrap_future(tarefa.futuro)
+
+    def deve_ceder(self) -> bool:
+        """True se há tarefas de prioridade maior que fundo esperando worker."""
+        with self._cond:
+            return any(p < FUNDO for p, _, _ in self._fila)
+
+    def estatisticas(self) -> dict:
+        with self._cond:
+            return {
+                "workers": self.workers,
+                "rodando": {NOMES_PRIORIDADE[p]: n for p, n in self._rodando.items()},
+                "na_fila": {NOMES_PRIORIDADE[p]: sum(1 for q, _, _ in self._fila if q == p)
+                            for p in NOMES_PRIORIDADE},
+                "duracao_media_s": {NOMES_PRIORIDADE[p]: round(d, 1) for p, d in self._duracao.items()},
+                "concluidas": self._concluidas,
+            }
+
+    def encerrar(self, timeout: float = 5.0) -> None:
+        """Cancela o que está na fila e espera os scrapes em andamento (shutdown)."""
+        with self._cond:
+            self._parar = True
+            pendentes = [t for _, _, t in self._fila]
+            self._fila.clear()
+            self._cond.notify_all()
+        for tarefa in pendentes:
+            tarefa.futuro.cancel()
+        for thread in self._threads:
+            thread.join(timeout)
+        logger.info("Agendador de scrapes encerrado (%d tarefa(s) canceladas)", len(pendentes))
+
+    # ── Internos (chamados com self._cond) ──────────────────────────────────
+
+    def _iniciar_workers(self):
+        while len(self._threads) < self.workers:
+            thread = threading.Thread(target=self._trabalhar, name=f"scrape-{len(self._threads)}",
+                                      daemon=True)
+            self._threads.append(thread)
+            thread.start()
+
+    def _pode_iniciar(self, prioridade: int) -> bool:
+        if prioridade < FUNDO:
+            return True
+        return self._rodando[FUNDO] < self.limite_fundo
+
+    def _estimar(self, posicao: int, prioridade: int) -> float:
+        """ETA grosseira: rodadas de `workers` tarefas × duração média."""
+        media = self._duracao[prioridade]
+        return math.ceil(posicao / self.workers) * media
+
+    def _trabalhar(self):
+        while True:
+            with self._cond:
+                while not self._parar and not (self._fila and self._pode_iniciar(self._fila[0][0])):
+                    self._cond.wait()
+                if self._parar:
+                    return
+                _, _, tarefa = heapq.heappop(self._fila)
+                self._rodando[tarefa.prioridade] += 1
+
+            inicio = time.monotonic()
+            try:
+                if tarefa.futuro.set_running_or_notify_cancel():
+                    try:
+                        tarefa.futuro.set_result(tarefa.funcao(*tarefa.args, **tarefa.kwargs))
+                    except BaseException as e:
+                        tarefa.futuro.set_exception(e)
+            finally:
+                duracao = time.monotonic() - inicio
+                with self._cond:
+                    self._rodando[tarefa.prioridade] -= 1
+                    self._concluidas += 1
+                    # Média móvel exponencial por classe (alimenta a ETA)
+                    self._duracao[tarefa.prioridade] = 0.8 * self._duracao[tarefa.prioridade] + 0.2 * duracao
+                    self._cond.notify_all()
+
+
+# ── Lotes (job periódico) ────────────────────────────────────────────────────
+
+
+class LimiteTaxa:
+    """Token bucket para o event loop: `por_minuto` fichas, até `rajada` acumuladas."""
+
+    def __init__(self, por_minuto: float, rajada: int = 1):
+        self.taxa = por_minuto / 60
+        self.rajada = max(1, rajada)
+        self._fichas = float(self.rajada)
+        self._ultimo = time.monotonic()
+
+    async def aguardar(self) -> None:
+        while True:
+            agora = time.monotonic()
+            self._fichas = min(self.rajada, self._fichas + (agora - self._ultimo) * self.taxa)
+            self._ultimo = agora
+            if self._fichas >= 1:
+                self._fichas -= 1
+                return
+            await asyncio.sleep((1 - self._fichas) / self.taxa)
+
+
+async def processar_lote(itens, processar, concorrencia: int, limite: LimiteTaxa | None = None,
+                         timeout: float | None = None, nome: str = "Lote") -> dict:
+    """Roda `await processar(item)` para cada item, com até `concorrencia` ao mesmo tempo.
+
+    Cada item espera uma ficha de `limite` antes de começar. TimeoutError
+    levantado por `processar` conta como timeout. `timeout` (opcional) só
+    deixa de esperar o item: um scrape já rodando no agendador continua até
+    o fim — para limitar o scrape em si, passe o prazo para ele
+    (PortalSync timeout_s). Loga o progresso a cada ~10% e retorna
+    {"total", "feitos", "erros", "timeouts", "segundos"}.
+    """
+    itens = list(itens)
+    stats = {"total": len(itens), "feitos": 0, "erros": 0, "timeouts": 0}
+    passo = max(1, len(itens) // 10)
+    pendentes = iter(itens)
+    inicio = time.monotonic()
+
+    async def trabalhar():
+        for item in pendentes:
+            if limite:
+                await limite.aguardar()
+            try:
+                await asyncio.wait_for(processar(item), timeout)
+            except (asyncio.TimeoutError, TimeoutError) as e:
+                stats["timeouts"] += 1
+                logger.warning("%s: timeout em %s: %s", nome, item, e or f"{timeout}s")
+            except Exception as e:
+                stats["erros"] += 1
+                logger.error("%s: erro em %s: %s", nome, item, e, exc_info=True)
+            stats["feitos"] += 1
+            if stats["feitos"] % passo == 0 and stats["feitos"] < stats["total"]:
+                logger.info("%s: %d/%d (%.0f%%) em %.0fs — %d erro(s), %d timeout(s)",
+                            nome, stats["feitos"], stats["total"], 100 * stats["feitos"] / stats["total"],
+                            time.monotonic() - inicio, stats["erros"], stats["timeouts"])
+
+    await asyncio.gather(*(trabalhar() for _ in range(max(1, min(concorrencia, len(itens))))))
+    stats["segundos"] = round(time.monotonic() - inicio, 1)
+    return stats
+
+
+def proximo_horario(chave: int, agora: datetime, intervalo_s: float) -> datetime:
+    """Próximo instante após `agora` na fase fixa de `chave` dentro de cada intervalo.
+
+    A fase vem de um hash multiplicativo da chave (chat_id), então usuários
+    ficam espalhados de forma uniforme pelo intervalo e cada um mantém o
+    mesmo "horário" de ciclo em ciclo — sem varredura em bloco.
+    """
+    fase = (chave * 2654435761) % int(intervalo_s)
+    base = agora.timestamp()
+    proximo = base - (base % intervalo_s) + fase
+    if proximo <= base:
+        proximo += intervalo_s
+    return datetime.fromtimestamp(proximo, agora.tzinfo)
+
+
+_agendador: AgendadorScrape | None = None
+_agendador_lock = threading.Lock()
+
+
+def get_agendador() -> AgendadorScrape:
+    """Retorna o agendador global (criado na primeira chamada)."""
+    global _agendador
+    with _agendador_lock:
+        if _agendador is None:
+            _agendador = AgendadorScrape()
+        return _agendador
@@ -0,0 +1,131 @@
+"""
+Buffer de analytics (tabelas `eventos` e `leads`), gravado em lote fora do caminho quente.
+
+Todo comando e mensagem de IA gera um evento, e toda mensagem de texto
+atualiza o lead — antes cada um era um INSERT/UPSERT com commit (e fsync)
+próprio. Aqui eles ficam em memória e vão para o banco numa transação só
+(db.gravar_analytics) a cada FAM_ANALYTICS_LOTE eventos ou a cada
+FAM_ANALYTICS_INTERVALO_MS, o que vier primeiro, numa thread própria.
+Atualizações de lead do mesmo chat_id são fundidas numa linha por lote.
+No shutdown, encerrar() grava o que sobrou.
+
+Eventos ainda no buffer não aparecem em consultas ao banco:
+ultimo_evento_pendente() cobre o cooldown do /notas e descarregar() vem
+antes do /stats.
+"""
+
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+
+import db
+
+logger = logging.getLogger(__name__)
+
+LOTE = int(os.getenv("FAM_ANALYTICS_LOTE", "100"))
+INTERVALO_MS = int(os.getenv("FAM_ANALYTICS_INTERVALO_MS", "2000"))
+
+_eventos: list[tuple[int, str, str]] = []
+_leads: dict[int, tuple[int, str | None, str | None, str]] = {}
+_lock = threading.Lock()
+# Um lote por vez: lotes não se atropelam e a ordem dos eventos se mantém
+_gravando = threading.Lock()
+
+_thread: threading.Thread | None = None
+_acordar = threading.Event()
+_parar = threading.Event()
+
+
+def _agora() -> str:
+    """Mesmo formato de CURRENT_TIMESTAMP do SQLite (UTC, sem fuso)."""
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def log_evento(chat_id: int, tipo: str) -> None:
+    """Enfileira um evento de interação. Não toca no banco."""
+    with _lock:
+        _eventos.append((chat_id, tipo, _agora()))
+        cheio = len(_eventos) >= LOTE
+    _iniciar_thread()
+    if cheio:
+        _acordar.set()
+
+
+def registrar_lead(chat_id: int, username: str | None = None, primeiro_nome: str | None = None) -> None:
+    """Enfileira o contato de um lead, fundido com o que já estiver no buffer."""
+    with _lock:
+        anterior = _leads.get(chat_id)
+        if anterior:
+            username = username or anterior[1]
+            primeiro_nome = primeiro_nome or anterior[2]
+        _leads[chat_id] = (chat_id, username, primeiro_nome, _agora())
+    _iniciar_thread()
+
+
+def ultimo_evento_pendente(chat_id: int, tipo: str) -> str | None:
+    """Timestamp do último evento desse tipo ainda no buffer, ou None."""
+    with _lock:
+        for evento_chat, evento_tipo, quando in reversed(_eventos):
+            if evento_chat == chat_id and evento_tipo == tipo:
+                return quando
+    return None
+
+
+def pendentes() -> int:
+    """Eventos + leads aguardando gravação."""
+    with _lock:
+        return len(_eventos) + len(_leads)
+
+
+def descarregar() -> int:
+    """Grava o buffer agora, numa transação. Retorna quantos registros foram gravados."""
+    global _eventos, _leads
+    with _gravando:
+        with _lock:
+            eventos, leads = _eventos, _leads
+            _eventos, _leads = [], {}
+        if not eventos and not leads:
+            return 0
+        try:
+            db.gravar_analytics(eventos, list(leads.values()))
+        except Exception as e:
+            # Analytics não derruba nada: o lote é descartado, como um INSERT avulso que falhasse
+            logger.warning("Erro ao gravar analytics (%d eventos, %d leads perdidos): %s",
+                           len(eventos), len(leads), e)
+            return 0
+        return len(eventos) + len(leads)
+
+
+def encerrar(timeout: float = 5.0) -> None:
+    """Para a thread de gravação e grava o que sobrou no buffer (shutdown do bot)."""
+    global _thread
+    with _lock:
+        thread = _thread
+        _thread = None
+    if thread is not None:
+        _parar.set()
+        _acordar.set()
+        thread.join(timeout)
+        _parar.clear()
+    gravados = descarregar()
+    if gravados:
+        logger.info("Analytics: %d registros pendentes gravados no shutdown.", gravados)
+
+
+# ── Gravação (thread de fundo) ───────────────────────────────────────────────
+
+
+def _iniciar_thread():
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_descarregador, name="analytics", daemon=True)
+            _thread.start()
+
+
+def _descarregador():
+    while not _parar.is_set():
+        _acordar.wait(INTERVALO_MS / 1000)
+        _acordar.clear()
+        descarregar()
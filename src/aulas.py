@@ -15,7 +15,9 @@ from telegram.ext import (
     ContextTypes,
 )
 
+from contexto_usuario import ContextoUsuario
 import db
+import db_async
 
 TZ = ZoneInfo("America/Sao_Paulo")
 
@@ -60,15 +62,25 @@ GRADE = GRADE_PADRAO
 _GRADE_VAZIA = {0: [], 1: [], 2: [], 3: [], 4: [], 5: []}
 
 
-def _load_grade(chat_id: int) -> dict:
-    """Carrega grade do banco. Converte chaves string→int. Fallback: grade vazia."""
-    grade_raw = db.get_grade(chat_id)
+def _grade_por_dia(grade_raw: dict | None) -> dict:
+    """Converte chaves string→int da grade salva. Fallback: grade vazia."""
     if not grade_raw:
         return _GRADE_VAZIA
     # Chaves JSON são strings ("0","1"…), converter para int
     return {int(k): v for k, v in grade_raw.items()}
 
 
+def _load_grade(chat_id: int) -> dict:
+    """Carrega grade do banco (bloqueante — fora do event loop, ex.: gemini)."""
+    return _grade_por_dia(db.get_grade(chat_id))
+
+
+async def _load_grade_async(chat_id: int, usuario: ContextoUsuario | None = None) -> dict:
+    """Versão async de _load_grade, para handlers (reusa o snapshot se já carregado)."""
+    usuario = usuario or await ContextoUsuario.carregar(chat_id)
+    return _grade_por_dia(usuario.grade)
+
+
 def _formatar_dia(dia: int, data: datetime | None = None, grade: dict | None = None) -> str:
     """Formata as aulas de um dia."""
     if grade is None:
@@ -143,8 +155,8 @@ def _menu_aula() -> InlineKeyboardMarkup:
 
 async def cmd_aula(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    db.log_evento(chat_id, "cmd_aula")
-    grade = _load_grade(chat_id)
+    await db_async.log_evento(chat_id, "cmd_aula")
+    grade = await _load_grade_async(chat_id)
     await update.message.reply_text(_aulas_hoje(grade), reply_markup=_menu_aula())
 
 
@@ -153,7 +165,7 @@ async def callback_aula(update: Update, context: ContextTypes.DEFAULT_TYPE) -> N
     await query.answer()
 
     chat_id = query.message.chat_id
-    grade = _load_grade(chat_id)
+    grade = await _load_grade_async(chat_id)
 
     opcao = query.data
     if opcao == "aula_hoje":
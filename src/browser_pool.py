@@ -0,0 +1,289 @@
+"""
+Pool de navegadores Chrome pré-aquecidos, compartilhado por comandos e jobs.
+
+Cada checkout entrega um Chrome sem cookies/storage de outro usuário; na
+devolução a sessão é limpa de novo. Instâncias são recicladas depois de N
+sessões ou quando o RSS da árvore de processos passa do limite. O tamanho
+do pool é o teto de Chromes simultâneos — é ele que segura o bot em 1 GB.
+"""
+
+import logging
+import os
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlsplit
+
+from selenium import webdriver
+from selenium.webdriver.chrome.options import Options
+
+from portal_http import PORTAL_URL
+
+logger = logging.getLogger(__name__)
+
+POOL_TAMANHO = int(os.getenv("CHROME_POOL_TAMANHO", "2"))
+POOL_AQUECIDOS = int(os.getenv("CHROME_POOL_AQUECIDOS", "1"))
+POOL_MAX_SESSOES = int(os.getenv("CHROME_POOL_MAX_SESSOES", "25"))
+POOL_MAX_RSS_MB = int(os.getenv("CHROME_POOL_MAX_RSS_MB", "400"))
+POOL_TIMEOUT_CHECKOUT = int(os.getenv("CHROME_POOL_TIMEOUT", "180"))
+
+# ── Perfil enxuto ────────────────────────────────────────────────────────────
+# O scraper só lê o DOM: imagens, fontes e CSS são bloqueados, a navegação
+# retorna no DOMContentLoaded e só resolvem os hosts da lista (o resto do
+# mundo vira NOTFOUND no DNS do Chrome).
+
+CHROME_ENXUTO = os.getenv("CHROME_ENXUTO", "1") == "1"
+HOSTS_PERMITIDOS = [
+    h.strip() for h in os.getenv("CHROME_HOSTS_PERMITIDOS", "").split(",") if h.strip()
+]
+
+URLS_BLOQUEADAS = [
+    "*.png", "*.jpg", "*.jpeg", "*.gif", "*.webp", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.css", "*.mp4", "*.webm",
+]
+
+
+def _hosts_permitidos() -> list[str]:
+    """Host do portal + CHROME_HOSTS_PERMITIDOS (scripts que o login precisa)."""
+    portal = urlsplit(PORTAL_URL).hostname
+    hosts = [portal]
+    if portal.startswith("www."):
+        hosts.append(portal[4:])
+    return hosts + [h for h in HOSTS_PERMITIDOS if h not in hosts]
+
+
+def opcoes_chrome(headless: bool = True, enxuto: bool = CHROME_ENXUTO) -> Options:
+    """Opções padrão do Chrome usadas pelo scraper (enxuto = perfil sem assets)."""
+    chrome_options = Options()
+    if headless:
+        chrome_options.add_argument('--headless')
+    chrome_options.add_argument('--no-sandbox')
+    chrome_options.add_argument('--disable-dev-shm-usage')
+    chrome_options.add_argument('--disable-gpu')
+    chrome_options.add_argument('--window-size=1920,1080')
+    if enxuto:
+        chrome_options.page_load_strategy = "eager"
+        chrome_options.add_argument('--blink-settings=imagesEnabled=false')
+        chrome_options.add_argument('--disable-remote-fonts')
+        chrome_options.add_argument('--disable-extensions')
+        chrome_options.add_argument('--disable-background-networking')
+        chrome_options.add_argument('--disable-component-update')
+        chrome_options.add_argument('--disable-default-apps')
+        chrome_options.add_argument('--disable-sync')
+        chrome_options.add_argument('--no-first-run')
+        excecoes = ", ".join(f"EXCLUDE {host}" for host in _hosts_permitidos())
+        chrome_options.add_argument(f'--host-resolver-rules=MAP * ~NOTFOUND, {excecoes}')
+        chrome_options.add_experimental_option("prefs", {
+            "profile.managed_default_content_settings.images": 2,
+        })
+    return chrome_options
+
+
+def _bloquear_assets(driver):
+    """Bloqueia por URL (via CDP) o que a flag de imagens não cobre: CSS, fontes, mídia."""
+    try:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": URLS_BLOQUEADAS})
+    except Exception as e:
+        logger.warning("Não foi possível bloquear assets via CDP: %s", e)
+
+
+def criar_driver(headless: bool = True, enxuto: bool = CHROME_ENXUTO) -> webdriver.Chrome:
+    """Sobe um Chrome novo com as opções padrão."""
+    driver = webdriver.Chrome(options=opcoes_chrome(headless, enxuto))
+    if enxuto:
+        _bloquear_assets(driver)
+    logger.info("Driver do Chrome configurado%s", " (perfil enxuto)" if enxuto else "")
+    return driver
+
+
+def _rss_arvore_mb(pid: int) -> float:
+    """Soma o RSS (MB) de um processo e de todos os descendentes via /proc.
+
+    Retorna 0.0 fora do Linux ou se o processo já morreu.
+    """
+    try:
+        filhos: dict[int, list[int]] = {}
+        for entrada in os.listdir("/proc"):
+            if not entrada.isdigit():
+                continue
+            try:
+                with open(f"/proc/{entrada}/stat") as f:
+                    # "pid (comm) estado ppid ..." — comm pode ter espaços
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            filhos.setdefault(ppid, []).append(int(entrada))
+
+        total_kb = 0
+        pendentes = [pid]
+        while pendentes:
+            atual = pendentes.pop()
+            pendentes.extend(filhos.get(atual, []))
+            try:
+                with open(f"/proc/{atual}/status") as f:
+                    for linha in f:
+                        if linha.startswith("VmRSS:"):
+                            total_kb += int(linha.split()[1])
+                            break
+            except OSError:
+                continue
+        return total_kb / 1024
+    except OSError:
+        return 0.0
+
+
+class InstanciaChrome:
+    """Chrome vivo dentro do pool + contadores de reciclagem."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.sessoes = 0
+        self.criado_em = time.monotonic()
+
+    def rss_mb(self) -> float:
+        try:
+            return _rss_arvore_mb(self.driver.service.process.pid)
+        except AttributeError:
+            return 0.0
+
+    def viva(self) -> bool:
+        try:
+            self.driver.current_url
+            return True
+        except Exception:
+            return False
+
+    def encerrar(self):
+        try:
+            self.driver.quit()
+        except Exception as e:
+            logger.warning("Erro ao fechar Chrome do pool: %s", e)
+
+
+class BrowserPool:
+    """Pool limitado de Chromes reutilizáveis (thread-safe)."""
+
+    def __init__(self, tamanho=POOL_TAMANHO, max_sessoes=POOL_MAX_SESSOES,
+                 max_rss_mb=POOL_MAX_RSS_MB, fabrica=criar_driver):
+        self.tamanho = tamanho
+        self.max_sessoes = max_sessoes
+        self.max_rss_mb = max_rss_mb
+        self._fabrica = fabrica
+        self._livres: queue.LifoQueue[InstanciaChrome] = queue.LifoQueue()
+        self._vagas = threading.BoundedSemaphore(tamanho)
+        self._origem = "{0.scheme}://{0.netloc}".format(urlsplit(PORTAL_URL))
+
+    def aquecer(self, quantidade: int = POOL_AQUECIDOS):
+        """Pré-inicia Chromes até `quantidade` instâncias livres (blocking)."""
+        quantidade = min(quantidade, self.tamanho)
+        while self._livres.qsize() < quantidade:
+            if not self._vagas.acquire(blocking=False):
+                break
+            try:
+                self._livres.put(InstanciaChrome(self._fabrica()))
+            except Exception as e:
+                logger.error("Pool: erro ao pré-iniciar Chrome: %s", e)
+                break
+            finally:
+                self._vagas.release()
+        logger.info("Pool: %d Chrome(s) aquecido(s)", self._livres.qsize())
+
+    def checkout(self, timeout: float = POOL_TIMEOUT_CHECKOUT) -> InstanciaChrome:
+        """Reserva um Chrome limpo. Bloqueia até `timeout` se o pool estiver cheio."""
+        if not self._vagas.acquire(timeout=timeout):
+            raise TimeoutError("Pool de Chrome esgotado")
+        try:
+            while True:
+                try:
+                    instancia = self._livres.get_nowait()
+                except queue.Empty:
+                    instancia = InstanciaChrome(self._fabrica())
+                    break
+                if instancia.viva() and self._limpar(instancia):
+                    break
+                instancia.encerrar()
+            return instancia
+        except Exception:
+            self._vagas.release()
+            raise
+
+    def devolver(self, instancia: InstanciaChrome, descartar: bool = False):
+        """Limpa e devolve um Chrome ao pool (ou recicla se gasto)."""
+        try:
+            instancia.sessoes += 1
+            motivo = None
+            if descartar:
+                motivo = "descartado pelo chamador"
+            elif instancia.sessoes >= self.max_sessoes:
+                motivo = f"{instancia.sessoes} sessões"
+            else:
+                rss = instancia.rss_mb()
+                if rss > self.max_rss_mb:
+                    motivo = f"RSS {rss:.0f} MB"
+            if motivo is None and not self._limpar(instancia):
+                motivo = "falha na limpeza"
+
+            if motivo:
+                logger.info("Pool: reciclando Chrome (%s)", motivo)
+                instancia.encerrar()
+            else:
+                self._livres.put(instancia)
+        finally:
+            self._vagas.release()
+
+    @contextmanager
+    def sessao(self):
+        """Context manager: `with pool.sessao() as driver: ...`"""
+        instancia = self.checkout()
+        try:
+            yield instancia.driver
+        except Exception:
+            self.devolver(instancia, descartar=True)
+            raise
+        else:
+            self.devolver(instancia)
+
+    def _limpar(self, instancia: InstanciaChrome) -> bool:
+        """Apaga cookies/storage e fecha janelas extras. False se o Chrome quebrou."""
+        driver = instancia.driver
+        try:
+            handles = driver.window_handles
+            for handle in handles[1:]:
+                driver.switch_to.window(handle)
+                driver.close()
+            driver.switch_to.window(handles[0])
+            driver.execute_cdp_cmd("Network.clearBrowserCookies", {})
+            driver.execute_cdp_cmd(
+                "Storage.clearDataForOrigin",
+                {"origin": self._origem, "storageTypes": "all"},
+            )
+            driver.get("about:blank")
+            return True
+        except Exception as e:
+            logger.warning("Pool: erro ao limpar Chrome: %s", e)
+            return False
+
+    def encerrar(self):
+        """Fecha todos os Chromes livres (shutdown do bot)."""
+        while True:
+            try:
+                self._livres.get_nowait().encerrar()
+            except queue.Empty:
+                break
+        logger.info("Pool de Chrome encerrado")
+
+
+_pool: BrowserPool | None = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> BrowserPool:
+    """Retorna o pool global (criado na primeira chamada)."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool()
+        return _pool
@@ -2,7 +2,6 @@
 Fluxo de onboarding — ConversationHandler para cadastro de novos usuários.
 """
 
-import asyncio
 import logging
 import re
 
@@ -16,8 +15,9 @@ from telegram.ext import (
     filters,
 )
 
-import db
-from fam_scraper import FAMScraper
+import agendador
+import db_async
+from portal_sync import ResultadoSync, sincronizar_agendado
 
 logger = logging.getLogger(__name__)
 
@@ -35,17 +35,17 @@ async def iniciar_cadastro(update: Update, context: ContextTypes.DEFAULT_TYPE) -
     """Entry point: /start para usuários NÃO cadastrados."""
     chat_id = update.effective_chat.id
     user_tg = update.effective_user
-    db.registrar_lead(chat_id, username=getattr(user_tg, 'username', None), primeiro_nome=getattr(user_tg, 'first_name', None))
-    db.log_evento(chat_id, "cmd_start")
+    await db_async.registrar_lead(chat_id, username=getattr(user_tg, 'username', None), primeiro_nome=getattr(user_tg, 'first_name', None))
+    await db_async.log_evento(chat_id, "cmd_start")
 
-    if db.is_registered(chat_id):
+    if await db_async.is_registered(chat_id):
         # Já cadastrado → mostra menu principal
         from onibus import menu_keyboard
-        user = db.get_user(chat_id)
+        user = await db_async.get_user(chat_id)
         nome = user["nome"] if user else ""
-        plano_info = db.get_plano(chat_id)
+        plano_info = await db_async.get_plano(chat_id)
         plano = (plano_info or {}).get("plano", "free")
-        if plano in ("pro", "trial") and not db.is_pro(chat_id):
+        if plano in ("pro", "trial") and not await db_async.is_pro(chat_id):
             plano_label = "Free (expirado)"
         else:
             plano_label = {"pro": "Pro", "trial": "Trial", "free": "Free"}.get(plano, "Free")
@@ -176,7 +176,7 @@ def _validar_endereco(texto: str) -> str | None:
 async def receber_nome(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     nome = update.message.text.strip()
     context.user_data["nome"] = nome
-    db.create_user(update.effective_chat.id, nome)
+    await db_async.create_user(update.effective_chat.id, nome)
 
     await update.message.reply_text(
         f"Beleza, *{nome}*! 🤙\n\n"
@@ -410,11 +410,7 @@ async def receber_termos(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
         )
         chat_id = update.effective_chat.id
         try:
-            import sqlite3
-            con = sqlite3.connect(db.DB_PATH)
-            con.execute("DELETE FROM usuarios WHERE chat_id = ? AND onboarding_completo = 0", (chat_id,))
-            con.commit()
-            con.close()
+            await db_async.apagar_cadastro_incompleto(chat_id, preservar_plano=False)
         except Exception:
             pass
         context.user_data.clear()
@@ -454,26 +450,17 @@ async def receber_termos(update: Update, context: ContextTypes.DEFAULT_TYPE) ->
     return CONFIRMA
 
 
-def _scrape_onboarding(fam_login: str, fam_senha: str, turno: str = "noturno"):
-    """Blocking: faz login + extrai grade, notas, info e histórico numa única sessão.
+async def _scrape_onboarding(fam_login: str, fam_senha: str, turno: str = "noturno", chat_id: int | None = None):
+    """Sincroniza grade, notas, info e histórico numa única sessão (agendador, prioridade de cadastro).
 
-    Retorna (login_ok, grade, notas, info, historico).
+    Retorna o ResultadoSync (dados já gravados no banco numa transação).
     login_ok=False indica credenciais incorretas (diferente de erro de rede/scrape).
+    Com chat_id, a sessão do portal fica salva para os próximos comandos.
     """
-    scraper = FAMScraper(fam_login, fam_senha, headless=True)
-    try:
-        if not scraper.fazer_login():
-            logger.error("Falha no login ao extrair dados (cadastro)")
-            return False, None, None, None, None
-        grade = scraper.extrair_grade(turno=turno)
-        notas, info = scraper.extrair_notas()
-        historico = scraper.extrair_historico()
-        return True, grade, notas, info, historico
-    except Exception as e:
-        logger.error("Erro ao extrair dados no cadastro: %s", e, exc_info=True)
-        return True, None, None, None, None  # login pode ter funcionado, erro no scrape
-    finally:
-        scraper.close()
+    return await sincronizar_agendado(
+        chat_id, {"grade", "notas", "info", "historico"}, fam_login, fam_senha,
+        prioridade=agendador.CADASTRO, turno=turno,
+    )
 
 
 async def confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
@@ -487,15 +474,7 @@ async def confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         )
         # Limpa registro parcial (mas preserva row se tem plano ativo)
         try:
-            import sqlite3
-            con = sqlite3.connect(db.DB_PATH)
-            con.execute(
-                "DELETE FROM usuarios WHERE chat_id = ? AND onboarding_completo = 0 "
-                "AND (plano IS NULL OR plano = 'free')",
-                (chat_id,),
-            )
-            con.commit()
-            con.close()
+            await db_async.apagar_cadastro_incompleto(chat_id)
         except Exception:
             pass
         context.user_data.clear()
@@ -508,7 +487,7 @@ async def confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     nome = d["nome"]
     turno = d.get("turno") or "noturno"
 
-    db.update_user(
+    await db_async.update_user(
         chat_id,
         endereco_casa=d["endereco_casa"],
         endereco_trabalho=d.get("endereco_trabalho"),
@@ -518,8 +497,8 @@ async def confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         turno=turno,
         onboarding_completo=1,
     )
-    db.set_credentials(chat_id, fam_login, fam_senha)
-    db.log_evento(chat_id, "onboarding_completo")
+    await db_async.set_credentials(chat_id, fam_login, fam_senha)
+    await db_async.log_evento(chat_id, "onboarding_completo")
 
     await update.message.reply_text(
         f"✅ Cadastro completo, *{nome}*!\n\n"
@@ -529,12 +508,19 @@ async def confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     )
 
     # Scrape de grade + notas + info + histórico numa única sessão
-    loop = asyncio.get_event_loop()
-    login_ok, grade, notas, info, historico = await loop.run_in_executor(
-        None, _scrape_onboarding, fam_login, fam_senha, turno
-    )
+    try:
+        sync = await _scrape_onboarding(fam_login, fam_senha, turno, chat_id)
+    except Exception as e:
+        # Erro no scrape (ou agendador encerrando) não pode travar a conversa,
+        # e não é culpa do login: segue como "não importado", sem acusar a senha
+        logger.error("Erro ao importar dados do portal no cadastro de %s: %s", chat_id, e, exc_info=True)
+        await update.message.reply_text(
+            "⚠️ Não deu pra importar seus dados do portal agora.\n"
+            "Seu cadastro foi salvo — use /notas ou /grade daqui a pouco pra tentar de novo.",
+        )
+        sync = ResultadoSync(login_ok=True)
 
-    if not login_ok:
+    if not sync.login_ok:
         await update.message.reply_text(
             "❌ *Não consegui fazer login no portal FAM.*\n\n"
             "Possíveis causas:\n"
@@ -547,7 +533,7 @@ async def confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         )
 
         trial_msg = ""
-        if db.ativar_trial(chat_id):
+        if await db_async.ativar_trial(chat_id):
             trial_msg = "\n🎁 Você ganhou 7 dias de Pro grátis!\n"
 
         await update.message.reply_text(
@@ -564,20 +550,18 @@ async def confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
     resultados = []
 
-    if grade and any(grade.get(str(d)) for d in range(6)):
-        db.set_grade(chat_id, grade)
+    if sync.ok("grade"):
         resultados.append("✅ Grade importada")
     else:
         resultados.append("⚠️ Grade não encontrada")
 
-    if notas:
-        db.set_notas(chat_id, notas)
-        resultados.append(f"✅ Notas importadas ({len(notas)} disciplinas)")
+    if sync.ok("notas"):
+        resultados.append(f"✅ Notas importadas ({len(sync.notas)} disciplinas)")
     else:
         resultados.append("⚠️ Notas não encontradas")
 
+    info = sync.info if sync.ok("info") else None
     if info:
-        db.set_info_aluno(chat_id, info)
         extras = []
         if info.get("curso"):
             extras.append(info["curso"])
@@ -588,9 +572,8 @@ async def confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
         if extras:
             resultados.append(f"✅ Info: {', '.join(extras)}")
 
-    if historico:
-        db.set_historico(chat_id, historico)
-        reprovados = [h for h in historico if "reprovado" in h.get("situacao", "").lower()]
+    if sync.ok("historico"):
+        reprovados = [h for h in sync.historico if "reprovado" in h.get("situacao", "").lower()]
         if reprovados:
             resultados.append(f"✅ Histórico importado ({len(reprovados)} DP{'s' if len(reprovados) > 1 else ''})")
         else:
@@ -600,7 +583,7 @@ async def confirmar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 
     # Ativa trial de 7 dias
     trial_msg = ""
-    if db.ativar_trial(chat_id):
+    if await db_async.ativar_trial(chat_id):
         trial_msg = "\n🎁 Você ganhou 7 dias de Pro grátis! Aproveite todas as funcionalidades.\n"
 
     await update.message.reply_text(
@@ -629,15 +612,7 @@ async def cancelar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
     chat_id = update.effective_chat.id
     # Limpa registro parcial (preserva row se tem plano ativo)
     try:
-        import sqlite3
-        con = sqlite3.connect(db.DB_PATH)
-        con.execute(
-            "DELETE FROM usuarios WHERE chat_id = ? AND onboarding_completo = 0 "
-            "AND (plano IS NULL OR plano = 'free')",
-            (chat_id,),
-        )
-        con.commit()
-        con.close()
+        await db_async.apagar_cadastro_incompleto(chat_id)
     except Exception:
         pass
 
@@ -655,13 +630,13 @@ async def cancelar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> int:
 async def cmd_config(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     """Mostra dados cadastrados e permite recadastrar."""
     chat_id = update.effective_chat.id
-    user = db.get_user(chat_id)
+    user = await db_async.get_user(chat_id)
 
     if not user:
         await update.message.reply_text("Você ainda não tem cadastro. Use /start para se cadastrar!")
         return
 
-    creds = db.get_credentials(chat_id)
+    creds = await db_async.get_credentials(chat_id)
     login = creds[0] if creds else "—"
 
     turno = (user.get("turno") or "noturno").capitalize()
@@ -691,13 +666,13 @@ async def cmd_resetar(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Non
     from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 
     chat_id = update.effective_chat.id
-    user = db.get_user(chat_id)
+    user = await db_async.get_user(chat_id)
 
     if not user:
         await update.message.reply_text("Você não tem cadastro. Use /start para começar!")
         return
 
-    plano_info = db.get_plano(chat_id)
+    plano_info = await db_async.get_plano(chat_id)
     plano = (plano_info or {}).get("plano", "free")
 
     aviso_plano = ""
@@ -735,21 +710,8 @@ async def callback_resetar(update: Update, context: ContextTypes.DEFAULT_TYPE) -
         return
 
     # resetar_confirmar — limpa cadastro mas preserva plano/pagamentos
-    import sqlite3
-    con = sqlite3.connect(db.DB_PATH)
-    con.execute(
-        """UPDATE usuarios SET
-            nome = '', endereco_casa = NULL, endereco_trabalho = NULL,
-            horario_entrada_trabalho = NULL, horario_saida_trabalho = NULL,
-            transporte = 'sou', turno = NULL,
-            fam_login = NULL, fam_senha = NULL,
-            grade = NULL, notas = NULL, info_aluno = NULL, historico = NULL,
-            onboarding_completo = 0
-        WHERE chat_id = ?""",
-        (chat_id,),
-    )
-    con.commit()
-    con.close()
+    await db_async.resetar_cadastro(chat_id)
+    await db_async.limpar_sessao_portal(chat_id)
 
     await query.edit_message_text(
         "🗑 Cadastro resetado. Seu plano foi mantido.\n"
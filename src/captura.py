@@ -0,0 +1,148 @@
+"""
+Capturas de debug (HTML e screenshots do portal), opcionais e fora do caminho quente.
+
+Modos (FAM_CAPTURA):
+  off     — nada é gravado (padrão)
+  on      — toda página/screenshot é capturada
+  amostra — só uma fração (FAM_CAPTURA_TAXA) é capturada
+
+Cada captura vira um arquivo gzip em logs/capturas/<chat_id>/<pagina>/ e cada
+pasta guarda só as FAM_CAPTURA_POR_PAGINA mais recentes (ring buffer). O total
+em disco é limitado por FAM_CAPTURA_MAX_MB, apagando as mais antigas. A
+compressão e a escrita rodam numa thread própria; se a fila encher, a captura
+é descartada em vez de segurar o scrape.
+"""
+
+import gzip
+import logging
+import os
+import queue
+import random
+import threading
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+MODO = os.getenv("FAM_CAPTURA", "off").lower()
+TAXA = float(os.getenv("FAM_CAPTURA_TAXA", "0.1"))
+POR_PAGINA = int(os.getenv("FAM_CAPTURA_POR_PAGINA", "5"))
+MAX_MB = float(os.getenv("FAM_CAPTURA_MAX_MB", "50"))
+MAX_ARQUIVO_KB = int(os.getenv("FAM_CAPTURA_MAX_ARQUIVO_KB", "4096"))
+
+DIRETORIO = os.path.join(os.path.dirname(__file__), "..", "logs", "capturas")
+
+_FILA_MAX = 32
+
+_fila: queue.Queue = queue.Queue(maxsize=_FILA_MAX)
+_thread: threading.Thread | None = None
+_lock = threading.Lock()
+
+
+def sortear() -> bool:
+    """True se a próxima captura deve ser gravada (modo + taxa de amostragem)."""
+    if MODO == "on":
+        return True
+    if MODO == "amostra":
+        return random.random() < TAXA
+    return False
+
+
+def registrar(chat_id: int | None, pagina: str, conteudo, extensao: str = "html") -> bool:
+    """Agenda a gravação de uma captura. Não bloqueia.
+
+    conteudo: str/bytes, ou um callable que os produz — só chamado se a captura
+    for sorteada (ex.: driver.get_screenshot_as_png, que custa um round-trip).
+    Retorna True se a captura entrou na fila.
+    """
+    if not sortear():
+        return False
+    try:
+        if callable(conteudo):
+            conteudo = conteudo()
+        if isinstance(conteudo, str):
+            conteudo = conteudo.encode("utf-8")
+    except Exception as e:
+        logger.warning("Captura de %s falhou: %s", pagina, e)
+        return False
+    if len(conteudo) > MAX_ARQUIVO_KB * 1024:
+        logger.info("Captura de %s descartada (%d KB > limite)", pagina, len(conteudo) // 1024)
+        return False
+
+    _iniciar_thread()
+    try:
+        _fila.put_nowait((chat_id, pagina, conteudo, extensao))
+        return True
+    except queue.Full:
+        logger.info("Fila de capturas cheia - descartando %s", pagina)
+        return False
+
+
+def encerrar(timeout: float = 5.0):
+    """Espera a fila esvaziar e para a thread de escrita (shutdown do bot)."""
+    global _thread
+    with _lock:
+        thread = _thread
+        _thread = None
+    if thread is None:
+        return
+    try:
+        _fila.put(None, timeout=timeout)
+    except queue.Full:
+        return
+    thread.join(timeout)
+
+
+# ── Escrita (thread de fundo) ────────────────────────────────────────────────
+
+
+def _iniciar_thread():
+    global _thread
+    with _lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_escritor, name="captura", daemon=True)
+            _thread.start()
+
+
+def _escritor():
+    while True:
+        item = _fila.get()
+        if item is None:
+            break
+        try:
+            _gravar(*item)
+        except Exception as e:
+            logger.warning("Erro ao gravar captura: %s", e)
+
+
+def _gravar(chat_id, pagina, conteudo: bytes, extensao: str):
+    pasta = os.path.join(DIRETORIO, str(chat_id or "anon"), pagina)
+    os.makedirs(pasta, exist_ok=True)
+    nome = datetime.now().strftime("%Y%m%d-%H%M%S-%f") + f".{extensao}.gz"
+    with gzip.open(os.path.join(pasta, nome), "wb", compresslevel=6) as f:
+        f.write(conteudo)
+    _podar_pasta(pasta)
+    _podar_total()
+
+
+def _podar_pasta(pasta: str):
+    """Mantém só as POR_PAGINA capturas mais recentes da pasta."""
+    arquivos = sorted(os.listdir(pasta))  # nome começa com timestamp
+    for nome in arquivos[:-POR_PAGINA] if POR_PAGINA > 0 else arquivos:
+        os.remove(os.path.join(pasta, nome))
+
+
+def _podar_total():
+    """Apaga as capturas mais antigas enquanto o total passar de MAX_MB."""
+    arquivos = []
+    for raiz, _, nomes in os.walk(DIRETORIO):
+        for nome in nomes:
+            caminho = os.path.join(raiz, nome)
+            st = os.stat(caminho)
+            arquivos.append((st.st_mtime, st.st_size, caminho))
+    total = sum(tamanho for _, tamanho, _ in arquivos)
+    limite = MAX_MB * 1024 * 1024
+    for _, tamanho, caminho in sorted(arquivos):
+        if total <= limite:
+            break
+        os.remove(caminho)
+        total -= tamanho
@@ -0,0 +1,76 @@
+"""
+Snapshot do usuário para um update do Telegram — a linha `usuarios` lida uma vez.
+
+Um handler carrega o contexto no começo e repassa adiante (gemini, famus,
+checagem de Pro), em vez de cada função reler a linha inteira do banco:
+
+    usuario = await ContextoUsuario.carregar(chat_id)
+    if not usuario.registrado:
+        ...
+    if usuario.is_pro:
+        ...usuario.notas...
+
+As colunas JSON (grade, notas, info_aluno, histórico) só são parseadas
+quando lidas. O snapshot não acompanha escritas feitas depois de carregado.
+"""
+
+from functools import cached_property
+
+import db
+import db_async
+
+
+class ContextoUsuario:
+    """Linha `usuarios` de um chat + campos derivados (plano, JSONs) sob demanda."""
+
+    def __init__(self, chat_id: int, user: dict | None):
+        self.chat_id = chat_id
+        self.user = user or {}
+
+    @classmethod
+    async def carregar(cls, chat_id: int) -> "ContextoUsuario":
+        """Lê a linha pelo db_async (handlers no event loop)."""
+        return cls(chat_id, await db_async.get_user(chat_id))
+
+    @classmethod
+    def carregar_bloqueante(cls, chat_id: int) -> "ContextoUsuario":
+        """Lê a linha direto do db (código que já roda fora do event loop)."""
+        return cls(chat_id, db.get_user(chat_id))
+
+    def get(self, campo: str, padrao=None):
+        return self.user.get(campo, padrao)
+
+    @property
+    def existe(self) -> bool:
+        return bool(self.user)
+
+    @property
+    def registrado(self) -> bool:
+        """Mesma regra de db.is_registered."""
+        return bool(self.user.get("onboarding_completo"))
+
+    @cached_property
+    def plano(self) -> dict | None:
+        """Mesmo formato de db.get_plano."""
+        return db.plano_da_linha(self.user) if self.user else None
+
+    @cached_property
+    def is_pro(self) -> bool:
+        """Mesma regra de db.is_pro."""
+        return db.pro_ativo(self.user)
+
+    @cached_property
+    def grade(self) -> dict | None:
+        return db.coluna_json(self.user, "grade")
+
+    @cached_property
+    def notas(self) -> list[dict] | None:
+        return db.coluna_json(self.user, "notas")
+
+    @cached_property
+    def info_aluno(self) -> dict | None:
+        return db.coluna_json(self.user, "info_aluno")
+
+    @cached_property
+    def historico(self) -> list[dict] | None:
+        return db.coluna_json(self.user, "historico")
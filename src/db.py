@@ -6,7 +6,11 @@ import json
 import logging
 import os
 import sqlite3
-from datetime import datetime, timedelta
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
 from zoneinfo import ZoneInfo
 
 from crypto import encrypt, decrypt
@@ -40,16 +44,149 @@ _PEDRO_GRADE = {
 }
 
 
-def _conn() -> sqlite3.Connection:
-    """Abre conexão com o banco."""
+# ── Conexões ─────────────────────────────────────────────────────────────────
+# Uma conexão persistente por thread (event loop, workers do agendador,
+# executor), em WAL: o job gravando não bloqueia leituras dos comandos.
+
+DB_BUSY_TIMEOUT_MS = int(os.getenv("FAM_DB_BUSY_TIMEOUT_MS", "5000"))
+DB_CACHE_KB = int(os.getenv("FAM_DB_CACHE_KB", "8192"))
+
+
+class _Conexao(sqlite3.Connection):
+    """sqlite3.Connection com suporte a weakref (registro para o shutdown)."""
+
+
+_local = threading.local()
+_conexoes: "weakref.WeakSet[_Conexao]" = weakref.WeakSet()
+_conexoes_lock = threading.Lock()
+_geracao = 0  # incrementada por fechar_conexoes: invalida as conexões das threads
+
+
+def _abrir() -> _Conexao:
     os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH)
+    if not os.path.exists(DB_PATH):
+        # WAL de um banco apagado seria reaplicado no banco novo
+        for sufixo in ("-wal", "-shm"):
+            if os.path.exists(DB_PATH + sufixo):
+                os.remove(DB_PATH + sufixo)
+    conn = sqlite3.connect(DB_PATH, timeout=DB_BUSY_TIMEOUT_MS / 1000,
+                           factory=_Conexao, check_same_thread=False)
     conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={DB_BUSY_TIMEOUT_MS}")
+    conn.execute(f"PRAGMA cache_size=-{DB_CACHE_KB}")
+    with _conexoes_lock:
+        _conexoes.add(conn)
+    return conn
+
+
+def _fechar(conn: sqlite3.Connection) -> None:
+    with _conexoes_lock:
+        _conexoes.discard(conn)
+    try:
+        conn.close()
+    except sqlite3.Error as e:
+        logger.warning("Erro ao fechar conexão SQLite: %s", e)
+
+
+def _conn() -> sqlite3.Connection:
+    """Conexão da thread atual (aberta na primeira chamada e reaproveitada).
+
+    Reabre se DB_PATH mudar ou o arquivo for recriado (testes, restore de
+    backup). Quem usa chama _liberar(con) no fim, nunca close().
+    """
+    try:
+        inode = os.stat(DB_PATH).st_ino
+    except FileNotFoundError:
+        inode = None
+    conn = getattr(_local, "conn", None)
+    if conn is not None and _local.chave == (DB_PATH, inode, _geracao):
+        return conn
+    if conn is not None:
+        _fechar(conn)
+    conn = _abrir()
+    _local.conn, _local.chave = conn, (DB_PATH, os.stat(DB_PATH).st_ino, _geracao)
     return conn
 
 
+def _liberar(con: sqlite3.Connection) -> None:
+    """Fim de uma operação: descarta transação não confirmada (erro no meio)."""
+    if con.in_transaction:
+        con.rollback()
+
+
+def fechar_conexoes() -> None:
+    """Fecha as conexões de todas as threads (shutdown). A próxima chamada reabre."""
+    global _geracao
+    with _conexoes_lock:
+        _geracao += 1
+        conexoes = list(_conexoes)
+    for conn in conexoes:
+        _fechar(conn)
+    _local.__dict__.clear()
+    limpar_cache_usuarios()
+    logger.info("Banco: %d conexão(ões) fechadas.", len(conexoes))
+
+
+# ── Cache de usuários ────────────────────────────────────────────────────────
+# get_user é a consulta mais quente (todo comando, todo botão) e a linha muda
+# pouco: LRU com TTL, invalidado por toda escrita em `usuarios` feita aqui.
+
+CACHE_USUARIOS_MAX = int(os.getenv("FAM_DB_CACHE_USUARIOS", "512"))
+CACHE_USUARIOS_TTL_S = float(os.getenv("FAM_DB_CACHE_USUARIOS_TTL_S", "300"))
+
+_cache_usuarios: "OrderedDict[tuple[str, int], tuple[float, dict | None]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0}
+# Muda a cada invalidação: leitura que começou antes de uma escrita não
+# guarda a linha velha no cache
+_cache_versao = 0
+
+
+def _guardar_usuario(chave: tuple[str, int], user: dict | None, versao: int) -> None:
+    if CACHE_USUARIOS_MAX <= 0:
+        return
+    with _cache_lock:
+        if versao != _cache_versao:
+            return
+        _cache_usuarios[chave] = (time.monotonic(), user)
+        _cache_usuarios.move_to_end(chave)
+        while len(_cache_usuarios) > CACHE_USUARIOS_MAX:
+            _cache_usuarios.popitem(last=False)
+
+
+def _invalidar_usuario(chat_id: int) -> None:
+    global _cache_versao
+    with _cache_lock:
+        _cache_versao += 1
+        _cache_usuarios.pop((DB_PATH, chat_id), None)
+
+
+def limpar_cache_usuarios() -> None:
+    """Esvazia o cache de usuários (banco recriado, shutdown)."""
+    global _cache_versao
+    with _cache_lock:
+        _cache_versao += 1
+        _cache_usuarios.clear()
+
+
+def estatisticas_cache_usuarios() -> dict:
+    """{hits, misses, taxa_acerto, tamanho, max, ttl_s} do cache de get_user."""
+    with _cache_lock:
+        total = _cache_stats["hits"] + _cache_stats["misses"]
+        return {
+            **_cache_stats,
+            "taxa_acerto": round(_cache_stats["hits"] / total, 3) if total else 0.0,
+            "tamanho": len(_cache_usuarios),
+            "max": CACHE_USUARIOS_MAX,
+            "ttl_s": CACHE_USUARIOS_TTL_S,
+        }
+
+
 def init_db() -> None:
     """Cria tabelas se não existirem + seed do Pedro."""
+    limpar_cache_usuarios()
     con = _conn()
     try:
         con.execute("""
@@ -107,6 +244,14 @@ def init_db() -> None:
             con.execute("ALTER TABLE usuarios ADD COLUMN transporte TEXT DEFAULT 'sou'")
             con.commit()
             logger.info("Coluna 'transporte' adicionada à tabela usuarios.")
+        if "impressoes_paginas" not in cols:
+            con.execute("ALTER TABLE usuarios ADD COLUMN impressoes_paginas TEXT")
+            con.commit()
+            logger.info("Coluna 'impressoes_paginas' adicionada à tabela usuarios.")
+        if "proxima_verificacao" not in cols:
+            con.execute("ALTER TABLE usuarios ADD COLUMN proxima_verificacao TEXT")
+            con.commit()
+            logger.info("Coluna 'proxima_verificacao' adicionada à tabela usuarios.")
 
         # Tabela de pagamentos
         con.execute("""
@@ -168,6 +313,29 @@ def init_db() -> None:
         """)
         con.commit()
 
+        # Sessões do portal FAM (cookies encriptados, reaproveitados entre comandos)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS sessoes_portal (
+                chat_id     INTEGER PRIMARY KEY,
+                cookies     TEXT NOT NULL,
+                expira_em   TEXT NOT NULL
+            )
+        """)
+        con.commit()
+
+        # Mudanças de notas/faltas vistas pelo job (alimenta a política de verificação)
+        con.execute("""
+            CREATE TABLE IF NOT EXISTS mudancas_notas (
+                id          INTEGER PRIMARY KEY AUTOINCREMENT,
+                chat_id     INTEGER NOT NULL,
+                disciplina  TEXT NOT NULL,
+                tipo        TEXT NOT NULL,
+                criado_em   TEXT DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        con.execute("CREATE INDEX IF NOT EXISTS idx_mudancas_chat ON mudancas_notas (chat_id, criado_em)")
+        con.commit()
+
         # Seed: migra Pedro se TELEGRAM_CHAT_ID existe e banco está vazio
         chat_id_str = os.getenv("TELEGRAM_CHAT_ID", "")
         if chat_id_str:
@@ -200,20 +368,33 @@ def init_db() -> None:
                 con.commit()
                 logger.info("Seed: usuário Pedro (chat_id=%d) migrado para o banco.", chat_id)
     finally:
-        con.close()
+        _liberar(con)
 
 
 # ── CRUD ─────────────────────────────────────────────────────────────────────
 
 
 def get_user(chat_id: int) -> dict | None:
-    """Retorna dict com dados do usuário ou None."""
+    """Retorna dict com dados do usuário ou None (do cache, se recente)."""
+    chave = (DB_PATH, chat_id)
+    with _cache_lock:
+        item = _cache_usuarios.get(chave)
+        if item and time.monotonic() - item[0] < CACHE_USUARIOS_TTL_S:
+            _cache_usuarios.move_to_end(chave)
+            _cache_stats["hits"] += 1
+            return dict(item[1]) if item[1] is not None else None
+        _cache_stats["misses"] += 1
+        versao = _cache_versao
+
     con = _conn()
     try:
         row = con.execute("SELECT * FROM usuarios WHERE chat_id = ?", (chat_id,)).fetchone()
-        return dict(row) if row else None
+        user = dict(row) if row else None
     finally:
-        con.close()
+        _liberar(con)
+    _guardar_usuario(chave, user, versao)
+    # Cópia: quem recebe pode alterar o dict sem sujar o cache
+    return dict(user) if user is not None else None
 
 
 def create_user(chat_id: int, nome: str) -> None:
@@ -227,7 +408,8 @@ def create_user(chat_id: int, nome: str) -> None:
         )
         con.commit()
     finally:
-        con.close()
+        _liberar(con)
+        _invalidar_usuario(chat_id)
 
 
 def update_user(chat_id: int, **fields) -> None:
@@ -241,12 +423,60 @@ def update_user(chat_id: int, **fields) -> None:
         con.execute(f"UPDATE usuarios SET {cols} WHERE chat_id = ?", vals)
         con.commit()
     finally:
-        con.close()
+        _liberar(con)
+        _invalidar_usuario(chat_id)
+
+
+def apagar_cadastro_incompleto(chat_id: int, preservar_plano: bool = True) -> None:
+    """Remove o registro parcial de um cadastro abandonado.
+
+    preservar_plano: mantém a linha se o usuário tem plano pago/trial.
+    """
+    filtro = " AND (plano IS NULL OR plano = 'free')" if preservar_plano else ""
+    con = _conn()
+    try:
+        con.execute(f"DELETE FROM usuarios WHERE chat_id = ? AND onboarding_completo = 0{filtro}", (chat_id,))
+        con.commit()
+    finally:
+        _liberar(con)
+        _invalidar_usuario(chat_id)
+
+
+def resetar_cadastro(chat_id: int) -> None:
+    """Limpa dados do cadastro (/resetar), preservando plano e pagamentos."""
+    con = _conn()
+    try:
+        con.execute(
+            """UPDATE usuarios SET
+                nome = '', endereco_casa = NULL, endereco_trabalho = NULL,
+                horario_entrada_trabalho = NULL, horario_saida_trabalho = NULL,
+                transporte = 'sou', turno = NULL,
+                fam_login = NULL, fam_senha = NULL,
+                grade = NULL, notas = NULL, info_aluno = NULL, historico = NULL,
+                impressoes_paginas = NULL, onboarding_completo = 0
+            WHERE chat_id = ?""",
+            (chat_id,),
+        )
+        con.commit()
+    finally:
+        _liberar(con)
+        _invalidar_usuario(chat_id)
+
+
+def coluna_json(user: dict | None, coluna: str):
+    """Deserializa uma coluna JSON da linha `usuarios` já carregada (None se vazia/inválida)."""
+    if not user or not user.get(coluna):
+        return None
+    try:
+        return json.loads(user[coluna])
+    except json.JSONDecodeError:
+        return None
 
 
 def set_credentials(chat_id: int, login: str, senha: str) -> None:
     """Encripta e salva credenciais do portal FAM."""
     update_user(chat_id, fam_login=encrypt(login), fam_senha=encrypt(senha))
+    limpar_sessao_portal(chat_id)
 
 
 def get_credentials(chat_id: int) -> tuple[str, str] | None:
@@ -264,13 +494,7 @@ def set_grade(chat_id: int, grade_dict: dict) -> None:
 
 def get_grade(chat_id: int) -> dict | None:
     """Retorna grade deserializada ou None."""
-    user = get_user(chat_id)
-    if not user or not user["grade"]:
-        return None
-    try:
-        return json.loads(user["grade"])
-    except json.JSONDecodeError:
-        return None
+    return coluna_json(get_user(chat_id), "grade")
 
 
 def set_notas(chat_id: int, notas_list: list[dict]) -> None:
@@ -280,13 +504,7 @@ def set_notas(chat_id: int, notas_list: list[dict]) -> None:
 
 def get_notas(chat_id: int) -> list[dict] | None:
     """Retorna notas deserializadas ou None."""
-    user = get_user(chat_id)
-    if not user or not user["notas"]:
-        return None
-    try:
-        return json.loads(user["notas"])
-    except json.JSONDecodeError:
-        return None
+    return coluna_json(get_user(chat_id), "notas")
 
 
 def set_info_aluno(chat_id: int, info: dict) -> None:
@@ -296,13 +514,7 @@ def set_info_aluno(chat_id: int, info: dict) -> None:
 
 def get_info_aluno(chat_id: int) -> dict | None:
     """Retorna info do aluno deserializada ou None."""
-    user = get_user(chat_id)
-    if not user or not user.get("info_aluno"):
-        return None
-    try:
-        return json.loads(user["info_aluno"])
-    except json.JSONDecodeError:
-        return None
+    return coluna_json(get_user(chat_id), "info_aluno")
 
 
 def set_historico(chat_id: int, historico_list: list[dict]) -> None:
@@ -312,20 +524,79 @@ def set_historico(chat_id: int, historico_list: list[dict]) -> None:
 
 def get_historico(chat_id: int) -> list[dict] | None:
     """Retorna histórico deserializado ou None."""
+    return coluna_json(get_user(chat_id), "historico")
+
+
+def get_impressoes(chat_id: int) -> dict:
+    """Retorna {pagina: hash} das últimas páginas do portal processadas."""
     user = get_user(chat_id)
-    if not user or not user.get("historico"):
-        return None
+    if not user or not user.get("impressoes_paginas"):
+        return {}
     try:
-        return json.loads(user["historico"])
+        return json.loads(user["impressoes_paginas"])
     except json.JSONDecodeError:
-        return None
+        return {}
+
+
+def set_impressao(chat_id: int, pagina: str, impressao: str | None) -> None:
+    """Salva (ou remove, se None) o hash da página junto do cache correspondente."""
+    impressoes = get_impressoes(chat_id)
+    if impressao:
+        impressoes[pagina] = impressao
+    else:
+        impressoes.pop(pagina, None)
+    update_user(chat_id, impressoes_paginas=json.dumps(impressoes))
+
+
+def salvar_dados_portal(
+    chat_id: int,
+    grade: dict | None = None,
+    notas: list[dict] | None = None,
+    info: dict | None = None,
+    historico: list[dict] | None = None,
+    impressoes: dict | None = None,
+) -> None:
+    """Salva numa única transação o que veio de uma sincronização com o portal.
+
+    Campos None ficam como estão; `impressoes` é mesclado às já salvas.
+    Ou grava tudo, ou nada (cache e hash nunca ficam dessincronizados).
+    """
+    campos = {}
+    if grade is not None:
+        campos["grade"] = json.dumps(grade, ensure_ascii=False)
+    if notas is not None:
+        campos["notas"] = json.dumps(notas, ensure_ascii=False)
+    if info is not None:
+        campos["info_aluno"] = json.dumps(info, ensure_ascii=False)
+    if historico is not None:
+        campos["historico"] = json.dumps(historico, ensure_ascii=False)
+
+    con = _conn()
+    try:
+        with con:
+            if impressoes:
+                row = con.execute(
+                    "SELECT impressoes_paginas FROM usuarios WHERE chat_id = ?", (chat_id,)
+                ).fetchone()
+                try:
+                    atuais = json.loads(row["impressoes_paginas"]) if row and row["impressoes_paginas"] else {}
+                except json.JSONDecodeError:
+                    atuais = {}
+                atuais.update(impressoes)
+                campos["impressoes_paginas"] = json.dumps(atuais)
+            if campos:
+                cols = ", ".join(f"{k} = ?" for k in campos)
+                con.execute(f"UPDATE usuarios SET {cols} WHERE chat_id = ?", [*campos.values(), chat_id])
+    finally:
+        _liberar(con)
+        _invalidar_usuario(chat_id)
 
 
 def get_all_registered_users() -> list[dict]:
     """Retorna lista de dicts de todos os usuários com onboarding completo.
 
-    Usado pelo job periódico (job_verificar_atualizacoes) para iterar
-    sobre todos os usuários e checar notas/faltas novas.
+    Carrega as linhas inteiras (JSONs de grade/notas/histórico); o job
+    periódico usa iter_verificacoes_vencidas, que lê só o necessário.
     """
     con = _conn()
     try:
@@ -334,7 +605,58 @@ def get_all_registered_users() -> list[dict]:
         ).fetchall()
         return [dict(r) for r in rows]
     finally:
-        con.close()
+        _liberar(con)
+
+
+# Plano Pro/Trial ativo avaliado no SQLite (mesma regra de is_pro): sem
+# expiração vale para sempre; expiração sem fuso é horário local (TZ);
+# data inválida conta como expirada (datetime() devolve NULL).
+_SQL_PRO_ATIVO = (
+    "plano IN ('pro', 'trial') AND (COALESCE(plano_expira, '') = '' OR datetime(plano_expira, "
+    "CASE WHEN plano_expira GLOB '*[+-][0-9][0-9]:[0-9][0-9]' OR plano_expira GLOB '*Z' "
+    "THEN '+0 seconds' ELSE ? END) > datetime(?))"
+)
+
+
+def _params_pro_ativo(agora: datetime) -> tuple[str, str]:
+    """(ajuste de horário local → UTC, agora em UTC) para _SQL_PRO_ATIVO."""
+    agora = agora.astimezone(TZ)
+    ajuste = f"{-int(agora.utcoffset().total_seconds())} seconds"
+    return ajuste, agora.astimezone(timezone.utc).strftime("%Y-%m-%d %H:%M:%S")
+
+
+def iter_verificacoes_vencidas(agora: datetime, limite: int, apenas_pro: bool = False):
+    """Usuários cadastrados com verificação periódica vencida (ou nunca agendada).
+
+    Gera {"chat_id", "proxima_verificacao"} direto do cursor, os mais
+    atrasados primeiro (nunca agendados antes de todos). apenas_pro filtra
+    no próprio SQL quem tem Pro/Trial ativo em `agora`.
+    """
+    filtro, params = "", ()
+    if apenas_pro:
+        filtro, params = f"AND {_SQL_PRO_ATIVO} ", _params_pro_ativo(agora)
+    con = _conn()
+    try:
+        cursor = con.execute(
+            "SELECT chat_id, proxima_verificacao FROM usuarios "
+            "WHERE onboarding_completo = 1 "
+            "AND (proxima_verificacao IS NULL OR proxima_verificacao <= ?) "
+            f"{filtro}"
+            "ORDER BY proxima_verificacao IS NOT NULL, proxima_verificacao LIMIT ?",
+            (agora.astimezone(TZ).isoformat(), *params, limite),
+        )
+        try:
+            for row in cursor:
+                yield dict(row)
+        finally:
+            cursor.close()
+    finally:
+        _liberar(con)
+
+
+def set_proxima_verificacao(chat_id: int, quando: datetime) -> None:
+    """Agenda a próxima verificação periódica do usuário."""
+    update_user(chat_id, proxima_verificacao=quando.astimezone(TZ).isoformat())
 
 
 def is_registered(chat_id: int) -> bool:
@@ -343,6 +665,87 @@ def is_registered(chat_id: int) -> bool:
     return user is not None and bool(user["onboarding_completo"])
 
 
+# ── Sessão do portal FAM ────────────────────────────────────────────────────
+
+
+def set_sessao_portal(chat_id: int, cookies: list[dict], ttl_min: int) -> None:
+    """Encripta e salva os cookies da sessão do portal com validade de ttl_min."""
+    expira = (datetime.now(TZ) + timedelta(minutes=ttl_min)).isoformat()
+    token = encrypt(json.dumps(cookies))
+    con = _conn()
+    try:
+        con.execute(
+            "INSERT INTO sessoes_portal (chat_id, cookies, expira_em) VALUES (?, ?, ?) "
+            "ON CONFLICT(chat_id) DO UPDATE SET cookies = excluded.cookies, expira_em = excluded.expira_em",
+            (chat_id, token, expira),
+        )
+        con.commit()
+    finally:
+        _liberar(con)
+
+
+def get_sessao_portal(chat_id: int) -> list[dict] | None:
+    """Retorna cookies decriptados da sessão do portal, ou None se ausente/expirada."""
+    con = _conn()
+    try:
+        row = con.execute(
+            "SELECT cookies, expira_em FROM sessoes_portal WHERE chat_id = ?", (chat_id,)
+        ).fetchone()
+    finally:
+        _liberar(con)
+    if not row:
+        return None
+    try:
+        if datetime.now(TZ) >= datetime.fromisoformat(row["expira_em"]):
+            limpar_sessao_portal(chat_id)
+            return None
+        return json.loads(decrypt(row["cookies"]))
+    except Exception as e:
+        logger.warning("Sessão do portal inválida para chat_id=%d: %s", chat_id, e)
+        limpar_sessao_portal(chat_id)
+        return None
+
+
+def limpar_sessao_portal(chat_id: int) -> None:
+    """Descarta a sessão do portal salva (expirada, credenciais novas ou reset)."""
+    con = _conn()
+    try:
+        con.execute("DELETE FROM sessoes_portal WHERE chat_id = ?", (chat_id,))
+        con.commit()
+    finally:
+        _liberar(con)
+
+
+# ── Histórico de mudanças de notas/faltas ──────────────────────────────────
+
+
+def registrar_mudancas(chat_id: int, notas: list[str], faltas: list[str]) -> None:
+    """Grava as disciplinas cujas notas/faltas mudaram numa verificação."""
+    linhas = [(chat_id, d, "nota") for d in notas] + [(chat_id, d, "falta") for d in faltas]
+    if not linhas:
+        return
+    con = _conn()
+    try:
+        con.executemany("INSERT INTO mudancas_notas (chat_id, disciplina, tipo) VALUES (?, ?, ?)", linhas)
+        con.commit()
+    finally:
+        _liberar(con)
+
+
+def get_mudancas(chat_id: int, dias: int) -> list[dict]:
+    """Mudanças dos últimos `dias` dias: [{"disciplina", "tipo", "criado_em"}] (UTC)."""
+    con = _conn()
+    try:
+        rows = con.execute(
+            "SELECT disciplina, tipo, criado_em FROM mudancas_notas "
+            "WHERE chat_id = ? AND criado_em >= datetime('now', ?) ORDER BY criado_em",
+            (chat_id, f"-{int(dias)} days"),
+        ).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        _liberar(con)
+
+
 # ── Eventos / Analytics ─────────────────────────────────────────────────────
 
 
@@ -358,7 +761,7 @@ def log_evento(chat_id: int, tipo: str) -> None:
     except Exception as e:
         logger.warning("Erro ao logar evento: %s", e)
     finally:
-        con.close()
+        _liberar(con)
 
 
 def ultimo_evento(chat_id: int, tipo: str) -> str | None:
@@ -371,7 +774,7 @@ def ultimo_evento(chat_id: int, tipo: str) -> str | None:
         ).fetchone()
         return row[0] if row else None
     finally:
-        con.close()
+        _liberar(con)
 
 
 def registrar_lead(chat_id: int, username: str | None = None, primeiro_nome: str | None = None) -> None:
@@ -391,7 +794,32 @@ def registrar_lead(chat_id: int, username: str | None = None, primeiro_nome: str
     except Exception as e:
         logger.warning("Erro ao registrar lead: %s", e)
     finally:
-        con.close()
+        _liberar(con)
+
+
+def gravar_analytics(eventos: list[tuple[int, str, str]],
+                     leads: list[tuple[int, str | None, str | None, str]]) -> None:
+    """Grava um lote do buffer de analytics numa transação só.
+
+    eventos: (chat_id, tipo, timestamp); leads: (chat_id, username, primeiro_nome,
+    timestamp do último contato), um por chat_id. Timestamps em UTC no formato
+    de CURRENT_TIMESTAMP, para ficarem iguais aos gravados direto.
+    """
+    con = _conn()
+    try:
+        with con:
+            con.executemany("INSERT INTO eventos (chat_id, tipo, timestamp) VALUES (?, ?, ?)", eventos)
+            con.executemany(
+                """INSERT INTO leads (chat_id, username, primeiro_nome, primeiro_contato, ultimo_contato)
+                   VALUES (?, ?, ?, ?, ?)
+                   ON CONFLICT(chat_id) DO UPDATE SET
+                       ultimo_contato = excluded.ultimo_contato,
+                       username = COALESCE(excluded.username, leads.username),
+                       primeiro_nome = COALESCE(excluded.primeiro_nome, leads.primeiro_nome)""",
+                [(chat_id, username, nome, quando, quando) for chat_id, username, nome, quando in leads],
+            )
+    finally:
+        _liberar(con)
 
 
 # ── Plano / Pagamentos ─────────────────────────────────────────────────────
@@ -402,11 +830,8 @@ def set_plano(chat_id: int, plano: str, expira: str | None) -> None:
     update_user(chat_id, plano=plano, plano_expira=expira)
 
 
-def get_plano(chat_id: int) -> dict | None:
-    """Retorna {plano, plano_expira, trial_usado} ou None."""
-    user = get_user(chat_id)
-    if not user:
-        return None
+def plano_da_linha(user: dict) -> dict:
+    """{plano, plano_expira, trial_usado} de uma linha `usuarios` já carregada."""
     return {
         "plano": user.get("plano") or "free",
         "plano_expira": user.get("plano_expira"),
@@ -414,11 +839,19 @@ def get_plano(chat_id: int) -> dict | None:
     }
 
 
-def is_pro(chat_id: int) -> bool:
-    """Checa se o usuário tem plano Pro ou Trial ativo (não expirado)."""
-    info = get_plano(chat_id)
-    if not info:
+def get_plano(chat_id: int) -> dict | None:
+    """Retorna {plano, plano_expira, trial_usado} ou None."""
+    user = get_user(chat_id)
+    if not user:
+        return None
+    return plano_da_linha(user)
+
+
+def pro_ativo(user: dict | None) -> bool:
+    """Pro ou Trial ativo (não expirado) numa linha `usuarios` já carregada."""
+    if not user:
         return False
+    info = plano_da_linha(user)
     plano = info["plano"]
     if plano not in ("pro", "trial"):
         return False
@@ -434,6 +867,11 @@ def is_pro(chat_id: int) -> bool:
         return False
 
 
+def is_pro(chat_id: int) -> bool:
+    """Checa se o usuário tem plano Pro ou Trial ativo (não expirado)."""
+    return pro_ativo(get_user(chat_id))
+
+
 def ativar_trial(chat_id: int) -> bool:
     """Ativa trial de 7 dias se ainda não usado. Retorna True se ativou."""
     info = get_plano(chat_id)
@@ -449,7 +887,8 @@ def ativar_trial(chat_id: int) -> bool:
         con.commit()
         return True
     finally:
-        con.close()
+        _liberar(con)
+        _invalidar_usuario(chat_id)
 
 
 def criar_pagamento(chat_id: int, tipo: str, mp_id: str, valor: float) -> None:
@@ -462,7 +901,7 @@ def criar_pagamento(chat_id: int, tipo: str, mp_id: str, valor: float) -> None:
         )
         con.commit()
     finally:
-        con.close()
+        _liberar(con)
 
 
 def atualizar_pagamento(mp_id: str, status: str) -> None:
@@ -476,7 +915,7 @@ def atualizar_pagamento(mp_id: str, status: str) -> None:
         )
         con.commit()
     finally:
-        con.close()
+        _liberar(con)
 
 
 def get_pagamento_pendente(chat_id: int) -> dict | None:
@@ -489,7 +928,19 @@ def get_pagamento_pendente(chat_id: int) -> dict | None:
         ).fetchone()
         return dict(row) if row else None
     finally:
-        con.close()
+        _liberar(con)
+
+
+def get_assinaturas_pendentes() -> list[dict]:
+    """Retorna assinaturas (recorrentes) ainda pendentes no Mercado Pago."""
+    con = _conn()
+    try:
+        rows = con.execute(
+            "SELECT * FROM pagamentos WHERE tipo = 'subscription' AND status = 'pending'"
+        ).fetchall()
+        return [dict(r) for r in rows]
+    finally:
+        _liberar(con)
 
 
 def get_usuarios_pro_expirados() -> list[dict]:
@@ -503,7 +954,7 @@ def get_usuarios_pro_expirados() -> list[dict]:
         ).fetchall()
         return [dict(r) for r in rows]
     finally:
-        con.close()
+        _liberar(con)
 
 
 def get_pagamento_por_chat(chat_id: int, tipo: str) -> dict | None:
@@ -516,7 +967,7 @@ def get_pagamento_por_chat(chat_id: int, tipo: str) -> dict | None:
         ).fetchone()
         return dict(row) if row else None
     finally:
-        con.close()
+        _liberar(con)
 
 
 # ── Sugestões / Suporte ────────────────────────────────────────────────────
@@ -528,7 +979,7 @@ def salvar_sugestao(chat_id: int, texto: str) -> None:
         con.execute("INSERT INTO sugestoes (chat_id, texto) VALUES (?, ?)", (chat_id, texto))
         con.commit()
     finally:
-        con.close()
+        _liberar(con)
 
 
 def salvar_suporte(chat_id: int, texto: str) -> None:
@@ -537,7 +988,7 @@ def salvar_suporte(chat_id: int, texto: str) -> None:
         con.execute("INSERT INTO suporte (chat_id, texto) VALUES (?, ?)", (chat_id, texto))
         con.commit()
     finally:
-        con.close()
+        _liberar(con)
 
 
 def get_stats() -> dict:
@@ -590,4 +1041,4 @@ def get_stats() -> dict:
 
         return stats
     finally:
-        con.close()
+        _liberar(con)
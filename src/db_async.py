@@ -0,0 +1,146 @@
+"""
+Fachada async do db.py para handlers e jobs (event loop nunca espera o SQLite).
+
+Mesmos nomes e argumentos das funções de db.py, em versão `await`:
+
+    if not await db_async.is_registered(chat_id):
+        ...
+    await db_async.log_evento(chat_id, "cmd_notas")
+
+Escritas vão para uma única thread escritora (fila do executor, em ordem de
+chegada — sem disputa de lock entre escritores); leituras rodam num pool de
+FAM_DB_LEITORES threads, em paralelo graças ao WAL. Cada thread usa a sua
+conexão persistente de db._conn(). Código que já roda fora do event loop
+(scrapes no agendador, chamadas de IA no executor) continua usando db direto.
+Eventos e leads não passam pela thread escritora: entram no buffer do
+analytics, gravado em lote.
+"""
+
+import asyncio
+import functools
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import analytics
+import db
+
+logger = logging.getLogger(__name__)
+
+LEITORES = int(os.getenv("FAM_DB_LEITORES", "4"))
+
+_escrita = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-escrita")
+_leitura = ThreadPoolExecutor(max_workers=max(1, LEITORES), thread_name_prefix="db-leitura")
+
+
+def _em(executor: ThreadPoolExecutor, funcao):
+    """Versão async de `funcao`, executada em `executor`."""
+    nome = funcao.__name__
+
+    @functools.wraps(funcao)
+    async def chamar(*args, **kwargs):
+        # Busca em db a cada chamada: patch de db.<nome> (testes) vale aqui também
+        alvo = getattr(db, nome)
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(alvo, *args, **kwargs))
+
+    return chamar
+
+
+def _ler(funcao):
+    return _em(_leitura, funcao)
+
+
+def _escrever(funcao):
+    return _em(_escrita, funcao)
+
+
+# ── CRUD ─────────────────────────────────────────────────────────────────────
+
+get_user = _ler(db.get_user)
+is_registered = _ler(db.is_registered)
+get_credentials = _ler(db.get_credentials)
+get_grade = _ler(db.get_grade)
+get_notas = _ler(db.get_notas)
+get_info_aluno = _ler(db.get_info_aluno)
+get_historico = _ler(db.get_historico)
+get_mudancas = _ler(db.get_mudancas)
+
+create_user = _escrever(db.create_user)
+update_user = _escrever(db.update_user)
+set_credentials = _escrever(db.set_credentials)
+apagar_cadastro_incompleto = _escrever(db.apagar_cadastro_incompleto)
+resetar_cadastro = _escrever(db.resetar_cadastro)
+limpar_sessao_portal = _escrever(db.limpar_sessao_portal)
+set_proxima_verificacao = _escrever(db.set_proxima_verificacao)
+registrar_mudancas = _escrever(db.registrar_mudancas)
+
+
+async def iter_verificacoes_vencidas(agora, limite: int, apenas_pro: bool = False):
+    """Versão async de db.iter_verificacoes_vencidas (lida de uma vez no pool, até `limite`)."""
+    loop = asyncio.get_running_loop()
+    # O gerador do db não atravessa threads (conexão por thread), então a lista
+    # é montada no pool. Cabe em memória: o chamador passa o teto do tick
+    # (JOB_MAX_POR_TICK), e cada linha é só chat_id + proxima_verificacao.
+    vencidos = await loop.run_in_executor(
+        _leitura, lambda: list(db.iter_verificacoes_vencidas(agora, limite, apenas_pro))
+    )
+    for user in vencidos:
+        yield user
+
+
+# ── Eventos / leads / feedback ───────────────────────────────────────────────
+# Eventos e leads vão para o buffer do analytics (gravação em lote), não para o banco.
+
+
+async def log_evento(chat_id: int, tipo: str) -> None:
+    """Versão async de db.log_evento, via buffer do analytics."""
+    analytics.log_evento(chat_id, tipo)
+
+
+async def registrar_lead(chat_id: int, username: str | None = None, primeiro_nome: str | None = None) -> None:
+    """Versão async de db.registrar_lead, via buffer do analytics."""
+    analytics.registrar_lead(chat_id, username, primeiro_nome)
+
+
+async def ultimo_evento(chat_id: int, tipo: str) -> str | None:
+    """Versão async de db.ultimo_evento, contando eventos ainda no buffer."""
+    return analytics.ultimo_evento_pendente(chat_id, tipo) or await _ultimo_evento_banco(chat_id, tipo)
+
+
+async def get_stats() -> dict:
+    """Versão async de db.get_stats, com o buffer do analytics já gravado."""
+    loop = asyncio.get_running_loop()
+    await loop.run_in_executor(_escrita, analytics.descarregar)
+    return await _get_stats_banco()
+
+
+_ultimo_evento_banco = _ler(db.ultimo_evento)
+_get_stats_banco = _ler(db.get_stats)
+
+salvar_sugestao = _escrever(db.salvar_sugestao)
+salvar_suporte = _escrever(db.salvar_suporte)
+
+
+# ── Plano / Pagamentos ───────────────────────────────────────────────────────
+
+get_plano = _ler(db.get_plano)
+is_pro = _ler(db.is_pro)
+get_pagamento_pendente = _ler(db.get_pagamento_pendente)
+get_pagamento_por_chat = _ler(db.get_pagamento_por_chat)
+get_usuarios_pro_expirados = _ler(db.get_usuarios_pro_expirados)
+get_assinaturas_pendentes = _ler(db.get_assinaturas_pendentes)
+
+set_plano = _escrever(db.set_plano)
+ativar_trial = _escrever(db.ativar_trial)
+criar_pagamento = _escrever(db.criar_pagamento)
+atualizar_pagamento = _escrever(db.atualizar_pagamento)
+
+
+def encerrar() -> None:
+    """Shutdown: grava o buffer do analytics, espera as escritas na fila, para os pools e fecha as conexões."""
+    analytics.encerrar()
+    _escrita.shutdown(wait=True)
+    _leitura.shutdown(wait=True)
+    db.fechar_conexoes()
+    logger.info("db_async encerrado.")
@@ -1,53 +1,255 @@
 """
 Scraper para o Portal FAM
 Responsável por fazer login e extrair atividades
+
+Login e páginas de leitura (notas, grade, histórico) vão primeiro pelo
+cliente HTTP (portal_http.py); o Chrome só sobe como fallback automático
+ou para o fluxo de atividades.
 """
 
-from selenium import webdriver
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.webdriver.chrome.options import Options
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
-from bs4 import BeautifulSoup
+from selenium.common.exceptions import (
+    JavascriptException,
+    NoSuchElementException,
+    StaleElementReferenceException,
+    TimeoutException,
+)
+from bs4 import BeautifulSoup, SoupStrainer
+import functools
+import hashlib
 import logging
 import os
 import re
 import time
 import unicodedata
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+import requests
+
+import browser_pool
+import captura
+import db
+from portal_http import (
+    MARCADORES_HTML, PORTAL_URL, PortalHTTP, PrazoEsgotado, SessaoExpirada, eh_pagina_login, tempo_restante,
+    url_pagina,
+)
+from storage import id_atividade
 
 logger = logging.getLogger(__name__)
 
+# Validade da sessão do portal salva por usuário (renovada a cada uso)
+SESSAO_TTL_MIN = int(os.getenv("PORTAL_SESSAO_TTL_MIN", "20"))
+
+# Downloads simultâneos de páginas de detalhe de atividade (via HTTP)
+DETALHES_CONCORRENCIA = int(os.getenv("FAM_DETALHES_CONCORRENCIA", "4"))
+
+# Campos da listagem que, se mudarem, obrigam a baixar os detalhes de novo
+CAMPOS_LISTAGEM_DETALHE = ("link", "prazo", "periodo")
+
+
+def _atividade_conhecida(conhecidas, atividade):
+    """Versão salva da atividade (mapa por id ou callback), ou None."""
+    if not conhecidas:
+        return None
+    if callable(conhecidas):
+        return conhecidas(atividade)
+    return conhecidas.get(id_atividade(atividade))
+
+
+# ── Prontidão das páginas (Selenium) ─────────────────────────────────────────
+# Em vez de sleeps fixos, cada etapa espera um marcador concreto e termina
+# assim que ele aparece. Timeouts (s) são o teto, não o tempo típico.
+
+TIMEOUTS_PRONTIDAO = {
+    "login": 15,
+    "notas": 15,
+    "grade": 15,
+    "historico": 15,
+    "atividades": 10,
+    "detalhe": 10,
+}
+
+# Teto de carregamento de um driver.get (o padrão do Selenium); com prazo, o que faltar
+TIMEOUT_CARREGAMENTO = 300
+
+# Seletor CSS que indica a página pronta para o parser
+SELETORES_PRONTIDAO = {
+    "notas": "table.GradeNotas",
+    "grade": "table.Grade",
+    "historico": "table.Grade",
+    "atividades": "tr.lovelyrow1, tr.lovelyrow2",
+}
+
+_POLL_PRONTIDAO = 0.1
+_EXCECOES_TRANSICAO = (NoSuchElementException, StaleElementReferenceException, JavascriptException)
+
+
+def _documento_pronto(driver) -> bool:
+    return driver.execute_script("return document.readyState") == "complete"
+
+
+def _pagina_pronta(seletor: str):
+    """Condição: marcador presente, ou página carregada mas com o form de login."""
+    def condicao(driver):
+        if driver.find_elements(By.CSS_SELECTOR, seletor):
+            return "ok"
+        if _documento_pronto(driver) and driver.find_elements(By.NAME, "senha"):
+            return "login"
+        return False
+    return condicao
+
+
+def _atividades_prontas(driver):
+    """Linhas de atividade presentes, ou página de atividades carregada e vazia."""
+    if driver.find_elements(By.CSS_SELECTOR, SELETORES_PRONTIDAO["atividades"]):
+        return "ok"
+    if "atividades=x" in driver.current_url.lower() and _documento_pronto(driver):
+        return "vazia"
+    return False
+
+
+def _resultado_login(url_formulario: str):
+    """Condição pós-clique: "ok" ao entrar no portal, "falhou" se o form voltar."""
+    def condicao(driver):
+        url = driver.current_url
+        if "pg_portal" in url.lower():
+            return "ok"
+        if url == url_formulario or not _documento_pronto(driver):
+            return False
+        return "falhou" if driver.find_elements(By.NAME, "senha") else "ok"
+    return condicao
+
 
 class FAMScraper:
-    def __init__(self, login, senha, headless=True):
+    def __init__(self, login, senha, headless=True, usar_http=True, pool=None, chat_id=None, prazo=None):
         self.login = login
         self.senha = senha
         self.headless = headless
+        self.usar_http = usar_http
+        # Fim (time.monotonic()) permitido para a sessão: requests e esperas do
+        # Chrome são limitados ao que falta; depois dele, PrazoEsgotado
+        self.prazo = prazo
+        # chat_id habilita o cache de sessão do portal (cookies encriptados no banco)
+        self.chat_id = chat_id
         self.driver = None
+        self.http = None
+        self._driver_logado = False
+        # Headless usa o pool compartilhado; modo visível (debug) tem Chrome próprio
+        if pool is None and headless:
+            pool = browser_pool.get_pool()
+        self.pool = pool
+        self._instancia = None
+        # Duração (s) da última espera de cada etapa — ver _aguardar()
+        self.tempos = {}
 
     def _setup_driver(self):
-        """Configura o driver do Selenium"""
-        chrome_options = Options()
-        if self.headless:
-            chrome_options.add_argument('--headless')
-        chrome_options.add_argument('--no-sandbox')
-        chrome_options.add_argument('--disable-dev-shm-usage')
-        chrome_options.add_argument('--disable-gpu')
-        chrome_options.add_argument('--window-size=1920,1080')
-
-        self.driver = webdriver.Chrome(options=chrome_options)
-        logger.info("Driver do Chrome configurado")
+        """Configura o driver do Selenium (checkout do pool quando disponível)"""
+        espera = tempo_restante(self.prazo, browser_pool.POOL_TIMEOUT_CHECKOUT)  # sem prazo, nem pega um Chrome
+        if self.pool:
+            try:
+                self._instancia = self.pool.checkout(timeout=espera)
+            except TimeoutError:
+                tempo_restante(self.prazo, 0)  # pool cheio até o fim do prazo → PrazoEsgotado
+                raise
+            self.driver = self._instancia.driver
+        else:
+            self.driver = browser_pool.criar_driver(self.headless)
+
+    def _abrir(self, url):
+        """driver.get com o carregamento limitado ao que falta do prazo."""
+        self.driver.set_page_load_timeout(tempo_restante(self.prazo, TIMEOUT_CARREGAMENTO))
+        try:
+            self.driver.get(url)
+        except TimeoutException:
+            tempo_restante(self.prazo, 0)  # foi o prazo da sessão, não só a página
+            raise
 
     def fazer_login(self):
-        """Faz login no portal FAM"""
+        """Faz login no portal FAM.
+
+        Ordem: sessão salva do usuário (validada por probe) → login HTTP → Selenium.
+        """
+        if self.usar_http and (self._reusar_sessao() or self._login_http()):
+            return True
+        return self._login_selenium()
+
+    def _reusar_sessao(self):
+        """Reaproveita os cookies salvos do usuário se o portal ainda os aceitar."""
+        if not self.chat_id:
+            return False
+        cookies = db.get_sessao_portal(self.chat_id)
+        if not cookies:
+            return False
+        http = PortalHTTP(self.login, self.senha, prazo=self.prazo)
+        http.importar_cookies(cookies)
+        if http.sessao_valida():
+            logger.info("Sessão do portal reaproveitada (chat_id=%d)", self.chat_id)
+            self.http = http
+            return True
+        logger.info("Sessão salva expirou no portal - refazendo login (chat_id=%d)", self.chat_id)
+        db.limpar_sessao_portal(self.chat_id)
+        http.close()
+        return False
+
+    def _login_http(self):
+        """Tenta login via requests. Retorna False em qualquer falha."""
+        http = PortalHTTP(self.login, self.senha, prazo=self.prazo)
+        try:
+            if http.fazer_login():
+                self.http = http
+                return True
+            logger.warning("Login HTTP recusado - tentando via Selenium")
+        except (requests.RequestException, ValueError) as e:
+            logger.warning("Login HTTP indisponível (%s) - tentando via Selenium", e)
+        http.close()
+        return False
+
+    def _garantir_driver(self):
+        """Sobe o Chrome logado sob demanda (fluxos que exigem navegador)."""
+        if self._driver_logado:
+            return True
+        if self.http and self._login_selenium_por_cookies():
+            return True
+        return self._login_selenium()
+
+    def _login_selenium_por_cookies(self):
+        """Abre o Chrome já autenticado com os cookies da sessão HTTP."""
+        try:
+            if not self.driver:
+                self._setup_driver()
+            self._abrir(PORTAL_URL)
+            for cookie in self.http.exportar_cookies():
+                try:
+                    self.driver.add_cookie({k: v for k, v in cookie.items() if v})
+                except Exception:
+                    continue
+            self._abrir(url_pagina("inicio"))
+            if eh_pagina_login(self.driver.page_source):
+                logger.info("Cookies HTTP não valeram no Chrome - login pelo formulário")
+                return False
+            self._driver_logado = True
+            logger.info("Chrome autenticado com cookies da sessão HTTP")
+            return True
+        except PrazoEsgotado:
+            raise
+        except Exception as e:
+            logger.warning("Erro ao passar cookies para o Chrome: %s", e)
+            return False
+
+    def _login_selenium(self):
+        """Faz login no portal FAM pelo Chrome"""
         try:
-            self._setup_driver()
+            if not self.driver:
+                self._setup_driver()
+            self.driver.delete_all_cookies()
             logger.info("Acessando portal FAM...")
-            self.driver.get("https://www.famportal.com.br/")
+            self._abrir(PORTAL_URL)
 
             # Aguarda a página carregar
-            wait = WebDriverWait(self.driver, 20)
+            wait = WebDriverWait(self.driver, tempo_restante(self.prazo, 20))
 
             # Localiza e preenche o campo de login (usando name ao invés de id)
             logger.info("Preenchendo credenciais...")
@@ -63,21 +265,23 @@ class FAMScraper:
             senha_field.send_keys(self.senha)
 
             # Clica no botão de login (usando name ao invés de CSS selector)
+            url_formulario = self.driver.current_url
             login_button = self.driver.find_element(By.NAME, "login")
             login_button.click()
 
-            # Aguarda o login completar (aumentado para 5 segundos)
-            time.sleep(5)
-
-            # Verifica se o login foi bem sucedido
-            if "portal" in self.driver.current_url.lower() or "pg_portal" in self.driver.current_url:
+            # Aguarda sair do formulário (ou ele voltar com erro)
+            resultado = self._aguardar("login", _resultado_login(url_formulario))
+            if resultado == "ok":
                 logger.info("Login realizado com sucesso")
+                self._driver_logado = True
                 return True
-            else:
-                logger.error("Login falhou - URL não mudou")
-                return False
+            logger.error("Login falhou - %s", "formulário devolvido" if resultado else "portal não respondeu")
+            return False
 
+        except PrazoEsgotado:
+            raise
         except TimeoutException:
+            tempo_restante(self.prazo, 0)
             logger.error("Timeout ao tentar fazer login - página não carregou")
             return False
         except Exception as e:
@@ -87,7 +291,7 @@ class FAMScraper:
     def navegar_para_atividades(self):
         """Navega até a página de atividades"""
         try:
-            wait = WebDriverWait(self.driver, 10)
+            wait = WebDriverWait(self.driver, tempo_restante(self.prazo, 10))
 
             # Procura pelo link de "Atividades" no menu
             logger.info("Navegando para página de atividades...")
@@ -102,42 +306,45 @@ class FAMScraper:
                 atividades_link.click()
             except TimeoutException:
                 logger.warning("Link de atividades não encontrado - acessando URL diretamente")
-                self.driver.get(
-                    "https://www.famportal.com.br/fam/pg_portal.php?frame=frame_avisos.php&atividades=X"
-                )
+                self._abrir(url_pagina("atividades"))
 
-            # Aguarda página carregar
-            time.sleep(3)
-
-            try:
-                wait.until(lambda drv: "atividades=X" in drv.current_url.lower())
-            except TimeoutException:
-                logger.warning("Timeout ao confirmar URL de atividades - seguindo mesmo assim")
+            # Aguarda as linhas de atividade (ou a página vazia)
+            if not self._aguardar("atividades", _atividades_prontas):
+                logger.warning("Página de atividades não confirmou carga - seguindo mesmo assim")
             logger.info("Página de atividades carregada")
             return True
 
+        except PrazoEsgotado:
+            raise
         except Exception as e:
             logger.error(f"Erro ao navegar para atividades: {e}")
             return False
 
-    def extrair_atividades(self):
-        """Extrai lista de atividades do portal"""
+    def extrair_atividades(self, conhecidas=None):
+        """Extrai lista de atividades do portal.
+
+        conhecidas: {id_atividade: atividade salva} (Storage.get_atividades_conhecidas)
+        ou callable(atividade) -> atividade salva | None. Atividades já vistas e
+        sem mudança na listagem reaproveitam descrição/materiais salvos, e só as
+        novas/alteradas têm a página de detalhe baixada.
+        """
         try:
             atividades = []
 
             logger.info("Extraindo atividades...")
 
+            # Lista de atividades depende do Chrome (XPath + janelas de detalhe)
+            if not self._garantir_driver():
+                logger.error("Não foi possível abrir o navegador para atividades")
+                return atividades
+
             # Navega para página de atividades
             if not self.navegar_para_atividades():
                 logger.error("Não foi possível acessar a página de atividades")
                 return atividades
 
-            # Aguarda a página carregar
-            time.sleep(2)
-
-            # Salva screenshot para debug
-            self.driver.save_screenshot(os.path.join(os.path.dirname(__file__), '..', 'logs', 'debug_screenshot.png'))
-            logger.info("Screenshot salvo em logs/debug_screenshot.png")
+            # Screenshot para debug (só se a captura estiver ligada/sorteada)
+            captura.registrar(self.chat_id, "atividades", self.driver.get_screenshot_as_png, "png")
 
             # Busca todas as linhas de atividades (tr com class lovelyrow1 ou lovelyrow2)
             linhas_atividades = self.driver.find_elements(
@@ -194,7 +401,7 @@ class FAMScraper:
                     if link_onclick and "location.href=" in link_onclick:
                         link = link_onclick.split("'")[1]
                         if not link.startswith("http"):
-                            link = f"https://www.famportal.com.br/fam/{link}"
+                            link = urljoin(url_pagina("atividades"), link)
 
                     # Cria objeto da atividade
                     atividade = {
@@ -208,9 +415,6 @@ class FAMScraper:
                         "link": link
                     }
 
-                    detalhes = self.extrair_detalhes_atividade(link)
-                    atividade.update(detalhes)
-
                     atividades.append(atividade)
                     logger.info(f"Atividade extraída: {titulo}")
 
@@ -218,23 +422,87 @@ class FAMScraper:
                     logger.warning(f"Erro ao extrair atividade individual: {e}")
                     continue
 
+            # Detalhes salvos para o que não mudou; download só do resto
+            pendentes = []
+            for atividade in atividades:
+                salva = _atividade_conhecida(conhecidas, atividade)
+                if salva and all(salva.get(c) == atividade[c] for c in CAMPOS_LISTAGEM_DETALHE):
+                    atividade["descricao"] = salva.get("descricao", "")
+                    atividade["materiais"] = salva.get("materiais", [])
+                else:
+                    pendentes.append(atividade)
+
+            # Descrição + materiais das pendentes de uma vez
+            detalhes = self.extrair_detalhes_atividades([a["link"] for a in pendentes])
+            for atividade in pendentes:
+                atividade.update(detalhes.get(atividade["link"]) or {"descricao": "", "materiais": []})
+            logger.info("Detalhes: %d baixados, %d reaproveitados",
+                        len(pendentes), len(atividades) - len(pendentes))
+
             logger.info(f"Total de atividades extraídas: {len(atividades)}")
             return atividades
 
+        except PrazoEsgotado:
+            raise
         except Exception as e:
             logger.error(f"Erro ao extrair atividades: {e}", exc_info=True)
             return []
 
-    def _normalizar_texto(self, texto):
-        """Remove acentos e normaliza texto para comparação"""
-        if not texto:
-            return ""
-        texto_norm = unicodedata.normalize('NFKD', texto)
-        texto_ascii = texto_norm.encode('ASCII', 'ignore').decode('ASCII')
-        return texto_ascii.lower().strip()
+    def extrair_detalhes_atividades(self, links):
+        """Baixa descrição e materiais de várias atividades em paralelo.
+
+        Usa a sessão HTTP autenticada (ou uma criada com os cookies do Chrome),
+        com até DETALHES_CONCORRENCIA downloads simultâneos. Links que falharem
+        via HTTP caem para o Chrome, um por vez. Retorna {link: detalhes}.
+        """
+        links = list(dict.fromkeys(link for link in links if link))
+        if not links:
+            return {}
+
+        resultados = {}
+        http = self._sessao_http_detalhes()
+        if http:
+            def baixar(link):
+                try:
+                    return link, parse_detalhes_atividade_html(http.obter_url(link))
+                except (requests.RequestException, SessaoExpirada) as e:
+                    logger.warning("Falha HTTP no detalhe %s: %s", link, e)
+                    return link, None
+
+            inicio = time.monotonic()
+            with ThreadPoolExecutor(max_workers=max(1, DETALHES_CONCORRENCIA)) as executor:
+                for link, detalhes in executor.map(baixar, links):
+                    if detalhes is not None:
+                        resultados[link] = detalhes
+            self.tempos["detalhes_http"] = round(time.monotonic() - inicio, 3)
+            logger.info("Detalhes via HTTP: %d/%d em %.2fs",
+                        len(resultados), len(links), self.tempos["detalhes_http"])
+
+        for link in links:
+            if link not in resultados and self._garantir_driver():
+                resultados[link] = self.extrair_detalhes_atividade(link)
+        return resultados
+
+    def _sessao_http_detalhes(self):
+        """Sessão HTTP para os detalhes; monta uma com os cookies do Chrome se preciso."""
+        if self.http or not self.usar_http:
+            return self.http
+        if not self._driver_logado:
+            return None
+        http = PortalHTTP(self.login, self.senha, prazo=self.prazo)
+        http.importar_cookies(self._cookies_driver())
+        self.http = http
+        return http
+
+    def _cookies_driver(self):
+        """Cookies do Chrome no formato de PortalHTTP.exportar_cookies()."""
+        return [
+            {"name": c["name"], "value": c["value"], "domain": c.get("domain", ""), "path": c.get("path", "/")}
+            for c in self.driver.get_cookies()
+        ]
 
     def extrair_detalhes_atividade(self, link):
-        """Abre a página da atividade para capturar descrição e materiais"""
+        """Abre a página da atividade no Chrome (fallback do download HTTP)"""
         detalhes = {
             "descricao": "",
             "materiais": []
@@ -249,7 +517,7 @@ class FAMScraper:
 
         try:
             self.driver.execute_script("window.open(arguments[0], '_blank');", link)
-            WebDriverWait(self.driver, 20).until(
+            WebDriverWait(self.driver, tempo_restante(self.prazo, 20)).until(
                 lambda drv: len(drv.window_handles) > len(original_handles)
             )
 
@@ -259,19 +527,18 @@ class FAMScraper:
                 return detalhes
 
             self.driver.switch_to.window(nova_janela[0])
-            WebDriverWait(self.driver, 20).until(
-                EC.presence_of_element_located((By.TAG_NAME, "body"))
-            )
-            time.sleep(1)  # breve espera para garantir renderização
+            self._aguardar("detalhe", _documento_pronto)
             html_conteudo = self.driver.page_source
 
+        except PrazoEsgotado:
+            raise
         except Exception as e:
             logger.warning(f"Erro ao carregar detalhes da atividade: {e}")
         finally:
             try:
                 if self.driver.current_window_handle != original_window:
                     self.driver.close()
-                    WebDriverWait(self.driver, 10).until(
+                    WebDriverWait(self.driver, tempo_restante(self.prazo, 10)).until(
                         lambda drv: len(drv.window_handles) == len(original_handles)
                     )
                     self.driver.switch_to.window(original_window)
@@ -281,71 +548,7 @@ class FAMScraper:
         if not html_conteudo:
             return detalhes
 
-        soup = BeautifulSoup(html_conteudo, "html.parser")
-
-        # Descrição da atividade
-        descricao = ""
-        for td in soup.find_all("td"):
-            linhas = [linha.strip() for linha in td.get_text(separator="\n").splitlines()]
-            linhas = [linha for linha in linhas if linha]
-            if not linhas:
-                continue
-
-            capturando = False
-            coletadas = []
-
-            for linha in linhas:
-                linha_norm = self._normalizar_texto(linha)
-
-                if not capturando and "descricao da atividade" in linha_norm:
-                    capturando = True
-                    continue
-
-                if capturando:
-                    if "material associado" in linha_norm:
-                        break
-                    coletadas.append(linha)
-
-            if coletadas:
-                descricao = "\n".join(coletadas).strip()
-                break
-
-        detalhes["descricao"] = descricao
-
-        # Materiais associados
-        materiais = []
-        for input_tag in soup.select("input[name='mat_link']"):
-            link_material = (input_tag.get("value") or "").strip()
-            linha = input_tag.find_parent("tr")
-            if not linha:
-                continue
-
-            colunas = linha.find_all("td")
-            if not colunas:
-                continue
-
-            nome_material = colunas[0].get_text(separator=" ", strip=True) if len(colunas) >= 1 else ""
-            tipo_material = colunas[1].get_text(separator=" ", strip=True) if len(colunas) >= 2 else ""
-
-            if link_material:
-                materiais.append({
-                    "nome": nome_material,
-                    "tipo": tipo_material,
-                    "link": link_material
-                })
-
-        # Remove duplicados mantendo ordem
-        vistos = set()
-        materiais_unicos = []
-        for material in materiais:
-            chave = material["link"]
-            if chave in vistos:
-                continue
-            vistos.add(chave)
-            materiais_unicos.append(material)
-
-        detalhes["materiais"] = materiais_unicos
-        return detalhes
+        return parse_detalhes_atividade_html(html_conteudo)
 
     def extrair_notas(self):
         """Navega até a página de notas e extrai boletim + info do aluno.
@@ -354,23 +557,9 @@ class FAMScraper:
         """
         try:
             logger.info("Navegando para página de notas...")
-            self.driver.get(
-                "https://www.famportal.com.br/fam/pg_portal.php?"
-                "frame=frame_alu_notas.php&slc=X&frame_notas=frame_alu_notas_resultados.php"
-            )
-            time.sleep(3)
-
-            html = self.driver.page_source
+            html = self.obter_html("notas")
 
-            # Salva HTML para debug/análise
-            debug_path = os.path.join(os.path.dirname(__file__), '..', 'logs', 'notas_debug.html')
-            os.makedirs(os.path.dirname(debug_path), exist_ok=True)
-            with open(debug_path, 'w', encoding='utf-8') as f:
-                f.write(html)
-            logger.info("HTML de notas salvo em %s", debug_path)
-
-            notas = parse_notas_html(html)
-            info = parse_info_aluno(html)
+            notas, info = parse_pagina_notas(html)
             logger.info("Notas extraídas: %s | Info: %s", len(notas) if notas else 0, info)
             return notas, info
 
@@ -382,12 +571,7 @@ class FAMScraper:
         """Navega até a página de grade e extrai a grade horária."""
         try:
             logger.info("Navegando para página de grade horária...")
-            self.driver.get(
-                "https://www.famportal.com.br/fam/pg_portal.php?frame=frame_alu_gradealuno.php"
-            )
-            time.sleep(3)
-
-            html = self.driver.page_source
+            html = self.obter_html("grade")
             grade = parse_grade_html(html, turno=turno)
             logger.info("Grade extraída: %s", {k: len(v) for k, v in grade.items()})
             return grade
@@ -404,20 +588,7 @@ class FAMScraper:
         """
         try:
             logger.info("Navegando para página de histórico (extrato de notas)...")
-            self.driver.get(
-                "https://www.famportal.com.br/fam/pg_portal.php?"
-                "frame=frame_alu_extrato_notas.php"
-            )
-            time.sleep(3)
-
-            html = self.driver.page_source
-
-            # Salva HTML para debug
-            debug_path = os.path.join(os.path.dirname(__file__), '..', 'logs', 'historico_debug.html')
-            os.makedirs(os.path.dirname(debug_path), exist_ok=True)
-            with open(debug_path, 'w', encoding='utf-8') as f:
-                f.write(html)
-            logger.info("HTML de histórico salvo em %s", debug_path)
+            html = self.obter_html("historico")
 
             historico = parse_historico_html(html)
             logger.info("Histórico extraído: %d disciplinas", len(historico) if historico else 0)
@@ -427,13 +598,309 @@ class FAMScraper:
             logger.error("Erro ao extrair histórico: %s", e, exc_info=True)
             return None
 
+    def obter_html(self, pagina):
+        """HTML cru de uma página do portal ("notas", "grade", "historico").
+
+        Para quem quer decidir antes de parsear (ex.: comparar impressao_pagina).
+        O HTML vai para o módulo captura (gravado só se FAM_CAPTURA permitir).
+        """
+        html = self._obter_html(pagina)
+        captura.registrar(self.chat_id, pagina, html)
+        return html
+
+    def _obter_html(self, pagina):
+        """Retorna o HTML de uma página do portal.
+
+        Usa a sessão HTTP quando disponível; se ela expirar, falhar ou devolver
+        uma página sem a tabela esperada, cai para o Chrome.
+        """
+        if self.http:
+            try:
+                html = self._obter_html_http(pagina)
+                marcador = MARCADORES_HTML.get(pagina)
+                if marcador is None or marcador.search(html):
+                    return html
+                logger.warning("HTML de %s via HTTP sem a tabela esperada - usando Selenium", pagina)
+            except (requests.RequestException, SessaoExpirada, ValueError) as e:
+                logger.warning("Falha HTTP em %s (%s) - usando Selenium", pagina, e)
+
+        if not self._garantir_driver():
+            raise RuntimeError(f"Sem sessão no portal para abrir {pagina}")
+        self._abrir(url_pagina(pagina))
+        if self._aguardar(pagina, _pagina_pronta(SELETORES_PRONTIDAO[pagina])) == "login":
+            logger.warning("Portal devolveu o login ao abrir %s no Chrome", pagina)
+        return self.driver.page_source
+
+    def _aguardar(self, etapa, condicao, timeout=None):
+        """Espera `condicao(driver)` ficar verdadeira e registra a duração.
+
+        Retorna o valor da condição, ou False se o timeout da etapa estourar
+        (PrazoEsgotado se o que estourou foi o prazo da sessão).
+        """
+        if timeout is None:
+            timeout = TIMEOUTS_PRONTIDAO[etapa]
+        timeout = tempo_restante(self.prazo, timeout)
+        inicio = time.monotonic()
+        try:
+            resultado = WebDriverWait(
+                self.driver, timeout, poll_frequency=_POLL_PRONTIDAO,
+                ignored_exceptions=_EXCECOES_TRANSICAO,
+            ).until(condicao)
+        except TimeoutException:
+            tempo_restante(self.prazo, 0)
+            resultado = False
+        duracao = time.monotonic() - inicio
+        self.tempos[etapa] = round(duracao, 3)
+        if resultado:
+            logger.info("Pronto: %s em %.2fs", etapa, duracao)
+        else:
+            logger.warning("Timeout de %ss esperando %s", timeout, etapa)
+        return resultado
+
+    def _obter_html_http(self, pagina):
+        """GET via HTTP com um relogin silencioso se a sessão tiver expirado."""
+        try:
+            return self.http.obter_html(pagina)
+        except SessaoExpirada:
+            logger.info("Sessão HTTP expirou em %s - relogando", pagina)
+            if not self.http.fazer_login():
+                self.http.close()
+                self.http = None
+                raise
+            return self.http.obter_html(pagina)
+
+    def _salvar_sessao(self):
+        """Guarda os cookies da sessão atual (encriptados) para o próximo comando."""
+        if not self.chat_id:
+            return
+        if self.http:
+            cookies = self.http.exportar_cookies()
+        elif self._driver_logado:
+            cookies = self._cookies_driver()
+        else:
+            return
+        if cookies:
+            db.set_sessao_portal(self.chat_id, cookies, SESSAO_TTL_MIN)
+
     def close(self):
-        """Fecha o navegador"""
-        if self.driver:
+        """Salva a sessão e fecha o navegador e a sessão HTTP"""
+        try:
+            self._salvar_sessao()
+        except Exception as e:
+            logger.warning("Erro ao salvar sessão do portal: %s", e)
+        if self.http:
+            self.http.close()
+            self.http = None
+        if self._instancia:
+            self.pool.devolver(self._instancia)
+            self._instancia = None
+            self.driver = None
+            self._driver_logado = False
+            logger.info("Driver devolvido ao pool")
+        elif self.driver:
             self.driver.quit()
             logger.info("Driver fechado")
 
 
+# ── Árvore HTML compartilhada ────────────────────────────────────────────────
+# Cada página vira um único BeautifulSoup; os parsers aceitam o HTML ou o soup
+# já montado, então vários extratores (notas + info do aluno) dividem a árvore.
+# lxml é opcional e bem mais rápido; sem ele, fica o html.parser puro Python.
+
+try:
+    import lxml  # noqa: F401
+    PARSER_HTML = "lxml"
+except ImportError:
+    PARSER_HTML = "html.parser"
+
+
+def _soup(html) -> BeautifulSoup:
+    """BeautifulSoup do HTML (ou o próprio, se já for um soup)."""
+    if isinstance(html, BeautifulSoup):
+        return html
+    return BeautifulSoup(html, PARSER_HTML)
+
+
+# Trechos (tag, classe) que os parsers de cada página leem — o resto da página
+# (frames de navegação, menus, scripts) nem vira árvore
+ALVOS_PAGINA = {
+    "notas": (("table", "GradeNotas"), ("font", "login-u"), ("td", "LinhaPar")),
+    "grade": (("table", "Grade"),),
+    "historico": (("table", "Grade"),),
+}
+
+@functools.lru_cache(maxsize=None)
+def _re_abertura(tag: str, classe: str) -> re.Pattern:
+    """Regex da tag de abertura <tag class="... classe ...">."""
+    return re.compile(
+        r"<" + tag + r"""\b[^>]*\bclass=["']?(?:[^"'>]*\s)?""" + re.escape(classe) + r"""(?![\w-])[^>]*>""",
+        re.IGNORECASE,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def _re_tag(tag: str) -> re.Pattern:
+    return re.compile(r"<(/?)" + tag + r"\b[^>]*>", re.IGNORECASE)
+
+
+def _fim_elemento(html: str, tag: str, inicio: int) -> int:
+    """Fim do elemento <tag> aberto em `inicio` (respeitando aninhamento da mesma tag)."""
+    profundidade = 0
+    for marca in _re_tag(tag).finditer(html, inicio):
+        profundidade += -1 if marca.group(1) else 1
+        if profundidade == 0:
+            return marca.end()
+    return len(html)  # elemento sem fechamento: o parser fecha
+
+
+def _recortar_tabela(html: str, classe: str) -> str | None:
+    """Recorta o HTML da primeira <table class=classe> (respeitando tabelas aninhadas).
+
+    Retorna None se a tabela não aparecer.
+    """
+    abertura = _re_abertura("table", classe).search(html)
+    if not abertura:
+        return None
+    return html[abertura.start():_fim_elemento(html, "table", abertura.start())]
+
+
+def _recortes_alvos(html: str, alvos) -> list[str]:
+    """HTML de todas as ocorrências de cada alvo (tag, classe), na ordem dos alvos."""
+    recortes = []
+    for tag, classe in alvos:
+        for abertura in _re_abertura(tag, classe).finditer(html):
+            recortes.append(html[abertura.start():_fim_elemento(html, tag, abertura.start())])
+    return recortes
+
+
+_RE_COMENTARIO = re.compile(r"<!--.*?-->", re.DOTALL)
+_RE_ESPACOS = re.compile(r"\s+")
+
+
+def impressao_pagina(html: str, pagina: str) -> str | None:
+    """Hash (SHA-256) dos trechos que os parsers da página leem, normalizados.
+
+    Entram todos os alvos de ALVOS_PAGINA — em notas, a tabela e também o
+    bloco de dados do aluno (curso, semestre, sala), que vira info_aluno.
+    Navegação, horário e tokens ficam de fora; comentários e diferenças de
+    espaço são ignorados. None se a tabela principal não aparecer — nesse
+    caso nada deve ser pulado.
+    """
+    alvos = ALVOS_PAGINA[pagina]
+    if _recortar_tabela(html, alvos[0][1]) is None:
+        return None
+    texto = "".join(_recortes_alvos(html, alvos))
+    texto = _RE_ESPACOS.sub(" ", _RE_COMENTARIO.sub("", texto)).replace("> <", "><").strip()
+    return hashlib.sha256(texto.encode("utf-8")).hexdigest()
+
+
+def _filtro_alvos(alvos) -> SoupStrainer:
+    """SoupStrainer que só monta as tags (tag, classe) pedidas e seus filhos."""
+    def aceita(nome, attrs):
+        classes = attrs.get("class") or ""
+        if isinstance(classes, str):
+            classes = classes.split()
+        return any(nome == tag and classe in classes for tag, classe in alvos)
+    return SoupStrainer(aceita)
+
+
+def _soup_pagina(html, pagina: str) -> BeautifulSoup:
+    """Soup só com o que os parsers da página leem (ou o próprio, se já for soup).
+
+    Página de uma tabela só: recorta o HTML dela e parseia o recorte. Senão
+    (ou se o recorte falhar), parseia o documento com SoupStrainer.
+    """
+    if isinstance(html, BeautifulSoup):
+        return html
+    alvos = ALVOS_PAGINA[pagina]
+    if len(alvos) == 1:
+        recorte = _recortar_tabela(html, alvos[0][1])
+        if recorte is not None:
+            return BeautifulSoup(recorte, PARSER_HTML)
+    return BeautifulSoup(html, PARSER_HTML, parse_only=_filtro_alvos(alvos))
+
+
+# ── Parser de detalhes da atividade ──────────────────────────────────────────
+
+
+def _normalizar_texto(texto):
+    """Remove acentos e normaliza texto para comparação"""
+    if not texto:
+        return ""
+    texto_norm = unicodedata.normalize('NFKD', texto)
+    texto_ascii = texto_norm.encode('ASCII', 'ignore').decode('ASCII')
+    return texto_ascii.lower().strip()
+
+
+def parse_detalhes_atividade_html(html: str) -> dict:
+    """Extrai descrição e materiais (mat_link) da página de uma atividade.
+
+    Retorna {"descricao": str, "materiais": [{"nome", "tipo", "link"}]}.
+    """
+    soup = _soup(html)
+
+    # Descrição da atividade
+    descricao = ""
+    for td in soup.find_all("td"):
+        linhas = [linha.strip() for linha in td.get_text(separator="\n").splitlines()]
+        linhas = [linha for linha in linhas if linha]
+        if not linhas:
+            continue
+
+        capturando = False
+        coletadas = []
+
+        for linha in linhas:
+            linha_norm = _normalizar_texto(linha)
+
+            if not capturando and "descricao da atividade" in linha_norm:
+                capturando = True
+                continue
+
+            if capturando:
+                if "material associado" in linha_norm:
+                    break
+                coletadas.append(linha)
+
+        if coletadas:
+            descricao = "\n".join(coletadas).strip()
+            break
+
+    # Materiais associados
+    materiais = []
+    for input_tag in soup.select("input[name='mat_link']"):
+        link_material = (input_tag.get("value") or "").strip()
+        linha = input_tag.find_parent("tr")
+        if not linha:
+            continue
+
+        colunas = linha.find_all("td")
+        if not colunas:
+            continue
+
+        nome_material = colunas[0].get_text(separator=" ", strip=True) if len(colunas) >= 1 else ""
+        tipo_material = colunas[1].get_text(separator=" ", strip=True) if len(colunas) >= 2 else ""
+
+        if link_material:
+            materiais.append({
+                "nome": nome_material,
+                "tipo": tipo_material,
+                "link": link_material
+            })
+
+    # Remove duplicados mantendo ordem
+    vistos = set()
+    materiais_unicos = []
+    for material in materiais:
+        chave = material["link"]
+        if chave in vistos:
+            continue
+        vistos.add(chave)
+        materiais_unicos.append(material)
+
+    return {"descricao": descricao, "materiais": materiais_unicos}
+
+
 # ── Mapeamento aulas → horários por turno ────────────────────────────────
 
 HORARIOS_POR_TURNO = {
@@ -467,7 +934,7 @@ HORARIOS = HORARIOS_POR_TURNO["noturno"]
 COLUNAS_DIA = {1: "0", 2: "1", 3: "2", 4: "3", 5: "4", 6: "5"}
 
 
-def parse_grade_html(html: str, turno: str = "noturno") -> dict:
+def parse_grade_html(html: str | BeautifulSoup, turno: str = "noturno") -> dict:
     """Parseia HTML da página de grade e retorna dict no formato do banco.
 
     Estrutura real do portal:
@@ -488,7 +955,7 @@ def parse_grade_html(html: str, turno: str = "noturno") -> dict:
 
     Retorno: {"0": [{"materia": ..., "prof": ..., "inicio": ..., "fim": ...}], ...}
     """
-    soup = BeautifulSoup(html, "html.parser")
+    soup = _soup_pagina(html, "grade")
     tabela = soup.find("table", class_="Grade")
     if not tabela:
         logger.warning("Tabela de grade não encontrada no HTML")
@@ -616,12 +1083,12 @@ def _agrupar_grade(grade_crua: dict, turno: str = "noturno") -> dict:
 # ── Parser de info do aluno ──────────────────────────────────────────────────
 
 
-def parse_info_aluno(html: str) -> dict | None:
+def parse_info_aluno(html: str | BeautifulSoup) -> dict | None:
     """Extrai informações do aluno da página de notas/resultados.
 
     Retorno: {"curso": str, "semestre": str, "turma": str, "sala": str}
     """
-    soup = BeautifulSoup(html, "html.parser")
+    soup = _soup_pagina(html, "notas")
     info = {}
 
     # Turma e Localização: <font class="login-u">57-05-B</font> e <font class="login-u">Bloco 2 - Sala 073...</font>
@@ -662,7 +1129,7 @@ def _parse_nota_valor(texto: str) -> float | None:
         return None
 
 
-def parse_notas_html(html: str) -> list[dict] | None:
+def parse_notas_html(html: str | BeautifulSoup) -> list[dict] | None:
     """Parseia HTML da página de notas (aba Resultados) do portal FAM.
 
     Estrutura da tabela (class="GradeNotas"):
@@ -674,7 +1141,7 @@ def parse_notas_html(html: str) -> list[dict] | None:
                "n3": float|None, "media_semestral": float|None,
                "media_final": float|None, "faltas": int, "max_faltas": int}, ...]
     """
-    soup = BeautifulSoup(html, "html.parser")
+    soup = _soup_pagina(html, "notas")
     tabela = soup.find("table", class_="GradeNotas")
     if not tabela:
         logger.warning("Tabela GradeNotas não encontrada no HTML")
@@ -693,8 +1160,9 @@ def parse_notas_html(html: str) -> list[dict] | None:
 
         disciplina = _limpar_nome_materia(tds[1].get_text(strip=True))
 
-        # Verifica se N2/N3 estão disponíveis (colspan "Não disponível")
-        nao_disponivel = any("Não disponível" in td.get_text() for td in tds)
+        # Verifica se N2/N3 estão disponíveis (colspan "Não disponível") — um
+        # get_text() da linha inteira em vez de um por célula
+        nao_disponivel = "Não disponível" in row.get_text()
 
         # N1 sempre na posição 2, Peso1 na posição 3
         n1 = _parse_nota_valor(tds[2].get_text(strip=True))
@@ -740,16 +1208,22 @@ def parse_notas_html(html: str) -> list[dict] | None:
         })
 
     if not notas:
-        logger.warning("Nenhuma nota encontrada — verifique logs/notas_debug.html")
+        logger.warning("Nenhuma nota encontrada — verifique as capturas em logs/capturas/ (FAM_CAPTURA=on)")
         return None
 
     return notas
 
 
+def parse_pagina_notas(html: str | BeautifulSoup) -> tuple[list[dict] | None, dict | None]:
+    """Notas + info do aluno com uma única árvore HTML. Retorna (notas, info)."""
+    soup = _soup_pagina(html, "notas")
+    return parse_notas_html(soup), parse_info_aluno(soup)
+
+
 # ── Parser de histórico ──────────────────────────────────────────────────────
 
 
-def parse_historico_html(html: str) -> list[dict] | None:
+def parse_historico_html(html: str | BeautifulSoup) -> list[dict] | None:
     """Parseia HTML da página de extrato de notas do portal FAM.
 
     Estrutura (table class="Grade"):
@@ -759,7 +1233,7 @@ def parse_historico_html(html: str) -> list[dict] | None:
 
     Retorno: [{"disciplina": str, "semestre": str, "situacao": str, "media_final": float|None}]
     """
-    soup = BeautifulSoup(html, "html.parser")
+    soup = _soup_pagina(html, "historico")
     tabela = soup.find("table", class_="Grade")
     if not tabela:
         logger.warning("Tabela Grade não encontrada no HTML de histórico")
@@ -808,7 +1282,7 @@ def parse_historico_html(html: str) -> list[dict] | None:
             })
 
     if not historico:
-        logger.warning("Nenhuma disciplina encontrada no histórico — verifique logs/historico_debug.html")
+        logger.warning("Nenhuma disciplina encontrada no histórico — verifique as capturas em logs/capturas/ (FAM_CAPTURA=on)")
         return None
 
     return historico
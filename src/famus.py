@@ -11,8 +11,8 @@ from zoneinfo import ZoneInfo
 from telegram import Update
 from telegram.ext import ContextTypes
 
-import db
-from aulas import DIAS_NOME, _formatar_dia, _menu_aula, _aulas_semana, _load_grade
+from contexto_usuario import ContextoUsuario
+from aulas import DIAS_NOME, _formatar_dia, _menu_aula, _aulas_semana, _load_grade_async
 from onibus import (
     HORARIOS,
     menu_keyboard,
@@ -176,10 +176,12 @@ def detectar_intencao(texto_original: str):
 # ── Gerar respostas ──────────────────────────────────────────────────────────
 
 
-async def responder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
+async def responder(update: Update, context: ContextTypes.DEFAULT_TYPE,
+                    usuario: ContextoUsuario | None = None) -> bool:
     """
     Tenta responder a mensagem naturalmente.
     Retorna True se respondeu, False se não entendeu.
+    usuario: snapshot já carregado pelo handler (senão lê o banco uma vez aqui).
     """
     texto = update.message.text
     chat_id = update.effective_chat.id
@@ -191,8 +193,8 @@ async def responder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     intencao, dados = resultado
 
     # Carrega nome do usuário
-    user = db.get_user(chat_id)
-    nome = user["nome"] if user else ""
+    usuario = usuario or await ContextoUsuario.carregar(chat_id)
+    nome = usuario.get("nome", "")
 
     if intencao == "saudacao":
         saudacao = _saudacao(nome)
@@ -217,7 +219,7 @@ async def responder(update: Update, context: ContextTypes.DEFAULT_TYPE) -> bool:
     if intencao == "aula":
         agora = datetime.now(TZ)
         quando = dados["quando"]
-        grade = _load_grade(chat_id)
+        grade = await _load_grade_async(chat_id, usuario)
 
         if quando == "hoje":
             info = _formatar_dia(agora.weekday(), agora, grade)
@@ -14,8 +14,8 @@ from zoneinfo import ZoneInfo
 
 import requests
 
-import db
-from aulas import DIAS_NOME, _load_grade
+from aulas import DIAS_NOME, _grade_por_dia
+from contexto_usuario import ContextoUsuario
 from onibus import HORARIOS
 
 logger = logging.getLogger(__name__)
@@ -138,8 +138,9 @@ def _gerar_tabela_horarios() -> str:
 _TABELA_HORARIOS = _gerar_tabela_horarios()
 
 
-def _contexto_dinamico(user: dict, grade: dict) -> str:
+def _contexto_dinamico(user: dict, grade: dict, usuario: ContextoUsuario | None = None) -> str:
     """Gera contexto com hora atual, local estimado e próximos ônibus relevantes."""
+    usuario = usuario or ContextoUsuario(user["chat_id"], user)
     agora = datetime.now(TZ)
     dia_semana = agora.weekday()
     amanha_dia = (agora + timedelta(days=1)).weekday()
@@ -198,7 +199,7 @@ def _contexto_dinamico(user: dict, grade: dict) -> str:
         partes.append(f"\nAmanhã ({DIAS_NOME[amanha_dia]}): sem aula")
 
     # Info do aluno (curso, semestre, sala)
-    info_aluno = db.get_info_aluno(user["chat_id"])
+    info_aluno = usuario.info_aluno
     if info_aluno:
         partes.append("\n=== DADOS ACADÊMICOS ===")
         if info_aluno.get("curso"):
@@ -211,8 +212,8 @@ def _contexto_dinamico(user: dict, grade: dict) -> str:
             partes.append(f"  Turma: {info_aluno['turma_codigo']}")
 
     # Notas e faltas (do cache no banco)
-    notas = db.get_notas(user["chat_id"])
-    eh_pro = db.is_pro(user["chat_id"])
+    notas = usuario.notas
+    eh_pro = usuario.is_pro
     if notas:
         if eh_pro:
             from monitor import _calcular_simulacao
@@ -252,7 +253,7 @@ def _contexto_dinamico(user: dict, grade: dict) -> str:
                 partes.append(f"  {disc}: {notas_str} | {faltas_str}")
 
     # Matérias reprovadas / DPs (do cache no banco)
-    historico = db.get_historico(user["chat_id"])
+    historico = usuario.historico
     if historico:
         reprovados = [h for h in historico if "reprovado" in h.get("situacao", "").lower()]
         if reprovados:
@@ -313,8 +314,9 @@ def _build_grade_text(grade: dict) -> str:
     return "\n".join(linhas)
 
 
-def build_system_prompt(user: dict, grade: dict) -> str:
+def build_system_prompt(user: dict, grade: dict, usuario: ContextoUsuario | None = None) -> str:
     """Constrói system prompt personalizado por usuário."""
+    usuario = usuario or ContextoUsuario(user["chat_id"], user)
     nome = user.get("nome", "usuário")
     casa = user.get("endereco_casa") or "não informado"
     trabalho = user.get("endereco_trabalho") or ""
@@ -342,7 +344,7 @@ def build_system_prompt(user: dict, grade: dict) -> str:
     dados_usuario += f"\n- Turno: {turno}"
     dados_usuario += f"\n- Transporte: {transporte_labels.get(transporte, transporte)}"
 
-    eh_pro_user = db.is_pro(user["chat_id"])
+    eh_pro_user = usuario.is_pro
 
     if transporte == "sou" and eh_pro_user:
         regras_onibus = (
@@ -424,21 +426,21 @@ def _formatar_para_telegram(texto: str) -> str:
 
 # ── Groq (primário) ────────────────────────────────────────────────────────
 
-def _perguntar_groq(mensagem: str, chat_id: int, extra_contexto: str | None) -> str | None:
+def _perguntar_groq(mensagem: str, usuario: ContextoUsuario, extra_contexto: str | None) -> str | None:
     """Envia para Groq API (OpenAI-compatible)."""
     if not GROQ_API_KEY:
         return None
 
-    user = db.get_user(chat_id)
-    if not user:
+    if not usuario.existe:
         return None
+    chat_id, user = usuario.chat_id, usuario.user
 
-    grade = _load_grade(chat_id)
-    contexto = _contexto_dinamico(user, grade)
+    grade = _grade_por_dia(usuario.grade)
+    contexto = _contexto_dinamico(user, grade, usuario)
     if extra_contexto:
         contexto += "\n\n" + extra_contexto
 
-    system_prompt = build_system_prompt(user, grade)
+    system_prompt = build_system_prompt(user, grade, usuario)
 
     if chat_id not in _historico:
         _historico[chat_id] = []
@@ -499,21 +501,21 @@ def _perguntar_groq(mensagem: str, chat_id: int, extra_contexto: str | None) ->
 
 # ── Gemini (fallback) ──────────────────────────────────────────────────────
 
-def _perguntar_gemini(mensagem: str, chat_id: int, extra_contexto: str | None) -> str | None:
+def _perguntar_gemini(mensagem: str, usuario: ContextoUsuario, extra_contexto: str | None) -> str | None:
     """Fallback: Gemini API."""
     if not GEMINI_API_KEY:
         return None
 
-    user = db.get_user(chat_id)
-    if not user:
+    if not usuario.existe:
         return None
+    chat_id, user = usuario.chat_id, usuario.user
 
-    grade = _load_grade(chat_id)
-    contexto = _contexto_dinamico(user, grade)
+    grade = _grade_por_dia(usuario.grade)
+    contexto = _contexto_dinamico(user, grade, usuario)
     if extra_contexto:
         contexto += "\n\n" + extra_contexto
 
-    system_prompt = build_system_prompt(user, grade)
+    system_prompt = build_system_prompt(user, grade, usuario)
 
     if chat_id not in _historico:
         _historico[chat_id] = []
@@ -571,26 +573,33 @@ def _perguntar_gemini(mensagem: str, chat_id: int, extra_contexto: str | None) -
 
 # ── Interface pública ──────────────────────────────────────────────────────
 
-def perguntar(mensagem: str, chat_id: int = 0, extra_contexto: str | None = None) -> str | None:
-    """Tenta Groq primeiro, Gemini como fallback. Respeita limite Free."""
+def perguntar(mensagem: str, chat_id: int = 0, extra_contexto: str | None = None,
+              usuario: ContextoUsuario | None = None) -> str | None:
+    """Tenta Groq primeiro, Gemini como fallback. Respeita limite Free.
+
+    usuario: snapshot já carregado pelo handler (senão lê o banco uma vez aqui).
+    """
+    if usuario is None:
+        usuario = ContextoUsuario.carregar_bloqueante(chat_id) if chat_id else ContextoUsuario(0, None)
+
     # Checa limite de IA para usuários Free
     if chat_id:
         from monitor import checar_limite_ia, incrementar_ia
-        bloqueado, restantes = checar_limite_ia(chat_id)
+        bloqueado, restantes = checar_limite_ia(chat_id, eh_pro=usuario.is_pro)
         if bloqueado:
             return (
                 "⭐ Você atingiu o limite de 5 mensagens IA por dia (plano Free).\n"
                 "Use /assinar pra desbloquear IA ilimitada (R$ 9,90/mês)."
             )
 
-    resposta = _perguntar_groq(mensagem, chat_id, extra_contexto)
+    resposta = _perguntar_groq(mensagem, usuario, extra_contexto)
     if resposta:
         if chat_id:
             incrementar_ia(chat_id)
         return resposta
 
     logger.info("Groq falhou, tentando Gemini como fallback...")
-    resposta = _perguntar_gemini(mensagem, chat_id, extra_contexto)
+    resposta = _perguntar_gemini(mensagem, usuario, extra_contexto)
     if resposta and chat_id:
         incrementar_ia(chat_id)
     return resposta
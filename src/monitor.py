@@ -16,13 +16,19 @@ from dotenv import load_dotenv
 from telegram import InlineKeyboardButton, InlineKeyboardMarkup
 from telegram.ext import Application, CallbackQueryHandler, CommandHandler, ContextTypes, MessageHandler, filters
 
+import agendador
 from aulas import registrar_handlers as registrar_aulas
+import browser_pool
+import captura
 from cadastro import cadastro_handler, cmd_config, cmd_resetar, callback_resetar
+from contexto_usuario import ContextoUsuario
 import db
-from fam_scraper import FAMScraper
+import db_async
 from onibus import registrar_handlers as registrar_onibus
 import pagamento
-from storage import Storage
+import politica_verificacao
+from portal_sync import sincronizar_agendado
+from storage import storage_do_usuario
 from telegram_bot import TelegramNotifier
 
 # Configuração de logging
@@ -40,8 +46,6 @@ load_dotenv()
 
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 
-storage = Storage()
-
 TZ = ZoneInfo("America/Sao_Paulo")
 
 # Contador diário de mensagens IA para usuários Free (reset no restart)
@@ -60,18 +64,22 @@ MSG_PRO = (
 )
 
 
-async def _requer_pro(update) -> bool:
+async def _requer_pro(update, usuario: ContextoUsuario) -> bool:
     """Retorna True se o usuário NÃO é Pro (bloqueia). Envia mensagem se Free."""
-    chat_id = update.effective_chat.id
-    if db.is_pro(chat_id):
+    if usuario.is_pro:
         return False
     await update.message.reply_text(MSG_PRO)
     return True
 
 
-def checar_limite_ia(chat_id: int) -> tuple[bool, int]:
-    """Retorna (bloqueado, msgs_restantes). Free = 5/dia, Pro = ilimitado."""
-    if db.is_pro(chat_id):
+def checar_limite_ia(chat_id: int, eh_pro: bool | None = None) -> tuple[bool, int]:
+    """Retorna (bloqueado, msgs_restantes). Free = 5/dia, Pro = ilimitado.
+
+    eh_pro: já conhecido pelo chamador (ContextoUsuario) — evita reler o banco.
+    """
+    if eh_pro is None:
+        eh_pro = db.is_pro(chat_id)
+    if eh_pro:
         return False, -1  # ilimitado
 
     hoje = datetime.now(TZ).strftime("%Y-%m-%d")
@@ -100,17 +108,20 @@ def incrementar_ia(chat_id: int) -> None:
 # ── Scraping FAM ─────────────────────────────────────────────────────────────
 
 
-def _scrape_atividades(chat_id: int | None = None):
-    """Executa scraping do portal FAM (blocking — roda via run_in_executor).
+async def _scrape_atividades(chat_id: int | None = None, msg=None):
+    """Sincroniza as atividades do portal FAM no agendador de scrapes.
     Se chat_id fornecido, usa credenciais do banco. Senão, fallback pro .env.
+    Detalhes já baixados vêm do histórico do próprio usuário (storage_do_usuario).
     """
     fam_login = None
     fam_senha = None
+    sessao_chat_id = None
 
     if chat_id:
-        creds = db.get_credentials(chat_id)
+        creds = await db_async.get_credentials(chat_id)
         if creds:
             fam_login, fam_senha = creds
+            sessao_chat_id = chat_id
 
     # Fallback: .env
     if not fam_login:
@@ -121,19 +132,26 @@ def _scrape_atividades(chat_id: int | None = None):
         logger.error("Sem credenciais FAM para scraping")
         return None
 
-    scraper = FAMScraper(fam_login, fam_senha, headless=True)
-    try:
-        if not scraper.fazer_login():
-            logger.error("Falha no login do portal FAM")
-            return None
-        atividades = scraper.extrair_atividades()
-        logger.info("Atividades extraídas: %d", len(atividades))
-        return atividades
-    except Exception as e:
-        logger.error("Erro no scraping: %s", e, exc_info=True)
+    resultado = await _sincronizar(
+        sessao_chat_id, {"atividades"}, fam_login, fam_senha, msg=msg,
+        conhecidas=storage_do_usuario(chat_id).get_atividades_conhecidas(),
+    )
+    if resultado.status("atividades") not in ("ok", "vazia"):
         return None
-    finally:
-        scraper.close()
+    logger.info("Atividades extraídas: %d", len(resultado.atividades or []))
+    return resultado.atividades or []
+
+
+async def _sincronizar(chat_id, alvos, login=None, senha=None, msg=None,
+                       prioridade=agendador.INTERATIVO, **opcoes):
+    """Sync do portal no agendador (com carona em sync em andamento); se cair na fila, avisa em `msg`."""
+    async def avisar_fila(posicao, eta):
+        await msg.edit_text(f"⏳ Portal FAM ocupado — você é o {posicao}º da fila (~{eta:.0f}s)...")
+
+    return await sincronizar_agendado(
+        chat_id, alvos, login, senha, prioridade=prioridade,
+        ao_enfileirar=avisar_fila if msg else None, **opcoes,
+    )
 
 
 def _formatar_atividade(at, idx):
@@ -160,18 +178,18 @@ async def cmd_atividades(update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /atividades — consulta atividades do portal FAM."""
     chat_id = update.effective_chat.id
 
-    if not db.is_registered(chat_id):
+    usuario = await ContextoUsuario.carregar(chat_id)
+    if not usuario.registrado:
         await update.message.reply_text("Primeiro faça seu cadastro com /start 👆")
         return
 
-    if await _requer_pro(update):
+    if await _requer_pro(update, usuario):
         return
 
-    db.log_evento(chat_id, "cmd_atividades")
+    await db_async.log_evento(chat_id, "cmd_atividades")
     msg = await update.message.reply_text("🔄 Consultando portal FAM...")
 
-    loop = asyncio.get_event_loop()
-    atividades = await loop.run_in_executor(None, _scrape_atividades, chat_id)
+    atividades = await _scrape_atividades(chat_id, msg=msg)
 
     if atividades is None:
         await msg.edit_text("❌ Falha ao acessar o portal FAM.")
@@ -182,6 +200,7 @@ async def cmd_atividades(update, context: ContextTypes.DEFAULT_TYPE):
         return
 
     # Detecta novas
+    storage = storage_do_usuario(chat_id)
     novas = storage.get_novas_atividades(atividades)
     storage.atualizar_last_check()
 
@@ -205,27 +224,15 @@ async def cmd_atividades(update, context: ContextTypes.DEFAULT_TYPE):
 # ── /notas — consulta boletim ─────────────────────────────────────────────
 
 
-def _scrape_notas(chat_id: int):
-    """Blocking: faz login + extrai notas e info do aluno.
+async def _scrape_notas(chat_id: int, msg=None):
+    """Sincroniza notas e info do aluno (já gravadas no banco).
 
     Retorna (notas_list, info_dict) ou (None, None).
     """
-    creds = db.get_credentials(chat_id)
-    if not creds:
-        return None, None
-
-    fam_login, fam_senha = creds
-    scraper = FAMScraper(fam_login, fam_senha, headless=True)
-    try:
-        if not scraper.fazer_login():
-            logger.error("Falha no login ao extrair notas (cmd /notas)")
-            return None, None
-        return scraper.extrair_notas()
-    except Exception as e:
-        logger.error("Erro ao extrair notas: %s", e, exc_info=True)
+    resultado = await _sincronizar(chat_id, {"notas", "info"}, msg=msg)
+    if resultado.status("notas") not in ("ok", "vazia", "inalterada"):
         return None, None
-    finally:
-        scraper.close()
+    return resultado.notas or [], resultado.info
 
 
 def _fmt_nota(valor) -> str:
@@ -250,13 +257,14 @@ async def cmd_notas(update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /notas — consulta boletim/notas do portal FAM."""
     chat_id = update.effective_chat.id
 
-    if not db.is_registered(chat_id):
+    usuario = await ContextoUsuario.carregar(chat_id)
+    if not usuario.registrado:
         await update.message.reply_text("Primeiro faça seu cadastro com /start 👆")
         return
 
     # Free: 1x por semana
-    if not db.is_pro(chat_id):
-        ultimo = db.ultimo_evento(chat_id, "cmd_notas")
+    if not usuario.is_pro:
+        ultimo = await db_async.ultimo_evento(chat_id, "cmd_notas")
         if ultimo:
             try:
                 from zoneinfo import ZoneInfo as _ZI
@@ -273,11 +281,10 @@ async def cmd_notas(update, context: ContextTypes.DEFAULT_TYPE):
             except (ValueError, TypeError):
                 pass
 
-    db.log_evento(chat_id, "cmd_notas")
+    await db_async.log_evento(chat_id, "cmd_notas")
     msg = await update.message.reply_text("🔄 Consultando notas no portal FAM...")
 
-    loop = asyncio.get_event_loop()
-    notas, info = await loop.run_in_executor(None, _scrape_notas, chat_id)
+    notas, info = await _scrape_notas(chat_id, msg=msg)
 
     if notas is None:
         await msg.edit_text(
@@ -290,11 +297,6 @@ async def cmd_notas(update, context: ContextTypes.DEFAULT_TYPE):
         await msg.edit_text("📭 Nenhuma nota encontrada no portal.")
         return
 
-    # Salva no banco (cache)
-    db.set_notas(chat_id, notas)
-    if info:
-        db.set_info_aluno(chat_id, info)
-
     # Formata resposta
     linhas = [f"📊 *Boletim — {len(notas)} disciplinas*\n"]
 
@@ -335,21 +337,21 @@ async def cmd_faltas(update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /faltas — mostra faltas por disciplina (usa cache ou faz scrape)."""
     chat_id = update.effective_chat.id
 
-    if not db.is_registered(chat_id):
+    usuario = await ContextoUsuario.carregar(chat_id)
+    if not usuario.registrado:
         await update.message.reply_text("Primeiro faça seu cadastro com /start 👆")
         return
 
-    if await _requer_pro(update):
+    if await _requer_pro(update, usuario):
         return
 
-    db.log_evento(chat_id, "cmd_faltas")
+    await db_async.log_evento(chat_id, "cmd_faltas")
     # Tenta usar cache do banco
-    notas = db.get_notas(chat_id)
+    notas = usuario.notas
 
     if not notas:
         msg = await update.message.reply_text("🔄 Consultando faltas no portal FAM...")
-        loop = asyncio.get_event_loop()
-        notas, info = await loop.run_in_executor(None, _scrape_notas, chat_id)
+        notas, info = await _scrape_notas(chat_id, msg=msg)
 
         if notas is None:
             await msg.edit_text(
@@ -361,10 +363,6 @@ async def cmd_faltas(update, context: ContextTypes.DEFAULT_TYPE):
         if not notas:
             await msg.edit_text("📭 Nenhuma falta encontrada no portal.")
             return
-
-        db.set_notas(chat_id, notas)
-        if info:
-            db.set_info_aluno(chat_id, info)
     else:
         msg = None
 
@@ -548,15 +546,16 @@ async def cmd_simular(update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /simular — simula quanto precisa tirar pra passar."""
     chat_id = update.effective_chat.id
 
-    if not db.is_registered(chat_id):
+    usuario = await ContextoUsuario.carregar(chat_id)
+    if not usuario.registrado:
         await update.message.reply_text("Primeiro faça seu cadastro com /start 👆")
         return
 
-    if await _requer_pro(update):
+    if await _requer_pro(update, usuario):
         return
 
-    db.log_evento(chat_id, "cmd_simular")
-    notas = db.get_notas(chat_id)
+    await db_async.log_evento(chat_id, "cmd_simular")
+    notas = usuario.notas
     if not notas:
         await update.message.reply_text(
             "📭 Sem notas no cache. Use /notas primeiro pra importar do portal."
@@ -582,45 +581,27 @@ async def cmd_simular(update, context: ContextTypes.DEFAULT_TYPE):
 # ── /grade — re-sync da grade ────────────────────────────────────────────
 
 
-def _scrape_grade(chat_id: int):
-    """Blocking: faz login + extrai grade do portal. Roda via run_in_executor."""
-    creds = db.get_credentials(chat_id)
-    if not creds:
-        return None
-
-    user = db.get_user(chat_id)
-    turno = (user.get("turno") if user else None) or "noturno"
-
-    fam_login, fam_senha = creds
-    scraper = FAMScraper(fam_login, fam_senha, headless=True)
-    try:
-        if not scraper.fazer_login():
-            logger.error("Falha no login ao extrair grade (cmd /grade)")
-            return None
-        return scraper.extrair_grade(turno=turno)
-    except Exception as e:
-        logger.error("Erro ao extrair grade: %s", e, exc_info=True)
-        return None
-    finally:
-        scraper.close()
+async def _scrape_grade(chat_id: int, msg=None):
+    """Sincroniza a grade (gravada no banco se vier preenchida)."""
+    resultado = await _sincronizar(chat_id, {"grade"}, msg=msg)
+    return resultado.grade
 
 
 async def cmd_grade(update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /grade — força re-sync da grade a partir do portal."""
     chat_id = update.effective_chat.id
 
-    if not db.is_registered(chat_id):
+    usuario = await ContextoUsuario.carregar(chat_id)
+    if not usuario.registrado:
         await update.message.reply_text("Primeiro faça seu cadastro com /start 👆")
         return
 
-    db.log_evento(chat_id, "cmd_grade")
+    await db_async.log_evento(chat_id, "cmd_grade")
     msg = await update.message.reply_text("🔄 Atualizando grade a partir do portal FAM...")
 
-    loop = asyncio.get_event_loop()
-    grade = await loop.run_in_executor(None, _scrape_grade, chat_id)
+    grade = await _scrape_grade(chat_id, msg=msg)
 
     if grade and any(grade.get(str(d)) for d in range(6)):
-        db.set_grade(chat_id, grade)
         # Conta total de matérias
         total = sum(len(v) for v in grade.values())
         await msg.edit_text(
@@ -637,42 +618,28 @@ async def cmd_grade(update, context: ContextTypes.DEFAULT_TYPE):
 # ── /dp — matérias reprovadas (dependências) ──────────────────────────────
 
 
-def _scrape_historico(chat_id: int):
-    """Blocking: faz login + extrai histórico do portal. Roda via run_in_executor."""
-    creds = db.get_credentials(chat_id)
-    if not creds:
-        return None
-
-    fam_login, fam_senha = creds
-    scraper = FAMScraper(fam_login, fam_senha, headless=True)
-    try:
-        if not scraper.fazer_login():
-            logger.error("Falha no login ao extrair histórico (cmd /dp)")
-            return None
-        return scraper.extrair_historico()
-    except Exception as e:
-        logger.error("Erro ao extrair histórico: %s", e, exc_info=True)
-        return None
-    finally:
-        scraper.close()
+async def _scrape_historico(chat_id: int, msg=None):
+    """Sincroniza o histórico (gravado no banco) no agendador de scrapes."""
+    resultado = await _sincronizar(chat_id, {"historico"}, msg=msg)
+    return resultado.historico
 
 
 async def cmd_dp(update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /dp — mostra matérias reprovadas (dependências)."""
     chat_id = update.effective_chat.id
 
-    if not db.is_registered(chat_id):
+    usuario = await ContextoUsuario.carregar(chat_id)
+    if not usuario.registrado:
         await update.message.reply_text("Primeiro faça seu cadastro com /start 👆")
         return
 
-    if await _requer_pro(update):
+    if await _requer_pro(update, usuario):
         return
 
-    db.log_evento(chat_id, "cmd_dp")
+    await db_async.log_evento(chat_id, "cmd_dp")
     msg = await update.message.reply_text("🔄 Consultando histórico no portal FAM...")
 
-    loop = asyncio.get_event_loop()
-    historico = await loop.run_in_executor(None, _scrape_historico, chat_id)
+    historico = await _scrape_historico(chat_id, msg=msg)
 
     if historico is None:
         await msg.edit_text(
@@ -681,9 +648,6 @@ async def cmd_dp(update, context: ContextTypes.DEFAULT_TYPE):
         )
         return
 
-    # Salva no banco
-    db.set_historico(chat_id, historico)
-
     # Filtra reprovados
     reprovados = [h for h in historico if "reprovado" in h.get("situacao", "").lower()]
 
@@ -719,7 +683,7 @@ _aguardando_texto: dict[int, str] = {}
 async def cmd_suporte(update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /suporte — envia mensagem pro suporte."""
     chat_id = update.effective_chat.id
-    db.log_evento(chat_id, "cmd_suporte")
+    await db_async.log_evento(chat_id, "cmd_suporte")
     _aguardando_texto[chat_id] = "suporte"
 
     await update.message.reply_text(
@@ -733,7 +697,7 @@ async def cmd_suporte(update, context: ContextTypes.DEFAULT_TYPE):
 async def cmd_sugestoes(update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /sugestoes — envia sugestão de funcionalidade."""
     chat_id = update.effective_chat.id
-    db.log_evento(chat_id, "cmd_sugestoes")
+    await db_async.log_evento(chat_id, "cmd_sugestoes")
     _aguardando_texto[chat_id] = "sugestao"
 
     await update.message.reply_text(
@@ -755,11 +719,11 @@ async def receber_texto_suporte_sugestao(update, context: ContextTypes.DEFAULT_T
     texto = update.message.text.strip()
     del _aguardando_texto[chat_id]
 
-    user = db.get_user(chat_id)
+    user = await db_async.get_user(chat_id)
     nome = user["nome"] if user else "Desconhecido"
 
     if tipo == "suporte":
-        db.salvar_suporte(chat_id, texto)
+        await db_async.salvar_suporte(chat_id, texto)
         await update.message.reply_text("✅ Mensagem enviada pro suporte! Vamos responder em breve.")
 
         # Notifica admin
@@ -769,7 +733,7 @@ async def receber_texto_suporte_sugestao(update, context: ContextTypes.DEFAULT_T
             parse_mode="Markdown",
         )
     else:
-        db.salvar_sugestao(chat_id, texto)
+        await db_async.salvar_sugestao(chat_id, texto)
         await update.message.reply_text("✅ Sugestão enviada! Valeu pela contribuição.")
 
         # Notifica admin
@@ -794,7 +758,7 @@ async def cmd_stats(update, context: ContextTypes.DEFAULT_TYPE):
         await update.message.reply_text("🔒 Comando restrito ao administrador.")
         return
 
-    stats = db.get_stats()
+    stats = await db_async.get_stats()
 
     linhas = [
         "📊 *Analytics do FAMus*\n",
@@ -817,6 +781,14 @@ async def cmd_stats(update, context: ContextTypes.DEFAULT_TYPE):
         for tipo, cnt in top:
             linhas.append(f"  {tipo}: {cnt}")
 
+    cache = db.estatisticas_cache_usuarios()
+    linhas += [
+        "",
+        "*Cache de usuários:*",
+        f"  🎯 Acertos: {cache['hits']} / {cache['hits'] + cache['misses']} ({cache['taxa_acerto']:.0%})",
+        f"  📦 Em memória: {cache['tamanho']}/{cache['max']} (TTL {cache['ttl_s']:.0f}s)",
+    ]
+
     texto = "\n".join(linhas)
     await update.message.reply_text(texto, parse_mode="Markdown")
 
@@ -826,29 +798,60 @@ async def cmd_stats(update, context: ContextTypes.DEFAULT_TYPE):
 #
 # COMO FUNCIONA:
 #   1. job_verificar_atualizacoes() é agendado no main() via JobQueue (APScheduler)
-#      - Roda a cada 2 horas (interval=7200), primeiro check após 60s do boot
-#   2. Para cada usuário registrado:
-#      a. _check_notas_usuario() faz scrape do portal FAM (blocking, via executor)
+#      - Roda a cada JOB_TICK_S (60s) e pega só os usuários cuja vez chegou
+#        (coluna proxima_verificacao no banco, até JOB_MAX_POR_TICK por tick)
+#      - O intervalo de cada usuário é adaptativo (politica_verificacao.py):
+#        mais curto após mudança recente, pós-aula e em semana de provas, mais
+#        longo em férias e para quem nunca muda; nada agendado de madrugada
+#      - A agenda fica no banco: um restart retoma de onde parou em vez de
+#        varrer todo mundo de novo
+#      - Usuário nunca agendado só ganha um horário espalhado no intervalo base
+#        (agendador.proximo_horario), sem ser verificado na hora
+#   2. Para cada usuário Pro da vez, até JOB_CONCORRENCIA em paralelo:
+#      a. _check_notas_usuario() sincroniza com o portal FAM no agendador, com
+#         prioridade de fundo — comandos interativos passam na frente; um /notas
+#         do mesmo usuário durante o scrape pega carona sem ocupar worker
 #      b. Compara notas novas com o cache salvo no banco (db.get_notas)
-#      c. Atualiza cache no banco SEMPRE (mesmo sem mudanças)
+#      c. Página com o mesmo hash da última sync (impressao_pagina) não é
+#         parseada nem regravada — o cache do banco vale como resultado;
+#         página alterada é parseada e gravada no banco
 #      d. Retorna (mudancas_notas, mudancas_faltas) ou None
 #   3. Se houver mudanças, envia notificações separadas (notas e faltas)
-#   4. Sleep de 5s entre usuários para não sobrecarregar portal/VPS
+#   4. Limite global de JOB_SYNCS_POR_MIN usuários/minuto no portal e timeout
+#      de JOB_TIMEOUT_USUARIO s por usuário — contado só durante o scrape (não
+#      na fila do agendador) e repassado como prazo às requests HTTP e esperas
+#      do Chrome; estourado, o scrape para na próxima página; progresso a cada
+#      ~10% no log
 #
 # COMPORTAMENTO DE SEGURANÇA:
 #   - Se o cache estiver vazio (primeiro scrape), popula sem notificar
-#   - Se o scrape falhar, loga o erro e continua pro próximo usuário
-#   - Nunca roda scrape em paralelo (sequencial por design)
+#   - Se o scrape falhar ou estourar o timeout, loga e continua pro próximo usuário
+#   - Paralelismo real limitado pelos workers de fundo do agendador
+#     (FAM_SCRAPE_WORKERS - FAM_SCRAPE_RESERVA_INTERATIVA)
 #
 # PARA DESATIVAR EM EMERGÊNCIA:
-#   Comentar as 3 linhas do run_repeating no main() e reiniciar o serviço:
+#   Comentar as 3 linhas do run_repeating(job_verificar_atualizacoes, ...) no
+#   main() e reiniciar o serviço:
 #     sudo systemctl restart famus
 #
-# PARA FORÇAR EXECUÇÃO MANUAL (debug):
-#   Alterar first=5 no run_repeating e reiniciar — roda em 5 segundos
+# PARA FORÇAR EXECUÇÃO MANUAL (debug) — vale no próximo tick:
+#   cd src && python -c "import db, datetime; db.set_proxima_verificacao(<chat_id>, datetime.datetime(2000, 1, 1))"
 #
 
 
+JOB_TICK_S = int(os.getenv("FAM_JOB_TICK_S", "60"))
+JOB_MAX_POR_TICK = int(os.getenv("FAM_JOB_MAX_POR_TICK", "20"))
+# Padrão: um usuário por worker de fundo do agendador — mais que isso só espera na fila
+# (mesma conta de AgendadorScrape.limite_fundo, sem criar o agendador no import)
+JOB_CONCORRENCIA = int(os.getenv("FAM_JOB_CONCORRENCIA") or 0) or max(
+    1, agendador.WORKERS - max(0, agendador.RESERVA_INTERATIVA)
+)
+JOB_SYNCS_POR_MIN = float(os.getenv("FAM_JOB_SYNCS_POR_MIN", "30"))
+JOB_TIMEOUT_USUARIO = float(os.getenv("FAM_JOB_TIMEOUT_USUARIO", "180"))
+
+_limite_portal = agendador.LimiteTaxa(JOB_SYNCS_POR_MIN, rajada=JOB_CONCORRENCIA)
+_job_lock = asyncio.Lock()
+
 _CAMPOS_NOTA = ["n1", "n2", "n3", "media_semestral", "media_final"]
 _LABEL_CAMPO = {
     "n1": "N1",
@@ -919,51 +922,35 @@ def _formatar_notificacao_faltas(mudancas: list[dict]) -> str:
     return "\n".join(linhas)
 
 
-def _check_notas_usuario(chat_id: int) -> tuple[list[dict], list[dict]] | None:
-    """Blocking: faz scrape de notas + histórico de um usuário e compara com cache.
+async def _check_notas_usuario(chat_id: int) -> tuple[list[dict], list[dict]] | None:
+    """Sync de notas + histórico de um usuário (prioridade de fundo) e compara com cache.
 
     Retorna (mudancas_notas, mudancas_faltas) ou None se erro/primeira vez.
     Atualiza o cache no banco independentemente.
     Aproveita a mesma sessão para atualizar o histórico (DPs).
+    Página com o mesmo hash da última vez não é parseada nem comparada.
     """
-    creds = db.get_credentials(chat_id)
-    if not creds:
+    # Cache anterior para comparar (a sync já grava as notas novas)
+    notas_antigas = await db_async.get_notas(chat_id)
+
+    resultado = await _sincronizar(chat_id, {"notas", "info", "historico"}, prioridade=agendador.FUNDO,
+                                   pular_inalteradas=True, timeout_s=JOB_TIMEOUT_USUARIO)
+    if resultado.prazo_esgotado and resultado.status("notas") not in ("ok", "inalterada"):
+        raise TimeoutError(f"sync passou de {JOB_TIMEOUT_USUARIO:.0f}s")
+    if not resultado.login_ok:
+        logger.warning("Job notas: falha login para chat_id=%d", chat_id)
         return None
-
-    fam_login, fam_senha = creds
-    scraper = FAMScraper(fam_login, fam_senha, headless=True)
-    try:
-        if not scraper.fazer_login():
-            logger.warning("Job notas: falha login para chat_id=%d", chat_id)
-            return None
-        notas_novas, info = scraper.extrair_notas()
-
-        # Aproveita sessão pra atualizar histórico
-        try:
-            historico = scraper.extrair_historico()
-            if historico:
-                db.set_historico(chat_id, historico)
-                logger.info("Job notas: histórico atualizado para chat_id=%d (%d disciplinas).",
-                            chat_id, len(historico))
-        except Exception as e:
-            logger.warning("Job notas: erro ao extrair histórico chat_id=%d: %s", chat_id, e)
-    except Exception as e:
-        logger.error("Job notas: erro scrape chat_id=%d: %s", chat_id, e, exc_info=True)
+    if resultado.status("historico") == "ok":
+        logger.info("Job notas: histórico atualizado para chat_id=%d (%d disciplinas).",
+                    chat_id, len(resultado.historico))
+    if resultado.status("notas") == "inalterada":
+        logger.info("Job notas: notas inalteradas para chat_id=%d (hash igual).", chat_id)
         return None
-    finally:
-        scraper.close()
 
+    notas_novas = resultado.notas
     if not notas_novas:
         return None
 
-    # Compara com cache
-    notas_antigas = db.get_notas(chat_id)
-
-    # Atualiza cache sempre
-    db.set_notas(chat_id, notas_novas)
-    if info:
-        db.set_info_aluno(chat_id, info)
-
     # Não notifica se cache estava vazio (primeira vez)
     if not notas_antigas:
         logger.info("Job notas: cache vazio para chat_id=%d, populando sem notificar.", chat_id)
@@ -972,52 +959,83 @@ def _check_notas_usuario(chat_id: int) -> tuple[list[dict], list[dict]] | None:
     mudancas_notas, mudancas_faltas = _comparar_notas(notas_antigas, notas_novas)
     if not mudancas_notas and not mudancas_faltas:
         return None
+    # Histórico por disciplina: a política de verificação aprende a taxa de mudança
+    await db_async.registrar_mudancas(chat_id, [m["disciplina"] for m in mudancas_notas],
+                                      [m["disciplina"] for m in mudancas_faltas])
     return mudancas_notas, mudancas_faltas
 
 
-async def job_verificar_atualizacoes(context: ContextTypes.DEFAULT_TYPE):
-    """Job periódico: verifica notas de todos os usuários registrados."""
-    logger.info("Job notas: iniciando verificação periódica...")
-    usuarios = db.get_all_registered_users()
-    logger.info("Job notas: %d usuários registrados para verificar.", len(usuarios))
+async def _agendar_proxima(chat_id: int, agora: datetime) -> None:
+    """Grava a próxima verificação do usuário segundo a política adaptativa."""
+    proxima, motivos = politica_verificacao.proxima_verificacao(
+        chat_id, agora, await db_async.get_grade(chat_id),
+        await db_async.get_mudancas(chat_id, politica_verificacao.HISTORICO_DIAS),
+    )
+    await db_async.set_proxima_verificacao(chat_id, proxima)
+    logger.debug("Job notas: chat_id=%d volta %s (%s)", chat_id, proxima.strftime("%d/%m %H:%M"),
+                 ", ".join(motivos) or "intervalo base")
 
-    for user in usuarios:
-        chat_id = user["chat_id"]
 
-        # Notificações automáticas são exclusivas Pro
-        if not db.is_pro(chat_id):
-            logger.debug("Job notas: pulando chat_id=%d (plano Free).", chat_id)
-            continue
+async def _verificar_usuario(context: ContextTypes.DEFAULT_TYPE, chat_id: int):
+    """Scrape + notificações de um usuário (uma unidade do job periódico)."""
+    # Comandos esperando worker: o job segura o próximo usuário
+    while agendador.get_agendador().deve_ceder():
+        await asyncio.sleep(1)
 
-        try:
-            loop = asyncio.get_event_loop()
-            resultado = await loop.run_in_executor(None, _check_notas_usuario, chat_id)
+    resultado = await _check_notas_usuario(chat_id)
+    if not resultado:
+        return
+    mudancas_notas, mudancas_faltas = resultado
+    # Mudança agora: reagenda já considerando ela (volta bem mais cedo)
+    await _agendar_proxima(chat_id, datetime.now(TZ))
 
-            if resultado:
-                mudancas_notas, mudancas_faltas = resultado
+    if mudancas_notas:
+        texto = _formatar_notificacao_nota(mudancas_notas)
+        await context.bot.send_message(chat_id=chat_id, text=texto, parse_mode="Markdown")
+        logger.info("Job notas: notificação de notas para chat_id=%d (%d disciplinas).",
+                    chat_id, len(mudancas_notas))
 
-                if mudancas_notas:
-                    texto = _formatar_notificacao_nota(mudancas_notas)
-                    await context.bot.send_message(
-                        chat_id=chat_id, text=texto, parse_mode="Markdown"
-                    )
-                    logger.info("Job notas: notificação de notas para chat_id=%d (%d disciplinas).",
-                                chat_id, len(mudancas_notas))
+    if mudancas_faltas:
+        texto = _formatar_notificacao_faltas(mudancas_faltas)
+        await context.bot.send_message(chat_id=chat_id, text=texto, parse_mode="Markdown")
+        logger.info("Job notas: notificação de faltas para chat_id=%d (%d disciplinas).",
+                    chat_id, len(mudancas_faltas))
 
-                if mudancas_faltas:
-                    texto = _formatar_notificacao_faltas(mudancas_faltas)
-                    await context.bot.send_message(
-                        chat_id=chat_id, text=texto, parse_mode="Markdown"
-                    )
-                    logger.info("Job notas: notificação de faltas para chat_id=%d (%d disciplinas).",
-                                chat_id, len(mudancas_faltas))
-        except Exception as e:
-            logger.error("Job notas: erro ao processar chat_id=%d: %s", chat_id, e, exc_info=True)
 
-        # Sleep entre usuários para não sobrecarregar o portal
-        await asyncio.sleep(5)
+async def job_verificar_atualizacoes(context: ContextTypes.DEFAULT_TYPE):
+    """Job (a cada JOB_TICK_S): verifica os usuários Pro cujo horário chegou."""
+    if _job_lock.locked():
+        logger.info("Job notas: tick anterior ainda em andamento, pulando.")
+        return
+
+    async with _job_lock:
+        agora = datetime.now(TZ)
+        # Notificações automáticas são exclusivas Pro: o filtro fica no SQL
+        devidos, novos = [], []
+        async for user in db_async.iter_verificacoes_vencidas(agora, JOB_MAX_POR_TICK, apenas_pro=True):
+            (novos if user["proxima_verificacao"] is None else devidos).append(user["chat_id"])
+
+        for chat_id in novos:
+            await db_async.set_proxima_verificacao(chat_id, agendador.proximo_horario(
+                chat_id, agora, politica_verificacao.INTERVALO_BASE_S))
+        # Reagenda antes de rodar: restart no meio não repete o usuário
+        for chat_id in devidos:
+            await _agendar_proxima(chat_id, agora)
+        if novos:
+            logger.info("Job notas: %d usuário(s) entraram na rotação.", len(novos))
+        if not devidos:
+            return
 
-    logger.info("Job notas: verificação concluída.")
+        logger.info("Job notas: %d usuário(s) Pro na vez (concorrência %d).", len(devidos), JOB_CONCORRENCIA)
+        stats = await agendador.processar_lote(
+            devidos,
+            lambda chat_id: _verificar_usuario(context, chat_id),
+            concorrencia=JOB_CONCORRENCIA,
+            limite=_limite_portal,
+            nome="Job notas",
+        )
+        logger.info("Job notas: tick concluído — %d usuários em %.0fs (%d erro(s), %d timeout(s)).",
+                    stats["feitos"], stats["segundos"], stats["erros"], stats["timeouts"])
 
 
 # ── /assinar — assinatura Pro ─────────────────────────────────────────────
@@ -1027,15 +1045,16 @@ async def cmd_assinar(update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /assinar — mostra opções de pagamento Pro."""
     chat_id = update.effective_chat.id
 
-    if not db.is_registered(chat_id):
+    usuario = await ContextoUsuario.carregar(chat_id)
+    if not usuario.registrado:
         await update.message.reply_text("Primeiro faça seu cadastro com /start 👆")
         return
 
-    db.log_evento(chat_id, "cmd_assinar")
+    await db_async.log_evento(chat_id, "cmd_assinar")
 
     # Já é Pro?
-    if db.is_pro(chat_id):
-        info = db.get_plano(chat_id)
+    if usuario.is_pro:
+        info = usuario.plano
         expira = info.get("plano_expira", "")
         try:
             dt = datetime.fromisoformat(expira)
@@ -1086,7 +1105,7 @@ async def callback_assinar_pix(update, context: ContextTypes.DEFAULT_TYPE):
     init_point = pref["init_point"]
 
     # Salva no banco
-    db.criar_pagamento(chat_id, "pix", preference_id, pagamento.VALOR_PRO)
+    await db_async.criar_pagamento(chat_id, "pix", preference_id, pagamento.VALOR_PRO)
 
     keyboard = InlineKeyboardMarkup([
         [InlineKeyboardButton("💳 Pagar R$ 9,90", url=init_point)],
@@ -1134,9 +1153,9 @@ async def _job_poll_pagamento(context: ContextTypes.DEFAULT_TYPE):
 
     if resultado and resultado["status"] == "approved":
         job.schedule_removal()
-        db.atualizar_pagamento(preference_id, "approved")
+        await db_async.atualizar_pagamento(preference_id, "approved")
         expira = (datetime.now(TZ) + timedelta(days=30)).isoformat()
-        db.set_plano(chat_id, "pro", expira)
+        await db_async.set_plano(chat_id, "pro", expira)
         await context.bot.send_message(
             chat_id=chat_id,
             text="✅ Pagamento confirmado! Plano Pro ativado por 30 dias.",
@@ -1191,7 +1210,7 @@ async def receber_email_assinatura(update, context: ContextTypes.DEFAULT_TYPE):
     init_point = sub["init_point"]
 
     # Salva no banco
-    db.criar_pagamento(chat_id, "subscription", subscription_id, pagamento.VALOR_PRO)
+    await db_async.criar_pagamento(chat_id, "subscription", subscription_id, pagamento.VALOR_PRO)
 
     keyboard = InlineKeyboardMarkup([
         [InlineKeyboardButton("💳 Completar pagamento", url=init_point)],
@@ -1212,12 +1231,13 @@ async def cmd_plano(update, context: ContextTypes.DEFAULT_TYPE):
     """Comando /plano — mostra plano atual."""
     chat_id = update.effective_chat.id
 
-    if not db.is_registered(chat_id):
+    usuario = await ContextoUsuario.carregar(chat_id)
+    if not usuario.registrado:
         await update.message.reply_text("Primeiro faça seu cadastro com /start 👆")
         return
 
-    db.log_evento(chat_id, "cmd_plano")
-    info = db.get_plano(chat_id)
+    await db_async.log_evento(chat_id, "cmd_plano")
+    info = usuario.plano
 
     if not info:
         await update.message.reply_text("Use /start pra se cadastrar primeiro.")
@@ -1257,7 +1277,7 @@ async def cmd_plano(update, context: ContextTypes.DEFAULT_TYPE):
     botoes = []
 
     # Checa se tem subscription ativa
-    pag = db.get_pagamento_por_chat(chat_id, "subscription")
+    pag = await db_async.get_pagamento_por_chat(chat_id, "subscription")
     if pag and pag["status"] in ("pending", "approved"):
         linhas.append(f"\nAssinatura recorrente ativa")
         botoes.append([InlineKeyboardButton("❌ Cancelar assinatura", callback_data=f"cancelar_sub_{pag['mp_id']}")])
@@ -1279,7 +1299,7 @@ async def callback_cancelar_sub(update, context: ContextTypes.DEFAULT_TYPE):
     ok = await loop.run_in_executor(None, pagamento.cancelar_assinatura, sub_id)
 
     if ok:
-        db.atualizar_pagamento(sub_id, "cancelled")
+        await db_async.atualizar_pagamento(sub_id, "cancelled")
         await query.edit_message_text("✅ Assinatura cancelada. Seu Pro fica ativo até a data de expiração.")
     else:
         await query.edit_message_text("❌ Erro ao cancelar. Tente novamente ou entre em contato.")
@@ -1292,15 +1312,15 @@ async def callback_cancelar_plano(update, context: ContextTypes.DEFAULT_TYPE):
     chat_id = query.message.chat_id
 
     # Cancela subscription no MP se existir (para de cobrar)
-    pag = db.get_pagamento_por_chat(chat_id, "subscription")
+    pag = await db_async.get_pagamento_por_chat(chat_id, "subscription")
     if pag and pag["status"] in ("pending", "approved"):
         loop = asyncio.get_event_loop()
         await loop.run_in_executor(None, pagamento.cancelar_assinatura, pag["mp_id"])
-        db.atualizar_pagamento(pag["mp_id"], "cancelled")
+        await db_async.atualizar_pagamento(pag["mp_id"], "cancelled")
 
     # NÃO faz downgrade imediato — mantém Pro até expirar
     # O job de expiração vai fazer o downgrade quando plano_expira passar
-    info = db.get_plano(chat_id)
+    info = await db_async.get_plano(chat_id)
     expira = (info or {}).get("plano_expira", "")
     try:
         dt = datetime.fromisoformat(expira)
@@ -1324,13 +1344,13 @@ async def callback_cancelar_plano(update, context: ContextTypes.DEFAULT_TYPE):
 async def job_verificar_expiracoes(context: ContextTypes.DEFAULT_TYPE):
     """Job periódico: verifica planos expirados e renova se tem subscription ativa."""
     logger.info("Job expiração: verificando planos expirados...")
-    expirados = db.get_usuarios_pro_expirados()
+    expirados = await db_async.get_usuarios_pro_expirados()
 
     for user in expirados:
         chat_id = user["chat_id"]
         try:
             # Checa se tem subscription ativa no MP
-            pag = db.get_pagamento_por_chat(chat_id, "subscription")
+            pag = await db_async.get_pagamento_por_chat(chat_id, "subscription")
             if pag and pag["status"] in ("pending", "approved"):
                 sub_id = pag["mp_id"]
                 loop = asyncio.get_event_loop()
@@ -1339,13 +1359,13 @@ async def job_verificar_expiracoes(context: ContextTypes.DEFAULT_TYPE):
                 if status_info and status_info["status"] == "authorized":
                     # Renova por mais 30 dias
                     nova_expira = (datetime.now(TZ) + timedelta(days=30)).isoformat()
-                    db.set_plano(chat_id, "pro", nova_expira)
-                    db.atualizar_pagamento(sub_id, "approved")
+                    await db_async.set_plano(chat_id, "pro", nova_expira)
+                    await db_async.atualizar_pagamento(sub_id, "approved")
                     logger.info("Job expiração: renovado chat_id=%d por +30d", chat_id)
                     continue
 
             # Sem subscription ativa → downgrade
-            db.set_plano(chat_id, "free", None)
+            await db_async.set_plano(chat_id, "free", None)
             await context.bot.send_message(
                 chat_id=chat_id,
                 text=(
@@ -1367,16 +1387,7 @@ async def job_verificar_expiracoes(context: ContextTypes.DEFAULT_TYPE):
 async def job_verificar_assinaturas(context: ContextTypes.DEFAULT_TYPE):
     """Job periódico: checa se assinaturas pendentes foram autorizadas."""
     logger.info("Job assinaturas: verificando pendentes...")
-    con = db._conn()
-    try:
-        rows = con.execute(
-            "SELECT * FROM pagamentos WHERE tipo = 'subscription' AND status = 'pending'"
-        ).fetchall()
-    finally:
-        con.close()
-
-    for row in rows:
-        pag = dict(row)
+    for pag in await db_async.get_assinaturas_pendentes():
         chat_id = pag["chat_id"]
         sub_id = pag["mp_id"]
 
@@ -1385,9 +1396,9 @@ async def job_verificar_assinaturas(context: ContextTypes.DEFAULT_TYPE):
             status_info = await loop.run_in_executor(None, pagamento.checar_assinatura, sub_id)
 
             if status_info and status_info["status"] == "authorized":
-                db.atualizar_pagamento(sub_id, "approved")
+                await db_async.atualizar_pagamento(sub_id, "approved")
                 expira = (datetime.now(TZ) + timedelta(days=30)).isoformat()
-                db.set_plano(chat_id, "pro", expira)
+                await db_async.set_plano(chat_id, "pro", expira)
                 await context.bot.send_message(
                     chat_id=chat_id,
                     text="✅ Assinatura confirmada! Plano Pro ativado por 30 dias.",
@@ -1402,11 +1413,31 @@ async def job_verificar_assinaturas(context: ContextTypes.DEFAULT_TYPE):
 # ── Main ─────────────────────────────────────────────────────────────────────
 
 
+async def _ao_iniciar(app: Application):
+    """post_init: pré-aquece o pool de Chrome sem travar o boot."""
+    loop = asyncio.get_event_loop()
+    loop.run_in_executor(None, browser_pool.get_pool().aquecer)
+
+
+async def _ao_encerrar(app: Application):
+    """post_shutdown: para o agendador, libera os Chromes do pool, grava capturas pendentes e fecha o banco."""
+    agendador.get_agendador().encerrar()
+    browser_pool.get_pool().encerrar()
+    captura.encerrar()
+    db_async.encerrar()
+
+
 def main():
     # Inicializa banco de dados (cria tabelas + seed do Pedro)
     db.init_db()
 
-    app = Application.builder().token(TELEGRAM_TOKEN).build()
+    app = (
+        Application.builder()
+        .token(TELEGRAM_TOKEN)
+        .post_init(_ao_iniciar)
+        .post_shutdown(_ao_encerrar)
+        .build()
+    )
 
     # IMPORTANTE: ConversationHandler de cadastro PRIMEIRO (tem prioridade no /start)
     app.add_handler(cadastro_handler)
@@ -1452,11 +1483,12 @@ def main():
         group=2,
     )
 
-    # Job periódico: verificar notas a cada 2 horas (primeiro check após 60s)
+    # Job periódico: cada usuário verificado no seu horário (intervalo adaptativo, tick de 60s)
     app.job_queue.run_repeating(
-        job_verificar_atualizacoes, interval=7200, first=60, name="verificar_atualizacoes"
+        job_verificar_atualizacoes, interval=JOB_TICK_S, first=60, name="verificar_atualizacoes"
     )
-    logger.info("Job 'verificar_atualizacoes' agendado (intervalo=2h, first=60s)")
+    logger.info("Job 'verificar_atualizacoes' agendado (tick=%ds, intervalo base=%ds)",
+                JOB_TICK_S, politica_verificacao.INTERVALO_BASE_S)
 
     # Job: verificar expiração de planos a cada 1 hora
     app.job_queue.run_repeating(
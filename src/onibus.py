@@ -18,7 +18,8 @@ from telegram.ext import (
     filters,
 )
 
-import db
+from contexto_usuario import ContextoUsuario
+import db_async
 
 TZ = ZoneInfo("America/Sao_Paulo")
 
@@ -418,10 +419,10 @@ async def cmd_start(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     só é atingido se o ConversationHandler não capturou (i.e., user já cadastrado).
     """
     chat_id = update.effective_chat.id
-    user = db.get_user(chat_id)
+    usuario = await ContextoUsuario.carregar(chat_id)
 
-    if user and user["onboarding_completo"]:
-        nome = user["nome"]
+    if usuario.registrado:
+        nome = usuario.get("nome")
         await update.message.reply_text(
             f"🤖 Fala {nome}! Escolhe o trajeto:", reply_markup=menu_keyboard()
         )
@@ -467,9 +468,10 @@ async def cmd_help(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 
 async def cmd_onibus(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    db.log_evento(chat_id, "cmd_onibus")
+    await db_async.log_evento(chat_id, "cmd_onibus")
 
-    if not db.is_pro(chat_id):
+    usuario = await ContextoUsuario.carregar(chat_id)
+    if not usuario.is_pro:
         await update.message.reply_text(
             "⭐ Recurso exclusivo Pro!\n"
             "Use /assinar pra desbloquear (R$ 9,90/mês)\n"
@@ -477,8 +479,7 @@ async def cmd_onibus(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
         )
         return
 
-    user = db.get_user(chat_id)
-    transporte = (user or {}).get("transporte", "sou")
+    transporte = usuario.get("transporte", "sou")
     if transporte != "sou":
         transporte_labels = {"emtu": "EMTU / Intermunicipal", "carro": "Carro / Carona", "outro": "Outro"}
         label = transporte_labels.get(transporte, transporte)
@@ -496,7 +497,7 @@ async def cmd_onibus(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None
 
 async def cmd_trajeto(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
-    if not db.is_pro(chat_id):
+    if not (await ContextoUsuario.carregar(chat_id)).is_pro:
         await update.message.reply_text(
             "⭐ Recurso exclusivo Pro!\n"
             "Use /assinar pra desbloquear (R$ 9,90/mês)\n"
@@ -570,21 +571,23 @@ async def cmd_clear(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
 async def mensagem_generica(update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
     chat_id = update.effective_chat.id
     user_tg = update.effective_user
-    db.registrar_lead(chat_id, username=getattr(user_tg, 'username', None), primeiro_nome=getattr(user_tg, 'first_name', None))
+    await db_async.registrar_lead(chat_id, username=getattr(user_tg, 'username', None), primeiro_nome=getattr(user_tg, 'first_name', None))
 
     # Se estamos aguardando input especial (email, suporte, sugestão), não processar como IA
     import monitor
     if monitor._aguardando_email.get(chat_id) or monitor._aguardando_texto.get(chat_id):
         return
 
-    # Gate de cadastro: se não registrado, manda cadastrar
-    if not db.is_registered(chat_id):
+    # Gate de cadastro: se não registrado, manda cadastrar.
+    # A linha do usuário é lida uma vez aqui e repassada para IA/fallback.
+    usuario = await ContextoUsuario.carregar(chat_id)
+    if not usuario.registrado:
         await update.message.reply_text(
             "Primeiro faça seu cadastro com /start 👆"
         )
         return
 
-    db.log_evento(chat_id, "msg_ia")
+    await db_async.log_evento(chat_id, "msg_ia")
     from gemini import perguntar
     from famus import responder
 
@@ -598,8 +601,7 @@ async def mensagem_generica(update: Update, context: ContextTypes.DEFAULT_TYPE)
         loading_msg = await update.message.reply_text("🔄 Consultando portal FAM...")
         try:
             from monitor import _scrape_atividades
-            loop = asyncio.get_event_loop()
-            atividades = await loop.run_in_executor(None, _scrape_atividades, chat_id)
+            atividades = await _scrape_atividades(chat_id, msg=loading_msg)
             if atividades:
                 partes = ["ATIVIDADES DO PORTAL FAM:"]
                 for i, at in enumerate(atividades, 1):
@@ -616,7 +618,7 @@ async def mensagem_generica(update: Update, context: ContextTypes.DEFAULT_TYPE)
 
     # Gemini AI
     loop = asyncio.get_event_loop()
-    resposta = await loop.run_in_executor(None, perguntar, texto, chat_id, extra)
+    resposta = await loop.run_in_executor(None, perguntar, texto, chat_id, extra, usuario)
 
     if loading_msg:
         try:
@@ -629,7 +631,7 @@ async def mensagem_generica(update: Update, context: ContextTypes.DEFAULT_TYPE)
         return
 
     # Fallback: pattern matching (se Gemini falhar)
-    entendeu = await responder(update, context)
+    entendeu = await responder(update, context, usuario)
     if entendeu:
         return
 
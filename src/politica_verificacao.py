@@ -0,0 +1,150 @@
+"""
+Política adaptativa da verificação periódica de notas (job_verificar_atualizacoes).
+
+Em vez de todo usuário Pro a cada 2h, o intervalo de cada um é o intervalo
+base multiplicado por fatores:
+  - mudança vista nas últimas 24h          → bem mais frequente
+  - aula terminou há pouco (grade do dia)  → mais frequente
+  - semana de provas (FAM_SEMANAS_PROVA)   → mais frequente
+  - disciplinas que mudam muito / nada     → ajusta pela taxa aprendida
+  - férias/feriados (FAM_FERIAS)           → bem menos frequente
+e nada é agendado de madrugada. Se o intervalo passaria do fim da aula do
+dia, a próxima verificação fica logo depois dela. A taxa de mudança por disciplina vem do
+histórico gravado a cada diff de _comparar_notas (tabela mudancas_notas).
+"""
+
+import os
+from datetime import date, datetime, time, timedelta, timezone
+
+INTERVALO_BASE_S = int(os.getenv("FAM_JOB_INTERVALO_S", "7200"))
+INTERVALO_MIN_S = int(os.getenv("FAM_JOB_INTERVALO_MIN_S", "1800"))
+INTERVALO_MAX_S = int(os.getenv("FAM_JOB_INTERVALO_MAX_S", "43200"))
+
+# Janela sem verificações (horas locais [início, fim))
+MADRUGADA = (0, 7)
+# Depois que a aula do dia termina, professores costumam lançar notas/faltas
+JANELA_POS_AULA_H = 3
+# Verificação ancorada no fim da aula + ATRASO_POS_AULA_MIN (mais até o mesmo
+# tanto de espalhamento por usuário), antes do corte da madrugada
+ATRASO_POS_AULA_MIN = 30
+# Mudança vista há menos que isso acelera o usuário
+JANELA_MUDANCA_H = 24
+# Histórico usado para aprender a taxa de mudança por disciplina
+HISTORICO_DIAS = 60
+
+FATOR_MUDANCA_RECENTE = 0.25
+FATOR_POS_AULA = 0.5
+FATOR_PROVAS = 0.5
+FATOR_FERIAS = 4.0
+FATOR_DISCIPLINA_ATIVA = 0.75   # alguma disciplina muda ≥ 1x/semana
+FATOR_SEM_MUDANCAS = 1.5        # nada mudou em HISTORICO_DIAS
+
+
+def _periodos(texto: str) -> list[tuple[date, date]]:
+    """'AAAA-MM-DD:AAAA-MM-DD,...' → [(início, fim)] (inclusivos). Ignora itens inválidos."""
+    periodos = []
+    for item in texto.split(","):
+        inicio, _, fim = item.strip().partition(":")
+        try:
+            periodos.append((date.fromisoformat(inicio), date.fromisoformat(fim or inicio)))
+        except ValueError:
+            continue
+    return periodos
+
+
+SEMANAS_PROVA = _periodos(os.getenv("FAM_SEMANAS_PROVA", ""))
+FERIAS = _periodos(os.getenv("FAM_FERIAS", ""))
+
+
+def _em(periodos: list[tuple[date, date]], dia: date) -> bool:
+    return any(inicio <= dia <= fim for inicio, fim in periodos)
+
+
+def _quando(mudanca: dict) -> datetime:
+    """criado_em do banco (CURRENT_TIMESTAMP, UTC sem fuso) → datetime com fuso."""
+    dt = datetime.fromisoformat(mudanca["criado_em"])
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+def taxas_por_disciplina(mudancas: list[dict], agora: datetime, dias: int = HISTORICO_DIAS) -> dict[str, float]:
+    """Mudanças por semana de cada disciplina na janela de `dias`."""
+    desde = agora - timedelta(days=dias)
+    contagem: dict[str, int] = {}
+    for m in mudancas:
+        if _quando(m) >= desde:
+            contagem[m["disciplina"]] = contagem.get(m["disciplina"], 0) + 1
+    semanas = dias / 7
+    return {disc: n / semanas for disc, n in contagem.items()}
+
+
+def _fim_ultima_aula(grade: dict | None, dia: date) -> time | None:
+    """Horário de término da última aula do dia pela grade do usuário."""
+    fins = []
+    for aula in (grade or {}).get(str(dia.weekday()), []):
+        try:
+            fins.append(time.fromisoformat(aula.get("fim") or ""))
+        except ValueError:
+            continue
+    return max(fins) if fins else None
+
+
+def fator_intervalo(agora: datetime, grade: dict | None, mudancas: list[dict]) -> tuple[float, list[str]]:
+    """Multiplicador do intervalo base + motivos (para log)."""
+    fator, motivos = 1.0, []
+    hoje = agora.date()
+
+    if _em(FERIAS, hoje):
+        fator *= FATOR_FERIAS
+        motivos.append("férias")
+    if _em(SEMANAS_PROVA, hoje):
+        fator *= FATOR_PROVAS
+        motivos.append("semana de provas")
+
+    if any(agora - _quando(m) < timedelta(hours=JANELA_MUDANCA_H) for m in mudancas):
+        fator *= FATOR_MUDANCA_RECENTE
+        motivos.append("mudança recente")
+
+    fim_aula = _fim_ultima_aula(grade, hoje)
+    if fim_aula:
+        fim = datetime.combine(hoje, fim_aula, agora.tzinfo)
+        if timedelta(0) <= agora - fim < timedelta(hours=JANELA_POS_AULA_H):
+            fator *= FATOR_POS_AULA
+            motivos.append("pós-aula")
+
+    taxas = taxas_por_disciplina(mudancas, agora)
+    if taxas and max(taxas.values()) >= 1:
+        fator *= FATOR_DISCIPLINA_ATIVA
+        motivos.append(f"{max(taxas, key=taxas.get)} muda {max(taxas.values()):.1f}x/semana")
+    elif not taxas:
+        fator *= FATOR_SEM_MUDANCAS
+        motivos.append(f"nada mudou em {HISTORICO_DIAS} dias")
+
+    return fator, motivos
+
+
+def proxima_verificacao(chat_id: int, agora: datetime, grade: dict | None,
+                        mudancas: list[dict]) -> tuple[datetime, list[str]]:
+    """Quando verificar o usuário de novo. `agora` deve ter fuso (horário local)."""
+    fator, motivos = fator_intervalo(agora, grade, mudancas)
+    intervalo = min(INTERVALO_MAX_S, max(INTERVALO_MIN_S, INTERVALO_BASE_S * fator))
+    # Deslocamento fixo por usuário (até 10%) para não agrupar quem caiu no mesmo fator
+    intervalo += (chat_id * 2654435761) % max(1, int(intervalo * 0.1))
+    proxima = agora + timedelta(seconds=intervalo)
+
+    # Aula de hoje ainda não acabou (ou acabou agora): não pular o pós-aula
+    fim_aula = _fim_ultima_aula(grade, agora.date())
+    if fim_aula:
+        atraso = timedelta(minutes=ATRASO_POS_AULA_MIN)
+        pos_aula = datetime.combine(agora.date(), fim_aula, agora.tzinfo) + atraso
+        pos_aula += timedelta(seconds=(chat_id * 2654435761) % int(atraso.total_seconds()))
+        if agora < pos_aula < proxima:
+            proxima = pos_aula
+            motivos.append(f"pós-aula das {fim_aula:%H:%M}")
+
+    inicio, fim = MADRUGADA
+    if inicio <= proxima.hour < fim:
+        # Empurra para o fim da madrugada, espalhando a primeira hora do dia
+        proxima = proxima.replace(hour=fim, minute=0, second=0, microsecond=0)
+        proxima += timedelta(seconds=(chat_id * 2654435761) % 3600)
+        motivos.append("madrugada")
+    return proxima, motivos
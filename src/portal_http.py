@@ -0,0 +1,211 @@
+"""
+Cliente HTTP do portal FAM — login e leitura de páginas sem navegador.
+
+Faz o POST do formulário de login com requests.Session, mantém os cookies
+e busca as mesmas URLs pg_portal.php?frame=... que o Selenium abriria.
+O HTML devolvido alimenta os parse_*_html de fam_scraper.py.
+"""
+
+import logging
+import os
+import re
+import time
+from urllib.parse import urljoin
+
+import requests
+from bs4 import BeautifulSoup
+
+logger = logging.getLogger(__name__)
+
+# Base do portal. FAM_PORTAL_URL aponta o scraper para outro servidor
+# (ex.: o portal local de benchmarks/portal_local.py)
+PORTAL_URL = os.getenv("FAM_PORTAL_URL", "https://www.famportal.com.br/").rstrip("/") + "/"
+
+# Caminhos (relativos a PORTAL_URL) das páginas lidas pelo bot
+PAGINAS = {
+    "inicio": "fam/pg_portal.php",
+    "notas": "fam/pg_portal.php?frame=frame_alu_notas.php&slc=X&frame_notas=frame_alu_notas_resultados.php",
+    "grade": "fam/pg_portal.php?frame=frame_alu_gradealuno.php",
+    "historico": "fam/pg_portal.php?frame=frame_alu_extrato_notas.php",
+    "atividades": "fam/pg_portal.php?frame=frame_avisos.php&atividades=X",
+}
+
+# Tabela que precisa existir no HTML para a página ser considerada válida
+MARCADORES_HTML = {
+    "notas": re.compile(r"""class=["']?(?:[^"'>]*\s)?GradeNotas\b"""),
+    "grade": re.compile(r"""class=["']?(?:[^"'>]*\s)?Grade\b"""),
+    "historico": re.compile(r"""class=["']?(?:[^"'>]*\s)?Grade\b"""),
+}
+
+USER_AGENT = (
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/119.0 Safari/537.36"
+)
+
+TIMEOUT = 15
+
+# Conexões keep-alive por host (downloads paralelos dividem a mesma sessão)
+POOL_CONEXOES = 8
+
+# Bytes lidos da página inicial para validar uma sessão reaproveitada
+_PROBE_BYTES = 32 * 1024
+
+_RE_CAMPO_SENHA = re.compile(r"""name=["']?senha\b""", re.IGNORECASE)
+_RE_META_CHARSET = re.compile(rb"""<meta[^>]+charset=["']?([\w-]+)""", re.IGNORECASE)
+
+
+class PrazoEsgotado(TimeoutError):
+    """O prazo da sincronização acabou (ex.: timeout por usuário do job periódico)."""
+
+
+def tempo_restante(prazo: float | None, teto: float) -> float:
+    """Timeout de uma operação: `teto`, limitado ao que falta até `prazo` (time.monotonic()).
+
+    Levanta PrazoEsgotado se o prazo já passou.
+    """
+    if prazo is None:
+        return teto
+    falta = prazo - time.monotonic()
+    if falta <= 0:
+        raise PrazoEsgotado(f"prazo esgotado há {-falta:.1f}s")
+    return min(teto, falta)
+
+
+class SessaoExpirada(Exception):
+    """O portal devolveu o formulário de login no lugar da página pedida."""
+
+
+def url_pagina(pagina: str) -> str:
+    """URL absoluta de uma página do portal ("notas", "grade", ...)."""
+    return urljoin(PORTAL_URL, PAGINAS[pagina])
+
+
+def eh_pagina_login(html: str) -> bool:
+    """True se o HTML contém o formulário de login (campo senha)."""
+    return bool(_RE_CAMPO_SENHA.search(html))
+
+
+def _decodificar(resp: requests.Response) -> str:
+    """Decodifica a resposta respeitando o charset do header ou da <meta>."""
+    if "charset" in resp.headers.get("Content-Type", "").lower():
+        return resp.text
+    match = _RE_META_CHARSET.search(resp.content[:4096])
+    encoding = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return resp.content.decode(encoding, errors="replace")
+    except LookupError:
+        return resp.content.decode("utf-8", errors="replace")
+
+
+def _formulario_login(html: str) -> tuple[str, dict] | None:
+    """Localiza o <form> de login e retorna (action, campos_hidden) ou None."""
+    soup = BeautifulSoup(html, "html.parser")
+    campo_senha = soup.find("input", attrs={"name": "senha"})
+    form = campo_senha.find_parent("form") if campo_senha else None
+    if form is None:
+        return None
+
+    campos = {}
+    for tag in form.find_all(["input", "button"]):
+        nome = tag.get("name")
+        if not nome:
+            continue
+        tipo = (tag.get("type") or "").lower()
+        # Botões só entram se forem o "login" (o portal checa esse campo)
+        if tag.name == "button" or tipo in ("submit", "button", "image"):
+            if nome != "login":
+                continue
+        campos[nome] = tag.get("value") or ""
+
+    campos.setdefault("login", "")
+    return form.get("action") or "", campos
+
+
+class PortalHTTP:
+    """Sessão autenticada no portal FAM via requests (sem Chrome)."""
+
+    def __init__(self, login, senha, timeout=TIMEOUT, prazo: float | None = None):
+        self.login = login
+        self.senha = senha
+        self.timeout = timeout
+        # Fim (time.monotonic()) da sincronização: cada request espera no máximo o que falta
+        self.prazo = prazo
+        self.session = requests.Session()
+        self.session.headers["User-Agent"] = USER_AGENT
+        adaptador = requests.adapters.HTTPAdapter(pool_maxsize=POOL_CONEXOES)
+        self.session.mount("https://", adaptador)
+        self.session.mount("http://", adaptador)
+
+    def fazer_login(self) -> bool:
+        """POST do formulário de login. Retorna True se o portal aceitou.
+
+        Levanta requests.RequestException em erro de rede e ValueError se o
+        formulário de login não for encontrado (layout mudou).
+        """
+        resp = self.session.get(PORTAL_URL, timeout=tempo_restante(self.prazo, self.timeout))
+        resp.raise_for_status()
+
+        form = _formulario_login(_decodificar(resp))
+        if form is None:
+            raise ValueError("Formulário de login não encontrado na página inicial")
+        action, campos = form
+        campos["user"] = self.login
+        campos["senha"] = self.senha
+
+        resp = self.session.post(urljoin(resp.url, action), data=campos, timeout=tempo_restante(self.prazo, self.timeout))
+        resp.raise_for_status()
+
+        if eh_pagina_login(_decodificar(resp)):
+            logger.error("Login HTTP falhou - portal devolveu o formulário")
+            return False
+        logger.info("Login HTTP realizado com sucesso")
+        return True
+
+    def obter_html(self, pagina: str) -> str:
+        """GET de uma página do portal. Levanta SessaoExpirada se deslogado."""
+        return self.obter_url(url_pagina(pagina))
+
+    def obter_url(self, url: str) -> str:
+        """GET de uma URL absoluta do portal (ex.: link de atividade).
+
+        Pode ser chamado de várias threads com a mesma sessão.
+        """
+        resp = self.session.get(url, timeout=tempo_restante(self.prazo, self.timeout))
+        resp.raise_for_status()
+        html = _decodificar(resp)
+        if eh_pagina_login(html):
+            raise SessaoExpirada(url)
+        return html
+
+    def sessao_valida(self) -> bool:
+        """Probe barato: lê só o começo da página inicial e checa se há login."""
+        try:
+            resp = self.session.get(url_pagina("inicio"), timeout=tempo_restante(self.prazo, self.timeout), stream=True)
+            try:
+                if resp.status_code >= 400:
+                    return False
+                inicio = next(resp.iter_content(_PROBE_BYTES), b"")
+            finally:
+                resp.close()
+        except requests.RequestException as e:
+            logger.warning("Probe de sessão falhou: %s", e)
+            return False
+        return not eh_pagina_login(inicio.decode("latin-1"))
+
+    def exportar_cookies(self) -> list[dict]:
+        """Cookies da sessão em formato serializável (JSON)."""
+        return [
+            {"name": c.name, "value": c.value, "domain": c.domain, "path": c.path}
+            for c in self.session.cookies
+        ]
+
+    def importar_cookies(self, cookies: list[dict]):
+        """Carrega cookies exportados (de outra sessão HTTP ou do Chrome)."""
+        for c in cookies:
+            self.session.cookies.set(
+                c["name"], c["value"], domain=c.get("domain", ""), path=c.get("path", "/")
+            )
+
+    def close(self):
+        """Encerra a sessão HTTP"""
+        self.session.close()
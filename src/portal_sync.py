@@ -0,0 +1,347 @@
+"""
+Sincronização com o portal FAM — um login, várias páginas.
+
+Os comandos (/notas, /grade, /dp, /atividades), o cadastro e o job periódico
+pedem ao PortalSync os alvos de que precisam; ele descriptografa as
+credenciais, faz um único login (reaproveitando a sessão salva), busca as
+páginas na melhor ordem e grava tudo no banco numa transação só.
+
+Do event loop, sincronizar_agendado roda a sync no agendador de scrapes.
+Chamadas simultâneas para o mesmo usuário (três /notas seguidos, /notas
+durante o job) não abrem sessões novas: pegam carona na sincronização em
+andamento que já cubra os alvos pedidos e recebem o mesmo resultado,
+esperando no event loop — sem ocupar worker do agendador.
+
+    resultado = await sincronizar_agendado(chat_id, {"notas", "info", "historico"})
+    if resultado.ok("notas"):
+        ...resultado.notas...
+"""
+
+import asyncio
+import hashlib
+import logging
+import time
+from dataclasses import dataclass, field
+
+import agendador
+import db
+from fam_scraper import FAMScraper, impressao_pagina, parse_grade_html, parse_historico_html, parse_pagina_notas
+from portal_http import PrazoEsgotado
+
+logger = logging.getLogger(__name__)
+
+ALVOS = frozenset({"grade", "notas", "info", "historico", "atividades"})
+
+# Alvo → página do portal ("info" sai da mesma página das notas)
+_PAGINA_DO_ALVO = {
+    "notas": "notas",
+    "info": "notas",
+    "grade": "grade",
+    "historico": "historico",
+    "atividades": "atividades",
+}
+
+# Ordem de busca: páginas servidas pelo cliente HTTP primeiro; atividades
+# (que dependem do Chrome) por último, para não subir o navegador à toa se
+# o login ou as outras páginas já tiverem falhado.
+_ORDEM_PAGINAS = ("notas", "grade", "historico", "atividades")
+
+
+@dataclass
+class StatusPagina:
+    """Resultado de um alvo: "ok", "vazia", "inalterada" (hash igual) ou "erro"."""
+
+    status: str
+    segundos: float = 0.0
+    erro: str | None = None
+
+
+@dataclass
+class ResultadoSync:
+    """O que uma sincronização trouxe do portal, com status e tempo por alvo."""
+
+    login_ok: bool = False
+    segundos_login: float = 0.0
+    paginas: dict[str, StatusPagina] = field(default_factory=dict)
+    grade: dict | None = None
+    notas: list[dict] | None = None
+    info: dict | None = None
+    historico: list[dict] | None = None
+    atividades: list[dict] | None = None
+    impressoes: dict[str, str] = field(default_factory=dict)
+    # timeout_s estourou: o que não deu tempo de buscar fica com status "erro"
+    prazo_esgotado: bool = False
+
+    def ok(self, alvo: str) -> bool:
+        pagina = self.paginas.get(alvo)
+        return bool(pagina and pagina.status == "ok")
+
+    def status(self, alvo: str) -> str | None:
+        pagina = self.paginas.get(alvo)
+        return pagina.status if pagina else None
+
+
+# ── Single-flight ───────────────────────────────────────────────────────────
+# A carona acontece no event loop, antes do agendador: quem pega carona espera
+# o futuro do voo sem ocupar um worker de scrape.
+
+
+class _Voo:
+    """Uma sincronização no agendador; caronas esperam o mesmo `futuro`."""
+
+    def __init__(self, conta, alvos: frozenset, opcoes: tuple, tarefa):
+        self.conta = conta
+        self.alvos = alvos
+        self.opcoes = opcoes
+        self.tarefa = tarefa
+        self.futuro = asyncio.wrap_future(tarefa.futuro)
+        self.caronas = 0
+
+
+# Só mexida no event loop (sem lock)
+_voos: list[_Voo] = []
+
+
+def _carona(conta, alvos: frozenset, opcoes: tuple, prioridade: int) -> _Voo | None:
+    """Voo do mesmo usuário/opções que cubra os alvos e já esteja rodando ou
+    na fila com prioridade igual ou maior (senão a carona esperaria a fila de fundo)."""
+    for voo in _voos:
+        if (voo.conta == conta and voo.opcoes == opcoes and alvos <= voo.alvos
+                and (voo.tarefa.prioridade <= prioridade or voo.tarefa.futuro.running())):
+            return voo
+    return None
+
+
+def _credenciais(login: str | None, senha: str | None) -> str | None:
+    """Impressão das credenciais passadas na chamada (None = as salvas do chat_id)."""
+    if login is None and senha is None:
+        return None
+    return hashlib.sha256(f"{login}\0{senha}".encode("utf-8")).hexdigest()
+
+
+def _pousar(voo: _Voo) -> None:
+    _voos.remove(voo)
+    if not voo.futuro.cancelled():
+        voo.futuro.exception()  # marca como lida mesmo se todos desistiram de esperar
+    if voo.caronas:
+        logger.info("Sync portal: %s — %d chamada(s) atendidas pela mesma sessão", voo.conta, voo.caronas)
+
+
+def _validar_alvos(alvos) -> frozenset:
+    alvos = frozenset(alvos)
+    desconhecidos = alvos - ALVOS
+    if desconhecidos:
+        raise ValueError(f"Alvos desconhecidos: {sorted(desconhecidos)}")
+    return alvos
+
+
+async def sincronizar_agendado(
+    chat_id: int | None,
+    alvos,
+    login: str | None = None,
+    senha: str | None = None,
+    *,
+    prioridade: int = agendador.INTERATIVO,
+    ao_enfileirar=None,
+    turno: str | None = None,
+    pular_inalteradas: bool = False,
+    conhecidas=None,
+    salvar: bool = True,
+    timeout_s: float | None = None,
+) -> ResultadoSync:
+    """PortalSync(...).sincronizar no agendador de scrapes, com single-flight.
+
+    Chamada do mesmo usuário, com as mesmas credenciais e opções, com sync
+    em andamento que cubra os alvos pega carona e recebe o mesmo
+    ResultadoSync. ao_enfileirar: como em
+    AgendadorScrape.executar. Desistir de esperar (cancelamento) não cancela
+    o scrape das caronas.
+    """
+    alvos = _validar_alvos(alvos)
+    conta = chat_id or login
+    # Carona só com as mesmas credenciais e opções: outra senha, outro prazo
+    # ou pular_inalteradas mudariam o resultado que a carona recebe
+    opcoes = (_credenciais(login, senha), turno, salvar, pular_inalteradas, timeout_s, conhecidas is not None)
+    voo = _carona(conta, alvos, opcoes, prioridade)
+    if voo:
+        voo.caronas += 1
+        logger.info("Sync portal: chat_id=%s aguardando sincronização em andamento de %s",
+                    chat_id, sorted(voo.alvos))
+    else:
+        tarefa = agendador.get_agendador().submeter(
+            PortalSync(chat_id, login, senha).sincronizar, alvos, prioridade=prioridade, turno=turno,
+            pular_inalteradas=pular_inalteradas, conhecidas=conhecidas, salvar=salvar, timeout_s=timeout_s,
+        )
+        voo = _Voo(conta, alvos, opcoes, tarefa)
+        _voos.append(voo)
+        voo.futuro.add_done_callback(lambda _: _pousar(voo))
+
+    if voo.tarefa.posicao and ao_enfileirar and not voo.tarefa.futuro.running():
+        try:
+            await ao_enfileirar(voo.tarefa.posicao, voo.tarefa.eta)
+        except Exception as e:
+            logger.warning("Sync portal: erro ao avisar posição na fila: %s", e)
+    return await asyncio.shield(voo.futuro)
+
+
+def _grade_preenchida(grade: dict | None) -> bool:
+    return bool(grade) and any(grade.get(str(d)) for d in range(6))
+
+
+class PortalSync:
+    """Busca vários alvos do portal com um único login.
+
+    Sem login/senha, usa as credenciais salvas do chat_id. Sem chat_id
+    (credenciais do .env), nada é gravado no banco.
+    """
+
+    def __init__(self, chat_id: int | None, login: str | None = None, senha: str | None = None):
+        self.chat_id = chat_id
+        self.login = login
+        self.senha = senha
+
+    def sincronizar(
+        self,
+        alvos,
+        turno: str | None = None,
+        pular_inalteradas: bool = False,
+        conhecidas=None,
+        salvar: bool = True,
+        timeout_s: float | None = None,
+    ) -> ResultadoSync:
+        """Faz login uma vez e busca os alvos pedidos (bloqueante).
+
+        turno: turno da grade (padrão: o do usuário, ou "noturno").
+        pular_inalteradas: não parseia página com o mesmo hash da última sync
+            (status "inalterada", dados lidos do cache do banco).
+        conhecidas: repassado a FAMScraper.extrair_atividades.
+        salvar: grava grade/notas/info/histórico e hashes numa transação.
+        timeout_s: prazo da sessão, contado a partir daqui (só execução, não a
+            fila do agendador). Requests e esperas do Chrome são limitados ao
+            que falta; estourado, o resto fica "erro" e prazo_esgotado=True.
+
+        Do event loop, use sincronizar_agendado (agendador + single-flight).
+        """
+        prazo = time.monotonic() + timeout_s if timeout_s else None
+        return self._sincronizar(_validar_alvos(alvos), turno, pular_inalteradas, conhecidas, salvar, prazo)
+
+    def _sincronizar(self, alvos, turno, pular_inalteradas, conhecidas, salvar, prazo=None) -> ResultadoSync:
+        resultado = ResultadoSync()
+        if not self._carregar_credenciais():
+            logger.error("Sync portal: sem credenciais para chat_id=%s", self.chat_id)
+            return resultado
+
+        paginas = [p for p in _ORDEM_PAGINAS if any(_PAGINA_DO_ALVO[a] == p for a in alvos)]
+        impressoes_salvas = db.get_impressoes(self.chat_id) if pular_inalteradas and self.chat_id else {}
+        if "grade" in alvos and turno is None:
+            user = db.get_user(self.chat_id) if self.chat_id else None
+            turno = (user.get("turno") if user else None) or "noturno"
+
+        def estourou() -> bool:
+            return prazo is not None and time.monotonic() >= prazo
+
+        scraper = FAMScraper(self.login, self.senha, headless=True, chat_id=self.chat_id, prazo=prazo)
+        try:
+            inicio = time.monotonic()
+            try:
+                resultado.login_ok = scraper.fazer_login()
+            except PrazoEsgotado:
+                resultado.login_ok = False
+            resultado.segundos_login = round(time.monotonic() - inicio, 3)
+            if not resultado.login_ok:
+                resultado.prazo_esgotado = estourou()
+                if resultado.prazo_esgotado:
+                    logger.warning("Sync portal: prazo esgotado no login (chat_id=%s)", self.chat_id)
+                else:
+                    logger.error("Sync portal: falha no login para chat_id=%s", self.chat_id)
+                return resultado
+
+            for pagina in paginas:
+                inicio = time.monotonic()
+                try:
+                    if resultado.prazo_esgotado or estourou():
+                        raise PrazoEsgotado("prazo esgotado")
+                    status = self._buscar(scraper, pagina, resultado, turno,
+                                          impressoes_salvas.get(pagina), conhecidas)
+                    erro = None
+                except Exception as e:
+                    if isinstance(e, PrazoEsgotado) or estourou():
+                        # Erro por falta de tempo: não vale o traceback, e o resto nem é tentado
+                        resultado.prazo_esgotado = True
+                        logger.warning("Sync portal: prazo esgotado em %s (chat_id=%s)", pagina, self.chat_id)
+                        status, erro = "erro", "prazo esgotado"
+                    else:
+                        logger.error("Sync portal: erro em %s (chat_id=%s): %s", pagina, self.chat_id, e,
+                                     exc_info=True)
+                        status, erro = "erro", str(e)
+                segundos = round(time.monotonic() - inicio, 3)
+                for alvo in alvos:
+                    if _PAGINA_DO_ALVO[alvo] == pagina:
+                        status_alvo = status
+                        if alvo == "info" and status == "ok" and not resultado.info:
+                            status_alvo = "vazia"
+                        resultado.paginas[alvo] = StatusPagina(status_alvo, segundos, erro)
+        finally:
+            scraper.close()
+
+        logger.info("Sync portal chat_id=%s: login %.2fs | %s", self.chat_id, resultado.segundos_login,
+                    {a: (p.status, p.segundos) for a, p in resultado.paginas.items()})
+        if salvar and self.chat_id:
+            self._salvar(resultado, alvos)
+        return resultado
+
+    def _carregar_credenciais(self) -> bool:
+        if self.login and self.senha:
+            return True
+        if not self.chat_id:
+            return False
+        creds = db.get_credentials(self.chat_id)
+        if not creds:
+            return False
+        self.login, self.senha = creds
+        return True
+
+    def _buscar(self, scraper, pagina, resultado, turno, impressao_salva, conhecidas) -> str:
+        """Busca e parseia uma página, preenchendo `resultado`. Retorna o status."""
+        if pagina == "atividades":
+            resultado.atividades = scraper.extrair_atividades(conhecidas=conhecidas)
+            return "ok" if resultado.atividades else "vazia"
+
+        html = scraper.obter_html(pagina)
+        impressao = impressao_pagina(html, pagina)
+        if impressao and impressao == impressao_salva:
+            # Mesmo conteúdo da última sync: o cache do banco vale como resultado
+            if pagina == "notas":
+                resultado.notas, resultado.info = db.get_notas(self.chat_id), db.get_info_aluno(self.chat_id)
+            elif pagina == "grade":
+                resultado.grade = db.get_grade(self.chat_id)
+            else:
+                resultado.historico = db.get_historico(self.chat_id)
+            return "inalterada"
+
+        if pagina == "notas":
+            resultado.notas, resultado.info = parse_pagina_notas(html)
+            dados = resultado.notas
+        elif pagina == "grade":
+            resultado.grade = parse_grade_html(html, turno=turno)
+            dados = resultado.grade if _grade_preenchida(resultado.grade) else None
+        else:
+            resultado.historico = parse_historico_html(html)
+            dados = resultado.historico
+
+        if not dados:
+            return "vazia"
+        if impressao:
+            resultado.impressoes[pagina] = impressao
+        return "ok"
+
+    def _salvar(self, resultado: ResultadoSync, alvos: frozenset) -> None:
+        """Grava numa transação só o que veio preenchido (vazio nunca apaga cache)."""
+        db.salvar_dados_portal(
+            self.chat_id,
+            grade=resultado.grade if "grade" in alvos and resultado.ok("grade") else None,
+            notas=resultado.notas if "notas" in alvos and resultado.ok("notas") else None,
+            info=resultado.info if "info" in alvos and resultado.ok("info") else None,
+            historico=resultado.historico if "historico" in alvos and resultado.ok("historico") else None,
+            impressoes={p: h for p, h in resultado.impressoes.items() if p in alvos and resultado.ok(p)},
+        )
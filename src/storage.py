@@ -10,14 +10,34 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+DIRETORIO = os.path.join(os.path.dirname(__file__), '..', 'data')
+
+
+def id_atividade(atividade):
+    """Identificador único de uma atividade: título + disciplina"""
+    return f"{atividade.get('titulo', '')}_{atividade.get('disciplina', '')}"
+
+
+def storage_do_usuario(chat_id):
+    """Storage com o histórico de atividades de um usuário (data/atividades/<chat_id>.json).
+
+    Cada conta do portal tem as suas atividades: um histórico só para todos
+    faria a sync de um usuário sobrescrever prazos/links do outro. Sem chat_id
+    (credenciais do .env), usa o arquivo legado data/atividades.json.
+    """
+    if not chat_id:
+        return Storage()
+    return Storage(data_file=os.path.join(DIRETORIO, 'atividades', f'{chat_id}.json'))
+
 
 class Storage:
-    def __init__(self, data_file=os.path.join(os.path.dirname(__file__), '..', 'data', 'atividades.json')):
+    def __init__(self, data_file=os.path.join(DIRETORIO, 'atividades.json')):
         self.data_file = data_file
         self._ensure_data_file()
 
     def _ensure_data_file(self):
         """Garante que o arquivo de dados existe"""
+        os.makedirs(os.path.dirname(self.data_file) or ".", exist_ok=True)
         if not os.path.exists(self.data_file):
             self._save_data({"atividades": [], "last_check": None})
             logger.info(f"Arquivo de dados criado: {self.data_file}")
@@ -66,24 +86,49 @@ class Storage:
         """Verifica se a atividade é nova (não está no histórico)"""
         atividades_existentes = self.get_atividades()
 
-        # Cria um identificador único baseado em título + disciplina
-        novo_id = f"{atividade.get('titulo', '')}_{atividade.get('disciplina', '')}"
+        novo_id = id_atividade(atividade)
 
         for at in atividades_existentes:
-            existing_id = f"{at.get('titulo', '')}_{at.get('disciplina', '')}"
-            if novo_id == existing_id:
+            if novo_id == id_atividade(at):
                 return False
 
         return True
 
+    def get_atividades_conhecidas(self):
+        """Retorna {id_atividade: atividade salva} para reaproveitar detalhes no scraper"""
+        return {id_atividade(at): at for at in self.get_atividades()}
+
     def get_novas_atividades(self, atividades_atuais):
-        """Compara atividades atuais com histórico e retorna as novas"""
+        """Compara atividades atuais com histórico e retorna as novas.
+
+        As já conhecidas são atualizadas no lugar (prazo, link, período e
+        detalhes baixados de novo), senão o scraper as veria como alteradas
+        e baixaria os detalhes outra vez a cada ciclo.
+        """
+        data = self._load_data()
+        indice = {id_atividade(at): i for i, at in enumerate(data["atividades"])}
         novas = []
+        alteradas = 0
 
         for atividade in atividades_atuais:
-            if self.is_nova_atividade(atividade):
+            i = indice.get(id_atividade(atividade))
+            if i is None:
+                atividade['discovered_at'] = datetime.now().isoformat()
+                indice[id_atividade(atividade)] = len(data["atividades"])
+                data["atividades"].append(atividade)
                 novas.append(atividade)
-                self.adicionar_atividade(atividade)
+                logger.info(f"Atividade adicionada: {atividade.get('titulo', 'N/A')}")
+                continue
+
+            atualizada = {**data["atividades"][i], **atividade}
+            if atualizada != data["atividades"][i]:
+                data["atividades"][i] = atualizada
+                alteradas += 1
+
+        if novas or alteradas:
+            self._save_data(data)
+            if alteradas:
+                logger.info(f"Atividades atualizadas: {alteradas}")
 
         return novas
 
@@ -438,8 +438,7 @@ def test_handler_termos():
         check("Handler Termos", entrada, CONFIRMA, resultado, "Aceita → CONFIRMA")
 
     # Recusar (com mock do banco)
-    with patch("cadastro.db") as mock_db:
-        mock_db.DB_PATH = ":memory:"
+    with patch("cadastro.db_async", new_callable=AsyncMock) as mock_db:
         for entrada in ["Não aceito", "não", "n"]:
             update = make_update(entrada)
             context = make_context()
@@ -450,6 +449,23 @@ def test_handler_termos():
             check("Handler Termos", entrada, ConversationHandler.END, resultado,
                   "Recusa → END")
 
+    # Confirmar com o scrape falhando: conversa termina com aviso, sem exceção
+    from cadastro import confirmar
+    update = make_update("sim")
+    context = make_context()
+    context.user_data.update(dados_completos.copy())
+    with patch("cadastro.db_async", new_callable=AsyncMock), \
+            patch("cadastro.sincronizar_agendado",
+                  AsyncMock(side_effect=RuntimeError("Agendador de scrapes encerrado"))):
+        resultado = asyncio.get_event_loop().run_until_complete(confirmar(update, context))
+    check("Handler Termos", "confirmar com scrape falhando", ConversationHandler.END, resultado)
+    respostas = [c.args[0] for c in update.message.reply_text.call_args_list]
+    check("Handler Termos", "aviso de não importado", True,
+          any("Não deu pra importar" in r for r in respostas))
+    check("Handler Termos", "não acusa login/senha", False,
+          any("Não consegui fazer login" in r for r in respostas),
+          "Falha do scrape ≠ credencial errada")
+
 
 def test_handler_nome():
     """Testa handler de nome."""
@@ -457,7 +473,7 @@ def test_handler_nome():
 
     from cadastro import receber_nome, CASA
 
-    with patch("cadastro.db") as mock_db:
+    with patch("cadastro.db_async", new_callable=AsyncMock) as mock_db:
         for nome in ["Pedro", "Maria José", "João da Silva"]:
             update = make_update(nome)
             context = make_context()
@@ -481,9 +497,12 @@ def test_cmd_onibus_transporte():
 
     from onibus import cmd_onibus
 
+    def banco(linha):
+        """Linha do usuário servida pelo db_async (onibus e ContextoUsuario)."""
+        return patch.multiple("db_async", get_user=AsyncMock(return_value=linha), log_evento=AsyncMock())
+
     # Usuário SOU → deve mostrar trajetos normalmente
-    with patch("onibus.db") as mock_db:
-        mock_db.get_user.return_value = {"transporte": "sou"}
+    with banco({"transporte": "sou", "plano": "pro"}):
         update = make_update("/onibus")
         context = make_context()
         asyncio.get_event_loop().run_until_complete(cmd_onibus(update, context))
@@ -492,8 +511,7 @@ def test_cmd_onibus_transporte():
               "SOU → mostra trajetos normalmente")
 
     # Usuário CARRO → deve informar que SOU não se aplica
-    with patch("onibus.db") as mock_db:
-        mock_db.get_user.return_value = {"transporte": "carro"}
+    with banco({"transporte": "carro", "plano": "pro"}):
         update = make_update("/onibus")
         context = make_context()
         asyncio.get_event_loop().run_until_complete(cmd_onibus(update, context))
@@ -502,8 +520,7 @@ def test_cmd_onibus_transporte():
               "Carro → msg 'não se aplica'")
 
     # Usuário EMTU → idem
-    with patch("onibus.db") as mock_db:
-        mock_db.get_user.return_value = {"transporte": "emtu"}
+    with banco({"transporte": "emtu", "plano": "pro"}):
         update = make_update("/onibus")
         context = make_context()
         asyncio.get_event_loop().run_until_complete(cmd_onibus(update, context))
@@ -512,8 +529,7 @@ def test_cmd_onibus_transporte():
               "EMTU → msg 'não se aplica'")
 
     # Usuário antigo sem campo transporte → default 'sou'
-    with patch("onibus.db") as mock_db:
-        mock_db.get_user.return_value = {"nome": "Pedro"}  # sem transporte
+    with banco({"nome": "Pedro", "plano": "pro"}):  # sem transporte
         update = make_update("/onibus")
         context = make_context()
         asyncio.get_event_loop().run_until_complete(cmd_onibus(update, context))
@@ -536,44 +552,38 @@ def test_gemini_transporte():
         "chat_id": 99999, "nome": "Teste", "endereco_casa": "Jd. da Balsa",
         "endereco_trabalho": "Centro", "endereco_faculdade": "FAM",
         "horario_saida_trabalho": "18:00", "horario_entrada_trabalho": "08:00",
-        "turno": "noturno", "transporte": "sou",
+        "turno": "noturno", "transporte": "sou", "plano": "pro",
     }
     user_carro = {**user_sou, "transporte": "carro"}
     user_sem = {k: v for k, v in user_sou.items() if k != "transporte"}
 
     grade = {0: [], 1: [], 2: [], 3: [], 4: [], 5: []}
 
-    # System prompt — SOU deve ter tabela de horários
-    with patch("gemini.db"):
-        prompt_sou = build_system_prompt(user_sou, grade)
-        check("Gemini Prompt", "transporte=sou", True,
-              "TABELA COMPLETA DE HORÁRIOS" in prompt_sou, "SOU → inclui tabela")
+    # System prompt — SOU deve ter tabela de horários (Pro vem da própria linha)
+    prompt_sou = build_system_prompt(user_sou, grade)
+    check("Gemini Prompt", "transporte=sou", True,
+          "TABELA COMPLETA DE HORÁRIOS" in prompt_sou, "SOU → inclui tabela")
 
-        prompt_carro = build_system_prompt(user_carro, grade)
-        check("Gemini Prompt", "transporte=carro", True,
-              "TABELA COMPLETA DE HORÁRIOS" not in prompt_carro, "Carro → sem tabela")
-        check("Gemini Prompt", "transporte=carro", True,
-              "NÃO usa ônibus" in prompt_carro, "Carro → aviso no prompt")
+    prompt_carro = build_system_prompt(user_carro, grade)
+    check("Gemini Prompt", "transporte=carro", True,
+          "TABELA COMPLETA DE HORÁRIOS" not in prompt_carro, "Carro → sem tabela")
+    check("Gemini Prompt", "transporte=carro", True,
+          "NÃO usa ônibus" in prompt_carro, "Carro → aviso no prompt")
 
     # Contexto dinâmico — SOU deve ter seção de ônibus
-    with patch("gemini.db") as mock_db:
-        mock_db.get_notas.return_value = None
-        mock_db.get_info_aluno.return_value = None
-        mock_db.get_historico.return_value = None
+    ctx_sou = _contexto_dinamico(user_sou, grade)
+    check("Gemini Contexto", "transporte=sou", True,
+          "PRÓXIMOS ÔNIBUS" in ctx_sou, "SOU → seção de ônibus")
 
-        ctx_sou = _contexto_dinamico(user_sou, grade)
-        check("Gemini Contexto", "transporte=sou", True,
-              "PRÓXIMOS ÔNIBUS" in ctx_sou, "SOU → seção de ônibus")
+    ctx_carro = _contexto_dinamico(user_carro, grade)
+    check("Gemini Contexto", "transporte=carro", True,
+          "PRÓXIMOS ÔNIBUS" not in ctx_carro, "Carro → sem seção ônibus")
 
-        ctx_carro = _contexto_dinamico(user_carro, grade)
-        check("Gemini Contexto", "transporte=carro", True,
-              "PRÓXIMOS ÔNIBUS" not in ctx_carro, "Carro → sem seção ônibus")
-
-        # Transporte no contexto
-        check("Gemini Contexto", "transporte=sou", True,
-              "Ônibus SOU" in ctx_sou, "SOU → label no contexto")
-        check("Gemini Contexto", "transporte=carro", True,
-              "Carro" in ctx_carro, "Carro → label no contexto")
+    # Transporte no contexto
+    check("Gemini Contexto", "transporte=sou", True,
+          "Ônibus SOU" in ctx_sou, "SOU → label no contexto")
+    check("Gemini Contexto", "transporte=carro", True,
+          "Carro" in ctx_carro, "Carro → label no contexto")
 
 
 # ══════════════════════════════════════════════════════════════════════════════
@@ -640,7 +650,7 @@ def test_fluxo_completo():
     loop = asyncio.get_event_loop()
 
     # 1. Nome
-    with patch("cadastro.db"):
+    with patch("cadastro.db_async", new_callable=AsyncMock):
         update = make_update("Maria Teste")
         r = loop.run_until_complete(receber_nome(update, context))
         check("Fluxo", "1. Nome", CASA, r, "Nome → CASA")
@@ -706,7 +716,7 @@ def test_fluxo_com_trabalho():
     context = make_context()
     loop = asyncio.get_event_loop()
 
-    with patch("cadastro.db"):
+    with patch("cadastro.db_async", new_callable=AsyncMock):
         update = make_update("João Silva")
         r = loop.run_until_complete(receber_nome(update, context))
         check("Fluxo2", "1. Nome", CASA, r)
@@ -749,6 +759,1628 @@ def test_fluxo_com_trabalho():
     check("Fluxo2 (dados)", "h_saida", "18:00", d.get("horario_saida_trabalho"))
 
 
+# ══════════════════════════════════════════════════════════════════════════════
+#  18. TESTES — CLIENTE HTTP DO PORTAL
+# ══════════════════════════════════════════════════════════════════════════════
+
+_HTML_LOGIN = """
+<html><head><meta charset="utf-8"></head><body>
+<form method="post" action="valida_login.php">
+  <input type="hidden" name="token" value="abc123">
+  <input type="text" name="user">
+  <input type="password" name="senha">
+  <input type="submit" name="login" value="Entrar">
+  <input type="submit" name="esqueci" value="Esqueci a senha">
+</form>
+</body></html>
+"""
+
+_HTML_NOTAS_MIN = (
+    '<html><body><table class="GradeNotas"><tr>'
+    + "<td>1234</td><td>Redes de Computadores</td>"
+    + "".join("<td>7,5</td>" for _ in range(13))
+    + "<td>20</td><td>2</td></tr></table></body></html>"
+)
+
+
+def _resposta_fake(html: str, url: str = "https://www.famportal.com.br/"):
+    resp = MagicMock()
+    resp.headers = {"Content-Type": "text/html"}
+    resp.content = html.encode("utf-8")
+    resp.url = url
+    resp.raise_for_status = MagicMock()
+    return resp
+
+
+def test_portal_http():
+    """Testa login HTTP (form POST), detecção de sessão expirada e fallback."""
+    print(f"\n{BOLD}══ 18. PORTAL HTTP — login e páginas sem Chrome ══{RESET}\n")
+
+    import portal_http
+    from fam_scraper import FAMScraper
+
+    action, campos = portal_http._formulario_login(_HTML_LOGIN)
+    check("Portal HTTP", "action do form", "valida_login.php", action)
+    check("Portal HTTP", "hidden token", "abc123", campos.get("token"), "Campos hidden enviados")
+    check("Portal HTTP", "botão login", "Entrar", campos.get("login"), "Botão 'login' enviado")
+    check("Portal HTTP", "outros botões", False, "esqueci" in campos, "Outros submits ignorados")
+    check("Portal HTTP", "sem formulário", None, portal_http._formulario_login("<html></html>"))
+
+    # Login aceito: POST não devolve o formulário
+    http = portal_http.PortalHTTP("12345678900", "senha")
+    http.session = MagicMock()
+    http.session.get.return_value = _resposta_fake(_HTML_LOGIN)
+    http.session.post.return_value = _resposta_fake("<html>bem-vindo</html>")
+    check("Portal HTTP", "login aceito", True, http.fazer_login())
+    dados = http.session.post.call_args[1]["data"]
+    check("Portal HTTP", "POST user/senha", ("12345678900", "senha"), (dados["user"], dados["senha"]))
+    check("Portal HTTP", "URL do POST", "https://www.famportal.com.br/valida_login.php",
+          http.session.post.call_args[0][0], "action relativo resolvido")
+
+    # Login recusado: formulário volta
+    http.session.post.return_value = _resposta_fake(_HTML_LOGIN)
+    check("Portal HTTP", "login recusado", False, http.fazer_login())
+
+    # Página devolvendo o formulário → sessão expirada
+    http.session.get.return_value = _resposta_fake(_HTML_LOGIN)
+    try:
+        http.obter_html("notas")
+        expirou = False
+    except portal_http.SessaoExpirada:
+        expirou = True
+    check("Portal HTTP", "sessão expirada", True, expirou)
+
+    # Scraper: notas via HTTP sem subir Chrome
+    scraper = FAMScraper("x", "y")
+    scraper.http = MagicMock()
+    scraper.http.obter_html.return_value = _HTML_NOTAS_MIN
+    with patch.object(FAMScraper, "_garantir_driver") as garantir, \
+            patch("fam_scraper.captura.registrar") as registrar:
+        notas, _ = scraper.extrair_notas()
+        check("Portal HTTP", "notas via HTTP", 1, len(notas or []))
+        check("Portal HTTP", "sem Chrome", 0, garantir.call_count, "Selenium não usado")
+        check("Portal HTTP", "HTML de debug só via captura", ["notas"],
+              [c.args[1] for c in registrar.call_args_list])
+
+    # Scraper: sessão HTTP expirada → fallback Selenium
+    scraper.http.obter_html.side_effect = portal_http.SessaoExpirada("notas")
+    scraper.driver = MagicMock()
+    scraper.driver.page_source = _HTML_NOTAS_MIN
+    with patch("fam_scraper.time.sleep"):
+        notas, _ = scraper.extrair_notas()
+    check("Portal HTTP", "fallback Selenium", 1, len(notas or []), "Chrome assume após falha HTTP")
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  19. TESTES — POOL DE CHROME
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_browser_pool():
+    """Testa limite do pool, limpeza de cookies e reciclagem de instâncias."""
+    print(f"\n{BOLD}══ 19. POOL DE CHROME — checkout, limpeza e reciclagem ══{RESET}\n")
+
+    from browser_pool import BrowserPool
+
+    criados = []
+
+    def fabrica():
+        driver = MagicMock()
+        driver.window_handles = ["principal"]
+        criados.append(driver)
+        return driver
+
+    pool = BrowserPool(tamanho=2, max_sessoes=2, max_rss_mb=300, fabrica=fabrica)
+    pool.aquecer(1)
+    check("Pool", "aquecer(1)", 1, len(criados), "1 Chrome pré-iniciado")
+
+    a = pool.checkout()
+    b = pool.checkout()
+    check("Pool", "reuso do aquecido", criados[0], a.driver, "Checkout usa o Chrome quente")
+    try:
+        pool.checkout(timeout=0.05)
+        esgotou = False
+    except TimeoutError:
+        esgotou = True
+    check("Pool", "limite de tamanho", True, esgotou, "3º checkout espera/timeout")
+
+    with patch.object(type(a), "rss_mb", return_value=100.0):
+        pool.devolver(a)
+    cookies = [c for c in a.driver.execute_cdp_cmd.call_args_list
+               if c[0][0] == "Network.clearBrowserCookies"]
+    check("Pool", "cookies apagados", True, len(cookies) >= 2, "Limpa no checkout e na devolução")
+
+    with patch.object(type(b), "rss_mb", return_value=999.0):
+        pool.devolver(b)
+    check("Pool", "RSS acima do limite", True, b.driver.quit.called, "Reciclado por memória")
+
+    c = pool.checkout()
+    check("Pool", "checkout após devolução", a.driver, c.driver)
+    with patch.object(type(c), "rss_mb", return_value=100.0):
+        pool.devolver(c)
+    check("Pool", "max_sessoes", True, c.driver.quit.called, "Reciclado após 2 sessões")
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  20. TESTES — SESSÃO DO PORTAL SALVA POR USUÁRIO
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_sessao_portal():
+    """Testa cookies encriptados no banco, expiração e reuso sem novo login."""
+    print(f"\n{BOLD}══ 20. SESSÃO DO PORTAL — cache encriptado de cookies ══{RESET}\n")
+
+    import db as db_module
+    from fam_scraper import FAMScraper
+
+    original_path = db_module.DB_PATH
+    test_db = "/tmp/famus_test_sessao.db"
+    db_module.DB_PATH = test_db
+    cookies = [{"name": "PHPSESSID", "value": "abc", "domain": "www.famportal.com.br", "path": "/"}]
+
+    try:
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        with patch.dict(os.environ, {"TELEGRAM_CHAT_ID": ""}):
+            db_module.init_db()
+
+        db_module.set_sessao_portal(77777, cookies, ttl_min=20)
+        con = sqlite3.connect(test_db)
+        bruto = con.execute("SELECT cookies FROM sessoes_portal WHERE chat_id = 77777").fetchone()[0]
+        con.close()
+        check("Sessão", "encriptada no banco", False, "PHPSESSID" in bruto, "Cookie não fica em texto puro")
+        check("Sessão", "roundtrip", cookies, db_module.get_sessao_portal(77777))
+
+        db_module.set_sessao_portal(77777, cookies, ttl_min=-1)
+        check("Sessão", "TTL expirado", None, db_module.get_sessao_portal(77777), "Sessão vencida descartada")
+
+        # Sessão salva e aceita pelo portal → nenhum POST de login
+        db_module.set_sessao_portal(77777, cookies, ttl_min=20)
+        scraper = FAMScraper("x", "y", chat_id=77777)
+        with patch("portal_http.PortalHTTP.sessao_valida", return_value=True), \
+                patch("portal_http.PortalHTTP.fazer_login") as login_http, \
+                patch.object(FAMScraper, "_login_selenium") as login_selenium:
+            check("Sessão", "reuso da sessão", True, scraper.fazer_login())
+            check("Sessão", "sem novo login", (0, 0), (login_http.call_count, login_selenium.call_count))
+        check("Sessão", "cookies importados", "abc", scraper.http.session.cookies.get("PHPSESSID"))
+
+        # Sessão recusada pelo portal → descartada e login normal
+        with patch("portal_http.PortalHTTP.sessao_valida", return_value=False), \
+                patch("portal_http.PortalHTTP.fazer_login", return_value=True) as login_http:
+            scraper = FAMScraper("x", "y", chat_id=77777)
+            check("Sessão", "probe recusado", True, scraper.fazer_login())
+            check("Sessão", "login HTTP refeito", 1, login_http.call_count)
+
+        # close() salva a sessão renovada; credenciais novas a invalidam
+        scraper.http.session.cookies.set("PHPSESSID", "novo", domain="www.famportal.com.br")
+        scraper.close()
+        check("Sessão", "salva no close", True, db_module.get_sessao_portal(77777) is not None)
+        db_module.set_credentials(77777, "novo", "senha")
+        check("Sessão", "credenciais novas", None, db_module.get_sessao_portal(77777), "Troca de login limpa a sessão")
+    finally:
+        db_module.DB_PATH = original_path
+        if os.path.exists(test_db):
+            os.remove(test_db)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  21. TESTES — ESPERAS POR PRONTIDÃO (SEM SLEEP FIXO)
+# ══════════════════════════════════════════════════════════════════════════════
+
+class _DriverLento:
+    """Driver falso: o marcador só aparece depois de `polls` consultas."""
+
+    def __init__(self, polls=3, url="https://www.famportal.com.br/fam/pg_portal.php"):
+        self.polls = polls
+        self.current_url = url
+        self.page_source = _HTML_NOTAS_MIN
+        self.consultas = 0
+
+    def get(self, url):
+        self.current_url = url
+
+    def set_page_load_timeout(self, segundos):
+        self.carregamento = segundos
+
+    def execute_script(self, script):
+        return "complete"
+
+    def find_elements(self, by, valor):
+        if valor == "senha":
+            return []
+        self.consultas += 1
+        return ["tabela"] if self.consultas > self.polls else []
+
+
+def test_prontidao():
+    """Testa que o Chrome espera marcadores concretos e registra a duração."""
+    print(f"\n{BOLD}══ 21. PRONTIDÃO — esperas por marcador em vez de sleep ══{RESET}\n")
+
+    import fam_scraper
+    from fam_scraper import FAMScraper
+
+    scraper = FAMScraper("x", "y", headless=False, usar_http=False)
+    scraper.driver = _DriverLento(polls=2)
+    scraper._driver_logado = True
+
+    inicio = time.monotonic()
+    html = scraper._obter_html("notas")
+    duracao = time.monotonic() - inicio
+    check("Prontidão", "HTML após marcador", _HTML_NOTAS_MIN, html)
+    check("Prontidão", "termina cedo", True, duracao < 1.5, f"{duracao:.2f}s (antes: 3s fixos)")
+    check("Prontidão", "tempo registrado", True, "notas" in scraper.tempos)
+
+    # Marcador nunca aparece → respeita o timeout da página e segue
+    scraper.driver = _DriverLento(polls=10_000)
+    with patch.dict(fam_scraper.TIMEOUTS_PRONTIDAO, {"grade": 0.3}):
+        scraper._obter_html("grade")
+    check("Prontidão", "timeout por página", True, 0.3 <= scraper.tempos["grade"] < 1.5,
+          f"{scraper.tempos['grade']}s")
+
+    # Login: URL pg_portal encerra a espera; formulário de volta = falha
+    driver = _DriverLento()
+    check("Prontidão", "login ok", "ok",
+          fam_scraper._resultado_login("https://www.famportal.com.br/")(driver))
+    driver.current_url = "https://www.famportal.com.br/erro.php"
+    driver.find_elements = lambda by, valor: ["campo"] if valor == "senha" else []
+    check("Prontidão", "login recusado", "falhou",
+          fam_scraper._resultado_login("https://www.famportal.com.br/")(driver))
+
+    # Atividades sem nenhuma linha: página carregada já basta
+    driver = _DriverLento(polls=10_000, url="https://x/fam/pg_portal.php?frame=frame_avisos.php&atividades=X")
+    check("Prontidão", "atividades vazia", "vazia", fam_scraper._atividades_prontas(driver))
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  22. TESTES — DETALHES DE ATIVIDADE EM PARALELO
+# ══════════════════════════════════════════════════════════════════════════════
+
+_HTML_DETALHE = """<html><body><table>
+<tr><td>Descrição da Atividade:<br>Ler o capítulo 3<br>Responder o questionário<br>
+Material Associado</td></tr>
+<tr><td>slides.pdf</td><td>PDF</td><td><input name="mat_link" value="https://x/slides.pdf"></td></tr>
+<tr><td>slides.pdf</td><td>PDF</td><td><input name="mat_link" value="https://x/slides.pdf"></td></tr>
+</table></body></html>"""
+
+
+def test_detalhes_paralelos():
+    """Testa parser de detalhes e download simultâneo com fallback por link."""
+    print(f"\n{BOLD}══ 22. DETALHES DE ATIVIDADE — HTTP em paralelo ══{RESET}\n")
+
+    import portal_http
+    from fam_scraper import FAMScraper, parse_detalhes_atividade_html
+
+    detalhes = parse_detalhes_atividade_html(_HTML_DETALHE)
+    check("Detalhes", "descrição", "Ler o capítulo 3\nResponder o questionário", detalhes["descricao"])
+    check("Detalhes", "materiais sem duplicata", 1, len(detalhes["materiais"]))
+    check("Detalhes", "link do material", "https://x/slides.pdf", detalhes["materiais"][0]["link"])
+
+    def obter_url(link):
+        time.sleep(0.2)
+        if link.endswith("/4"):
+            raise portal_http.SessaoExpirada(link)
+        return _HTML_DETALHE
+
+    scraper = FAMScraper("x", "y", headless=False)
+    scraper.http = MagicMock()
+    scraper.http.obter_url.side_effect = obter_url
+    links = [f"https://x/atv/{i}" for i in range(1, 5)]
+    with patch("fam_scraper.DETALHES_CONCORRENCIA", 4), \
+            patch.object(FAMScraper, "_garantir_driver", return_value=True), \
+            patch.object(FAMScraper, "extrair_detalhes_atividade",
+                         return_value={"descricao": "via chrome", "materiais": []}) as chrome:
+        inicio = time.monotonic()
+        resultados = scraper.extrair_detalhes_atividades(links + [links[0], ""])
+        duracao = time.monotonic() - inicio
+
+    check("Detalhes", "todos os links", sorted(links), sorted(resultados))
+    check("Detalhes", "downloads simultâneos", True, duracao < 0.6, f"{duracao:.2f}s para 4×0.2s")
+    check("Detalhes", "links únicos", 4, scraper.http.obter_url.call_count, "Duplicados/vazios ignorados")
+    check("Detalhes", "fallback por link", "via chrome", resultados[links[3]]["descricao"])
+    check("Detalhes", "Chrome só no que falhou", 1, chrome.call_count)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  23. TESTES — DETALHES SÓ DE ATIVIDADES NOVAS
+# ══════════════════════════════════════════════════════════════════════════════
+
+class _LinhaAtividade:
+    """Linha <tr class=lovelyrow> falsa para extrair_atividades()."""
+
+    def __init__(self, titulo, disciplina, prazo, link):
+        self.textos = {
+            ".//td[@class='nicepadding'][1]//td[@width='95%']": titulo,
+            ".//td[@class='MensagensAtv']": "Criado por: Prof || Período de Vigência: 01/03 a 30/03",
+            ".//td[@class='Mensagens'][@width='95%']": disciplina,
+            ".//td[@class='nicepadding'][2]//td[1]": "Trabalho",
+            ".//td[@class='nicepadding'][2]//td[@class='MensagensAtv']": "Pendente",
+            ".//td[@class='nicepadding'][3]//div": prazo,
+        }
+        self.link = link
+
+    def find_element(self, by, xpath):
+        return MagicMock(text=self.textos[xpath])
+
+    def get_attribute(self, nome):
+        return f"location.href='{self.link}'"
+
+
+def test_atividades_conhecidas():
+    """Testa que só atividades novas/alteradas têm a página de detalhe baixada."""
+    print(f"\n{BOLD}══ 23. ATIVIDADES — detalhes só do que é novo ══{RESET}\n")
+
+    from fam_scraper import FAMScraper
+    from storage import Storage
+
+    caminho = "/tmp/famus_test_atividades.json"
+    if os.path.exists(caminho):
+        os.remove(caminho)
+    storage = Storage(data_file=caminho)
+
+    try:
+        velha = _LinhaAtividade("Lista 1", "Cálculo", "10/03", "https://x/atv/1")
+        alterada = _LinhaAtividade("Lista 2", "Cálculo", "20/03", "https://x/atv/2")
+        nova = _LinhaAtividade("Projeto", "Redes", "30/03", "https://x/atv/3")
+
+        scraper = FAMScraper("x", "y", headless=False)
+        scraper.driver = MagicMock()
+        scraper.driver.find_elements.return_value = [velha, alterada]
+        with patch.object(FAMScraper, "_garantir_driver", return_value=True), \
+                patch.object(FAMScraper, "navegar_para_atividades", return_value=True), \
+                patch.object(FAMScraper, "extrair_detalhes_atividades",
+                             side_effect=lambda links: {l: {"descricao": "baixada", "materiais": []} for l in links}):
+            primeira = scraper.extrair_atividades(conhecidas=storage.get_atividades_conhecidas())
+            check("Atividades", "primeira execução", 2,
+                  len(FAMScraper.extrair_detalhes_atividades.call_args[0][0]), "Sem histórico, baixa tudo")
+            storage.get_novas_atividades(primeira)
+
+            # Professor mudou o prazo de uma; outra é nova
+            scraper.driver.find_elements.return_value = [velha, alterada, nova]
+            alterada.textos[".//td[@class='nicepadding'][3]//div"] = "25/03"
+            guardadas = storage.get_atividades_conhecidas()
+            guardadas["Lista 1_Cálculo"]["descricao"] = "salva"
+            atividades = scraper.extrair_atividades(conhecidas=guardadas)
+            baixados = FAMScraper.extrair_detalhes_atividades.call_args[0][0]
+
+            check("Atividades", "só novas/alteradas", ["https://x/atv/2", "https://x/atv/3"], baixados)
+            check("Atividades", "reaproveita detalhes", "salva", atividades[0]["descricao"])
+            check("Atividades", "alterada rebaixada", "baixada", atividades[1]["descricao"])
+
+            # Callback no lugar do mapa
+            atividades = scraper.extrair_atividades(conhecidas=lambda at: guardadas.get(f"{at['titulo']}_{at['disciplina']}"))
+            check("Atividades", "callback", ["https://x/atv/2", "https://x/atv/3"],
+                  FAMScraper.extrair_detalhes_atividades.call_args[0][0])
+
+            # Versão nova gravada: o próximo ciclo não baixa a alterada de novo
+            storage.get_novas_atividades(atividades)
+            guardadas = storage.get_atividades_conhecidas()
+            check("Atividades", "prazo atualizado no histórico", "25/03", guardadas["Lista 2_Cálculo"]["prazo"])
+            scraper.extrair_atividades(conhecidas=guardadas)
+            check("Atividades", "alterada baixada uma vez só", [],
+                  FAMScraper.extrair_detalhes_atividades.call_args[0][0])
+
+        # Histórico por usuário: a sync de um não mexe no do outro
+        import shutil
+        import storage as storage_module
+        pasta = "/tmp/famus_test_atividades_usuarios"
+        shutil.rmtree(pasta, ignore_errors=True)
+        with patch.object(storage_module, "DIRETORIO", pasta):
+            ana, bia = storage_module.storage_do_usuario(1), storage_module.storage_do_usuario(2)
+            lista = {"titulo": "Lista 1", "disciplina": "Cálculo", "prazo": "10/03", "link": "https://x/atv/1"}
+            ana.get_novas_atividades([dict(lista)])
+            novas_bia = bia.get_novas_atividades([{**lista, "prazo": "12/03", "link": "https://x/atv/9"}])
+            check("Atividades", "histórico por usuário", (1, "10/03", "12/03"),
+                  (len(novas_bia), ana.get_atividades_conhecidas()["Lista 1_Cálculo"]["prazo"],
+                   storage_module.storage_do_usuario(2).get_atividades_conhecidas()["Lista 1_Cálculo"]["prazo"]))
+        shutil.rmtree(pasta, ignore_errors=True)
+    finally:
+        if os.path.exists(caminho):
+            os.remove(caminho)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  24. TESTES — ÁRVORE HTML ÚNICA POR PÁGINA
+# ══════════════════════════════════════════════════════════════════════════════
+
+_HTML_NOTAS_PAGINA = (
+    '<html><body><font class="login-u">57-05-B</font>'
+    '<font class="login-u">Bloco 2 - Sala 073</font>'
+    '<table><tr><td class="LinhaPar">Ciência da Computação</td></tr></table>'
+    '<table class="GradeNotas"><tr>'
+    + "<td>1234</td><td>Redes de Computadores</td>"
+    + "".join("<td>7,5</td>" for _ in range(13))
+    + "<td>20</td><td>2</td></tr><tr>"
+    + "<td>5678</td><td>Compiladores</td><td>6,0</td><td>1</td><td>6,0</td>"
+    + '<td colspan="6">Não disponível</td>'
+    + '<td class="ColunaMP">6,0</td><td></td><td></td><td class="ColunaMF"></td><td>20</td><td>4</td>'
+    + "</tr></table></body></html>"
+)
+
+
+def test_arvore_compartilhada():
+    """Testa que notas + info do aluno saem de um único parse do HTML."""
+    print(f"\n{BOLD}══ 24. PARSERS — árvore HTML compartilhada ══{RESET}\n")
+
+    import fam_scraper
+    from bs4 import BeautifulSoup
+
+    construcoes = []
+    original = fam_scraper._soup_pagina
+
+    def contando(html, pagina):
+        if not isinstance(html, BeautifulSoup):
+            construcoes.append(html)
+        return original(html, pagina)
+
+    with patch.object(fam_scraper, "_soup_pagina", contando):
+        notas, info = fam_scraper.parse_pagina_notas(_HTML_NOTAS_PAGINA)
+    check("Árvore", "um parse por página", 1, len(construcoes), "notas + info na mesma árvore")
+    check("Árvore", "notas", ["Redes de Computadores", "Compiladores"], [n["disciplina"] for n in notas or []])
+    check("Árvore", "info do aluno", ("5", "Bloco 2 - Sala 073"),
+          ((info or {}).get("semestre"), (info or {}).get("sala")))
+    check("Árvore", "N2 não disponível", (None, 4), (notas[1]["n2"], notas[1]["faltas"]))
+
+    # Soup já montado não é reparseado (parser inexistente quebraria)
+    soup = BeautifulSoup(_HTML_NOTAS_PAGINA, "html.parser")
+    with patch.object(fam_scraper, "PARSER_HTML", "parser-inexistente"):
+        check("Árvore", "aceita soup pronto", 2, len(fam_scraper.parse_notas_html(soup) or []))
+    check("Árvore", "backend", True, fam_scraper.PARSER_HTML in ("lxml", "html.parser"),
+          fam_scraper.PARSER_HTML)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  25. TESTES — PARSE RESTRITO À TABELA
+# ══════════════════════════════════════════════════════════════════════════════
+
+_MENU_PORTAL = '<table class="menu"><tr><td class="LinhaImpar"><a href="#">Início</a></td></tr></table>'
+# Grade/histórico: menu + uma GradeNotas que não pode ser confundida com a Grade
+_NAV_PORTAL = _MENU_PORTAL + '<table class="GradeNotas"><tr><td>menu falso</td></tr></table>'
+
+_HTML_GRADE = (
+    "<html><body>" + _NAV_PORTAL + '<table class="Grade"><tbody>'
+    "<tr><td>Aula</td><td>SEG</td><td>TER</td></tr>"
+    '<tr><td class="GradeNotas">01</td>'
+    '<td class="GradeNotas"><table><tr><td class="LinhaPar">Redes<br><br>'
+    '<font class="MensagensAtv">Ana Souza(12)</font></td></tr></table></td>'
+    '<td class="GradeNotas"></td></tr>'
+    '<tr><td class="GradeNotas">02</td>'
+    '<td class="GradeNotas"><table><tr><td class="LinhaPar">Redes<br><br>'
+    '<font class="MensagensAtv">Ana Souza(12)</font></td></tr></table></td>'
+    '<td class="GradeNotas"></td></tr>'
+    "</tbody></table><div>rodapé</div></body></html>"
+)
+
+_HTML_HISTORICO = (
+    "<html><body>" + _NAV_PORTAL + '<table class="Grade">'
+    '<tr><td colspan="10">SEMESTRE 01</td></tr>'
+    "<tr>" + "".join(f"<td>{c}</td>" for c in
+                     ["ANO", "DISCIPLINA", "CARGA", "N1", "N2", "N3", "AR", "MÉDIA", "FALTAS", "SITUAÇÃO"]) + "</tr>"
+    "<tr>" + "".join(f"<td>{c}</td>" for c in
+                     ["2024", "2222 Ambientação Universitária", "40", "8", "8", "8", "", "8,0", "0", "APROVADO"])
+    + "</tr></table></body></html>"
+)
+
+
+def test_parse_restrito():
+    """Testa recorte/SoupStrainer: só a tabela alvo vira árvore, mesmo resultado."""
+    print(f"\n{BOLD}══ 25. PARSERS — parse restrito à tabela ══{RESET}\n")
+
+    import fam_scraper
+
+    recorte = fam_scraper._recortar_tabela(_HTML_GRADE, "Grade")
+    check("Restrito", "recorte começa na Grade", True, recorte.startswith('<table class="Grade">'))
+    check("Restrito", "tabelas aninhadas", True, recorte.endswith("</tbody></table>"), "Fecha na tabela externa")
+    check("Restrito", "Grade ≠ GradeNotas", None,
+          fam_scraper._recortar_tabela('<table class="GradeNotas"></table>', "Grade"))
+
+    grade = fam_scraper.parse_grade_html(_HTML_GRADE)
+    check("Restrito", "grade", [{"materia": "Redes", "prof": "Ana Souza", "inicio": "19:00", "fim": "20:40"}],
+          grade["0"])
+
+    historico = fam_scraper.parse_historico_html(_HTML_HISTORICO)
+    check("Restrito", "histórico", ("Ambientação Universitária", "1º semestre", 8.0),
+          (historico[0]["disciplina"], historico[0]["semestre"], historico[0]["media_final"]) if historico else None)
+
+    # Página de notas: árvore só com GradeNotas + campos de info do aluno
+    html = _HTML_NOTAS_PAGINA.replace("<body>", "<body><script>var x = 1;</script>" + _MENU_PORTAL)
+    soup = fam_scraper._soup_pagina(html, "notas")
+    check("Restrito", "navegação descartada", ([], []), (soup.find_all("a"), soup.find_all("script")))
+    notas, info = fam_scraper.parse_pagina_notas(html)
+    check("Restrito", "notas iguais", 2, len(notas or []))
+    check("Restrito", "info igual", "Ciência da Computação", (info or {}).get("curso"))
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  26. TESTES — HASH DE PÁGINA (PULA O QUE NÃO MUDOU)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_impressao_pagina():
+    """Testa o hash normalizado da tabela e o armazenamento por usuário/página."""
+    print(f"\n{BOLD}══ 26. HASH DE PÁGINA — pula parse de página inalterada ══{RESET}\n")
+
+    import db as db_module
+    from fam_scraper import impressao_pagina
+
+    base = impressao_pagina(_HTML_NOTAS_PAGINA, "notas")
+    check("Hash", "tabela presente", True, bool(base))
+
+    # Navegação, espaços e comentários não contam
+    variante = _HTML_NOTAS_PAGINA.replace("<body>", "<body>" + _MENU_PORTAL + "<!-- 12:03:44 -->")
+    variante = variante.replace("<tr>", "\n  <tr>").replace("</td>", "</td> <!-- x -->")
+    check("Hash", "ignora ruído", base, impressao_pagina(variante, "notas"))
+
+    # Nota nova muda o hash
+    mudada = _HTML_NOTAS_PAGINA.replace("<td>6,0</td>", "<td>8,0</td>", 1)
+    check("Hash", "nota alterada", False, base == impressao_pagina(mudada, "notas"))
+    mudada = _HTML_NOTAS_PAGINA.replace("Bloco 2 - Sala 073", "Bloco 1 - Sala 012")
+    check("Hash", "dados do aluno alterados", False, base == impressao_pagina(mudada, "notas"),
+          "info_aluno vem da mesma página")
+    check("Hash", "sem tabela", None, impressao_pagina("<html>manutenção</html>", "notas"),
+          "Portal fora do ar nunca pula")
+    check("Hash", "histórico", True, bool(impressao_pagina(_HTML_HISTORICO, "historico")))
+
+    original_path = db_module.DB_PATH
+    test_db = "/tmp/famus_test_impressoes.db"
+    db_module.DB_PATH = test_db
+    try:
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        with patch.dict(os.environ, {"TELEGRAM_CHAT_ID": ""}):
+            db_module.init_db()
+        db_module.create_user(66666, "Teste")
+        check("Hash", "sem hash salvo", {}, db_module.get_impressoes(66666))
+        db_module.set_impressao(66666, "notas", base)
+        db_module.set_impressao(66666, "historico", "abc")
+        check("Hash", "por página", {"notas": base, "historico": "abc"}, db_module.get_impressoes(66666))
+        db_module.set_impressao(66666, "historico", None)
+        check("Hash", "remove hash", {"notas": base}, db_module.get_impressoes(66666))
+    finally:
+        db_module.DB_PATH = original_path
+        if os.path.exists(test_db):
+            os.remove(test_db)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  27. TESTES — CAPTURAS DE DEBUG
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_captura():
+    """Testa modos off/on/amostra, ring buffer por página e limite total."""
+    print(f"\n{BOLD}══ 27. CAPTURAS — HTML/screenshot gzip em ring buffer ══{RESET}\n")
+
+    import gzip
+    import shutil
+    import tempfile
+
+    import captura
+
+    pasta = tempfile.mkdtemp(prefix="famus_capturas_")
+    try:
+        with patch.object(captura, "DIRETORIO", pasta), patch.object(captura, "MODO", "off"):
+            screenshot = MagicMock(return_value=b"png")
+            check("Captura", "off por padrão", False, captura.registrar(1, "notas", "<html>"))
+            captura.registrar(1, "atividades", screenshot, "png")
+            check("Captura", "off não tira screenshot", 0, screenshot.call_count, "callable nem é chamado")
+
+        with patch.object(captura, "DIRETORIO", pasta), patch.object(captura, "MODO", "on"), \
+                patch.object(captura, "POR_PAGINA", 3):
+            for i in range(5):
+                captura.registrar(42, "notas", f"<html>{i}</html>")
+            captura.registrar(42, "atividades", lambda: b"\x89PNG", "png")
+            captura.encerrar()
+
+            arquivos = sorted(os.listdir(os.path.join(pasta, "42", "notas")))
+            check("Captura", "ring por página", 3, len(arquivos), "Só as 3 mais recentes")
+            with gzip.open(os.path.join(pasta, "42", "notas", arquivos[-1]), "rt") as f:
+                check("Captura", "gzip da mais recente", "<html>4</html>", f.read())
+            check("Captura", "screenshot", 1, len(os.listdir(os.path.join(pasta, "42", "atividades"))))
+
+        with patch.object(captura, "MODO", "amostra"), patch.object(captura, "TAXA", 0.0):
+            check("Captura", "amostra 0%", False, captura.sortear())
+        with patch.object(captura, "MODO", "amostra"), patch.object(captura, "TAXA", 1.0):
+            check("Captura", "amostra 100%", True, captura.sortear())
+
+        # Limite total: apaga as mais antigas de qualquer usuário
+        with patch.object(captura, "DIRETORIO", pasta), patch.object(captura, "MODO", "on"), \
+                patch.object(captura, "MAX_MB", 0.0001):
+            captura.registrar(7, "grade", os.urandom(200))
+            captura.encerrar()
+            total = sum(len(nomes) for _, _, nomes in os.walk(pasta))
+            check("Captura", "limite total", True, total <= 1, f"{total} arquivo(s) após poda")
+    finally:
+        shutil.rmtree(pasta, ignore_errors=True)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  28. TESTES — PERFIL ENXUTO DO CHROME
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_chrome_enxuto():
+    """Testa flags do perfil enxuto (assets bloqueados, DOM-ready, allow-list)."""
+    print(f"\n{BOLD}══ 28. CHROME ENXUTO — sem imagens/fontes/CSS/terceiros ══{RESET}\n")
+
+    import browser_pool
+
+    padrao = browser_pool.opcoes_chrome(headless=True, enxuto=False)
+    check("Enxuto", "padrão intacto", "normal", padrao.page_load_strategy)
+    check("Enxuto", "padrão sem bloqueio", False,
+          any("host-resolver-rules" in a for a in padrao.arguments))
+
+    with patch.object(browser_pool, "HOSTS_PERMITIDOS", ["cdn.exemplo.com"]):
+        enxuto = browser_pool.opcoes_chrome(headless=True, enxuto=True)
+    regras = next((a for a in enxuto.arguments if a.startswith("--host-resolver-rules=")), "")
+    check("Enxuto", "DOM-ready", "eager", enxuto.page_load_strategy)
+    check("Enxuto", "sem imagens", True, "--blink-settings=imagesEnabled=false" in enxuto.arguments)
+    check("Enxuto", "terceiros bloqueados", True, "MAP * ~NOTFOUND" in regras)
+    check("Enxuto", "portal liberado", True,
+          "EXCLUDE www.famportal.com.br" in regras and "EXCLUDE famportal.com.br" in regras)
+    check("Enxuto", "allow-list extra", True, "EXCLUDE cdn.exemplo.com" in regras)
+
+    with patch.object(browser_pool.webdriver, "Chrome") as chrome:
+        browser_pool.criar_driver(headless=True, enxuto=True)
+    comandos = [c[0][0] for c in chrome.return_value.execute_cdp_cmd.call_args_list]
+    bloqueadas = chrome.return_value.execute_cdp_cmd.call_args_list[-1][0][1]["urls"]
+    check("Enxuto", "bloqueio via CDP", ["Network.enable", "Network.setBlockedURLs"], comandos)
+    check("Enxuto", "CSS e fontes", True, "*.css" in bloqueadas and "*.woff2" in bloqueadas)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  29. TESTES — PORTAL LOCAL (benchmarks/portal_local.py)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_portal_local():
+    """Testa o cliente HTTP real contra o portal simulado (login, páginas, falhas)."""
+    print(f"\n{BOLD}══ 29. PORTAL LOCAL — cliente HTTP contra o portal simulado ══{RESET}\n")
+
+    import requests
+
+    sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+    import portal_local
+    import portal_http
+    from fam_scraper import parse_detalhes_atividade_html, parse_notas_html
+
+    config = portal_local.ConfigPortal()
+    servidor, url = portal_local.iniciar(0, config)
+    try:
+        with patch.object(portal_http, "PORTAL_URL", url):
+            http = portal_http.PortalHTTP("aluno", "errada")
+            check("Portal local", "senha errada", False, http.fazer_login())
+
+            http = portal_http.PortalHTTP("aluno", "senha")
+            check("Portal local", "login", True, http.fazer_login())
+            check("Portal local", "sessão válida", True, http.sessao_valida())
+            notas = parse_notas_html(http.obter_html("notas"))
+            check("Portal local", "notas", 8, len(notas or []))
+            detalhe = parse_detalhes_atividade_html(
+                http.obter_url(url + "fam/pg_portal.php?frame=frame_atividade.php&id=2"))
+            check("Portal local", "detalhe de atividade", 2, len(detalhe["materiais"]))
+
+            config.taxa_expira = 1.0
+            try:
+                http.obter_html("grade")
+                expirou = False
+            except portal_http.SessaoExpirada:
+                expirou = True
+            check("Portal local", "expiração injetada", True, expirou)
+
+            config.taxa_expira, config.taxa_erro = 0.0, 1.0
+            try:
+                http.obter_html("grade")
+                falhou = False
+            except requests.HTTPError:
+                falhou = True
+            check("Portal local", "erro 503 injetado", True, falhou)
+    finally:
+        servidor.shutdown()
+        servidor.server_close()
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  30. TESTES — SYNC COM O PORTAL (UM LOGIN, VÁRIAS PÁGINAS)
+# ══════════════════════════════════════════════════════════════════════════════
+
+class _ScraperFalso:
+    """FAMScraper de mentira: conta logins e devolve HTML fixo por página."""
+
+    logins = 0
+    paginas = []
+
+    def __init__(self, login, senha, headless=True, chat_id=None, prazo=None):
+        self.login_ok = senha == "certa"
+        self.prazo = prazo
+
+    def fazer_login(self):
+        _ScraperFalso.logins += 1
+        return self.login_ok
+
+    def obter_html(self, pagina):
+        _ScraperFalso.paginas.append(pagina)
+        if pagina == "historico":
+            raise RuntimeError("portal fora do ar")
+        return {"notas": _HTML_NOTAS_PAGINA, "grade": _HTML_GRADE}[pagina]
+
+    def extrair_atividades(self, conhecidas=None):
+        _ScraperFalso.paginas.append("atividades")
+        return [{"titulo": "Lista 1"}]
+
+    def close(self):
+        pass
+
+
+def test_portal_sync():
+    """Testa PortalSync: um login, ordem das páginas, status por alvo e gravação única."""
+    print(f"\n{BOLD}══ 30. SYNC COM O PORTAL — um login, várias páginas ══{RESET}\n")
+
+    import db as db_module
+    import portal_sync
+
+    original_path = db_module.DB_PATH
+    test_db = "/tmp/famus_test_sync.db"
+    db_module.DB_PATH = test_db
+    try:
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        with patch.dict(os.environ, {"TELEGRAM_CHAT_ID": ""}):
+            db_module.init_db()
+        db_module.create_user(55555, "Teste")
+        db_module.set_credentials(55555, "aluno", "certa")
+        db_module.set_historico(55555, [{"disciplina": "Antiga"}])
+
+        _ScraperFalso.logins, _ScraperFalso.paginas = 0, []
+        with patch.object(portal_sync, "FAMScraper", _ScraperFalso):
+            sync = portal_sync.PortalSync(55555)
+            r = sync.sincronizar({"atividades", "historico", "grade", "notas", "info"})
+            check("Sync", "um login só", 1, _ScraperFalso.logins)
+            check("Sync", "ordem das páginas", ["notas", "grade", "historico", "atividades"],
+                  _ScraperFalso.paginas, "HTTP primeiro, Chrome por último")
+            check("Sync", "status por alvo",
+                  {"notas": "ok", "info": "ok", "grade": "ok", "historico": "erro", "atividades": "ok"},
+                  {a: r.status(a) for a in portal_sync.ALVOS})
+            check("Sync", "erro descrito", "portal fora do ar", r.paginas["historico"].erro)
+            check("Sync", "tempos medidos", True, all(p.segundos >= 0 for p in r.paginas.values()))
+
+            check("Sync", "notas gravadas", len(r.notas), len(db_module.get_notas(55555) or []))
+            check("Sync", "grade gravada", True, bool(db_module.get_grade(55555)))
+            check("Sync", "erro não apaga cache", [{"disciplina": "Antiga"}], db_module.get_historico(55555))
+            check("Sync", "hash das páginas ok", ["grade", "notas"], sorted(db_module.get_impressoes(55555)))
+
+            # Mesma página de novo: com pular_inalteradas não parseia
+            r = sync.sincronizar({"notas"}, pular_inalteradas=True)
+            check("Sync", "página inalterada", "inalterada", r.status("notas"))
+            check("Sync", "inalterada vem do cache", db_module.get_notas(55555), r.notas)
+
+            try:
+                sync.sincronizar({"boletim"})
+                recusou = False
+            except ValueError:
+                recusou = True
+            check("Sync", "alvo desconhecido", True, recusou)
+
+            r = portal_sync.PortalSync(None, "aluno", "errada").sincronizar({"notas"})
+            check("Sync", "login recusado", (False, {}), (r.login_ok, r.paginas))
+
+        # Prazo (timeout do job): contado do início da sync, repassado ao scraper
+        from portal_http import PrazoEsgotado, tempo_restante
+
+        class _ScraperDemorado(_ScraperFalso):
+            criados = []
+
+            def __init__(self, *args, **kwargs):
+                super().__init__(*args, **kwargs)
+                _ScraperDemorado.criados.append(self)
+
+            def obter_html(self, pagina):
+                time.sleep(0.3)
+                return super().obter_html(pagina)
+
+        _ScraperFalso.paginas = []
+        with patch.object(portal_sync, "FAMScraper", _ScraperDemorado):
+            inicio = time.monotonic()
+            r = portal_sync.PortalSync(55555).sincronizar({"notas", "grade"}, timeout_s=0.2, salvar=False)
+        check("Sync", "prazo repassado ao scraper", True,
+              abs(_ScraperDemorado.criados[0].prazo - (inicio + 0.2)) < 0.1)
+        check("Sync", "prazo esgotado", (True, "ok", "erro", "prazo esgotado"),
+              (r.prazo_esgotado, r.status("notas"), r.status("grade"), r.paginas["grade"].erro))
+        check("Sync", "resto nem é buscado", ["notas"], _ScraperFalso.paginas)
+        try:
+            tempo_restante(time.monotonic() - 1, 15)
+            esgotou = False
+        except PrazoEsgotado:
+            esgotou = True
+        check("Sync", "tempo_restante", (15, True, True),
+              (tempo_restante(None, 15), tempo_restante(time.monotonic() + 2, 15) <= 2, esgotou))
+
+        # Caminho Selenium: checkout do pool, carregamento e esperas limitados ao prazo
+        from fam_scraper import FAMScraper
+        from selenium.common.exceptions import NoSuchElementException
+
+        class _DriverSemFormulario(_DriverLento):
+            def delete_all_cookies(self):
+                pass
+
+            def find_element(self, by, valor):
+                raise NoSuchElementException(valor)
+
+        class _PoolFalso:
+            def checkout(self, timeout):
+                self.timeout = timeout
+                self.driver = _DriverSemFormulario()
+                return self
+
+        pool = _PoolFalso()
+        scraper = FAMScraper("x", "y", usar_http=False, pool=pool, prazo=time.monotonic() + 0.3)
+        inicio = time.monotonic()
+        try:
+            scraper.fazer_login()
+            esgotou = False
+        except PrazoEsgotado:
+            esgotou = True
+        duracao = time.monotonic() - inicio
+        check("Sync", "Selenium: PrazoEsgotado", True, esgotou, "Não vira 'login falhou'")
+        check("Sync", "Selenium: para no prazo", True, duracao < 1.5, f"{duracao:.2f}s (espera do login: 20s)")
+        check("Sync", "Selenium: checkout e carregamento no prazo", (True, True),
+              (pool.timeout <= 0.3, pool.driver.carregamento <= 0.3))
+
+        # Gravação única mescla hashes e preserva campos não enviados
+        db_module.salvar_dados_portal(55555, historico=[], impressoes={"historico": "abc"})
+        check("Sync", "mescla hashes", ["grade", "historico", "notas"], sorted(db_module.get_impressoes(55555)))
+        check("Sync", "campos omitidos intactos", True, bool(db_module.get_notas(55555)))
+    finally:
+        db_module.DB_PATH = original_path
+        if os.path.exists(test_db):
+            os.remove(test_db)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  31. TESTES — SINGLE-FLIGHT (CHAMADAS SIMULTÂNEAS DO MESMO USUÁRIO)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_single_flight():
+    """Testa que syncs simultâneos do mesmo usuário compartilham uma sessão só, sem ocupar worker."""
+    print(f"\n{BOLD}══ 31. SINGLE-FLIGHT — um scrape para chamadas simultâneas ══{RESET}\n")
+
+    import threading
+    import agendador
+    import portal_sync
+
+    liberar = threading.Event()
+
+    class _ScraperLento(_ScraperFalso):
+        def __init__(self, login, senha, headless=True, chat_id=None, prazo=None):
+            super().__init__(login, senha, headless, chat_id, prazo)
+            self.chat_id = chat_id
+
+        def fazer_login(self):
+            if self.chat_id == 42:
+                liberar.wait(5)
+            return super().fazer_login()
+
+    def sync(chat_id, alvos, prioridade=agendador.INTERATIVO, senha="certa", **opcoes):
+        return portal_sync.sincronizar_agendado(chat_id, alvos, "aluno", senha, prioridade=prioridade,
+                                                turno="noturno", salvar=False, **opcoes)
+
+    async def cenario():
+        # Job de fundo do chat 42 ocupa o único worker de fundo
+        lider = asyncio.create_task(sync(42, {"notas", "info", "grade"}, agendador.FUNDO))
+        await asyncio.sleep(0.1)
+        caronas = [asyncio.create_task(sync(42, alvos)) for alvos in ({"notas", "info", "grade"}, {"notas"})]
+        await asyncio.sleep(0.05)
+        # Worker interativo continua livre: outro usuário não espera o chat 42
+        outro = await asyncio.wait_for(sync(43, {"notas"}), 3)
+        voos = [(v.conta, v.caronas) for v in portal_sync._voos]
+        liberar.set()
+        return [await lider] + [await c for c in caronas], outro, voos
+
+    _ScraperFalso.logins, _ScraperFalso.paginas = 0, []
+    ag = agendador.AgendadorScrape(workers=2, reserva_interativa=1)
+    try:
+        with patch.object(portal_sync, "FAMScraper", _ScraperLento), \
+                patch.object(agendador, "get_agendador", return_value=ag):
+            resultados, outro, voos = asyncio.run(cenario())
+    finally:
+        liberar.set()
+        ag.encerrar()
+
+    check("Single-flight", "logins", 2, _ScraperFalso.logins, "1 para o chat 42 + 1 para o 43")
+    check("Single-flight", "mesmo resultado", True, all(r is resultados[0] for r in resultados))
+    check("Single-flight", "subconjunto pega carona", "ok", resultados[-1].status("notas"))
+    check("Single-flight", "outro usuário separado", True, outro is not resultados[0] and outro.ok("notas"))
+    check("Single-flight", "carona não ocupa worker", [(42, 2)], voos, "Só o líder foi ao agendador")
+    check("Single-flight", "nada em voo depois", [], portal_sync._voos)
+
+    # Outra senha ou outras opções não pegam carona, mesmo com o voo rodando
+    async def cenario_separado():
+        lider = asyncio.create_task(sync(42, {"notas"}, agendador.FUNDO,
+                                         pular_inalteradas=True, timeout_s=30))
+        await asyncio.sleep(0.1)
+        outros = [
+            asyncio.create_task(sync(42, {"notas"})),
+            asyncio.create_task(sync(42, {"notas"}, agendador.FUNDO, pular_inalteradas=True)),
+            asyncio.create_task(sync(42, {"notas"}, agendador.FUNDO, senha="errada",
+                                     pular_inalteradas=True, timeout_s=30)),
+        ]
+        await asyncio.sleep(0.05)
+        voos = [(v.conta, v.caronas) for v in portal_sync._voos]
+        liberar.set()
+        return [await lider] + [await o for o in outros], voos
+
+    liberar.clear()
+    _ScraperFalso.logins = 0
+    ag = agendador.AgendadorScrape(workers=4, reserva_interativa=1)
+    try:
+        with patch.object(portal_sync, "FAMScraper", _ScraperLento), \
+                patch.object(portal_sync.db, "get_impressoes", return_value={}), \
+                patch.object(agendador, "get_agendador", return_value=ag):
+            resultados, voos = asyncio.run(cenario_separado())
+    finally:
+        liberar.set()
+        ag.encerrar()
+
+    check("Single-flight", "opções/credenciais diferentes", [(42, 0)] * 4, voos,
+          "Interativo sem prazo, sem pular_inalteradas e outra senha: voos próprios")
+    check("Single-flight", "resultados separados", 4, len({id(r) for r in resultados}))
+    check("Single-flight", "senha errada não herda login", [True, True, True, False],
+          [r.login_ok for r in resultados])
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  32. TESTES — AGENDADOR DE SCRAPES (PRIORIDADES + WORKERS FIXOS)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_agendador():
+    """Testa ordem por prioridade, teto de tarefas de fundo, posição/ETA e encerramento."""
+    print(f"\n{BOLD}══ 32. AGENDADOR — prioridades e workers fixos ══{RESET}\n")
+
+    import threading
+    import agendador
+
+    ag = agendador.AgendadorScrape(workers=2, reserva_interativa=1)
+    liberar = threading.Event()
+    ordem, simultaneas, pico = [], [0], [0]
+    lock = threading.Lock()
+
+    def tarefa(nome, esperar=None):
+        with lock:
+            simultaneas[0] += 1
+            pico[0] = max(pico[0], simultaneas[0])
+        if esperar:
+            esperar.wait(5)
+        with lock:
+            ordem.append(nome)
+            simultaneas[0] -= 1
+        return nome
+
+    # Fundo ocupa 1 worker (o outro é reservado); a fila de fundo espera
+    t_fundo = [ag.submeter(tarefa, f"fundo{i}", liberar, prioridade=agendador.FUNDO) for i in range(3)]
+    time.sleep(0.1)
+    check("Agendador", "fundo limitado", 1, pico[0], "1 worker reservado aos interativos")
+    check("Agendador", "fundo vê a fila", True, t_fundo[2].posicao >= 2 and t_fundo[2].eta > 0)
+
+    # Cadastro pega o worker reservado; interativo espera na frente do fundo
+    liberar_cadastro = threading.Event()
+    t_cad = ag.submeter(tarefa, "cadastro", liberar_cadastro, prioridade=agendador.CADASTRO)
+    time.sleep(0.05)
+    t_int = ag.submeter(tarefa, "interativo", prioridade=agendador.INTERATIVO)
+    check("Agendador", "interativo fura a fila", 1, t_int.posicao, "2 tarefas de fundo esperando atrás")
+    check("Agendador", "deve ceder", True, ag.deve_ceder())
+    liberar_cadastro.set()
+    t_int.futuro.result(5)
+    check("Agendador", "interativo não espera o fundo", ["cadastro", "interativo"], ordem[:2])
+
+    liberar.set()
+    for t in t_fundo:
+        t.futuro.result(5)
+    check("Agendador", "fundo depois", ["fundo0", "fundo1", "fundo2"], ordem[2:])
+    check("Agendador", "nada pendente", False, ag.deve_ceder())
+
+    resultado = asyncio.run(ag.executar(lambda x: x * 2, 21))
+    check("Agendador", "executar async", 42, resultado)
+
+    def falha():
+        raise ValueError("portal fora")
+    try:
+        asyncio.run(ag.executar(falha))
+        propagou = False
+    except ValueError:
+        propagou = True
+    check("Agendador", "exceção propagada", True, propagou)
+    check("Agendador", "estatísticas", True, ag.estatisticas()["concluidas"] == 7)
+
+    liberar.clear()
+    ocupadas = [ag.submeter(tarefa, f"longa{i}", liberar) for i in range(2)]
+    time.sleep(0.05)
+    pendente = ag.submeter(tarefa, "pendente")
+    check("Agendador", "posição na fila", 1, pendente.posicao)
+    liberar.set()
+    for t in ocupadas:
+        t.futuro.result(5)
+    pendente.futuro.result(5)
+    ag.encerrar()
+    try:
+        ag.submeter(tarefa, "depois")
+        recusou = False
+    except RuntimeError:
+        recusou = True
+    check("Agendador", "encerrado recusa", True, recusou)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  33. TESTES — LOTE DO JOB (CONCORRÊNCIA, LIMITE DE TAXA, TIMEOUT)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_processar_lote():
+    """Testa o lote do job periódico: paralelismo limitado, token bucket e timeouts."""
+    print(f"\n{BOLD}══ 33. LOTE DO JOB — concorrência, limite de taxa e timeout ══{RESET}\n")
+
+    import agendador
+
+    ativos, pico, feitos = [0], [0], []
+
+    async def processar(item):
+        ativos[0] += 1
+        pico[0] = max(pico[0], ativos[0])
+        try:
+            if item == "lento":
+                await asyncio.sleep(1)
+            elif item == "quebra":
+                raise RuntimeError("portal fora")
+            elif item == "prazo":
+                raise TimeoutError("sync passou de 180s")
+            else:
+                await asyncio.sleep(0.02)
+            feitos.append(item)
+        finally:
+            ativos[0] -= 1
+
+    itens = [f"u{i}" for i in range(10)] + ["lento", "quebra", "prazo"]
+    stats = asyncio.run(agendador.processar_lote(itens, processar, concorrencia=3, timeout=0.2))
+    check("Lote", "concorrência máxima", 3, pico[0])
+    check("Lote", "todos processados", 13, stats["feitos"])
+    check("Lote", "timeout por item", 2, stats["timeouts"], "espera abandonada + prazo do scrape")
+    check("Lote", "erro contado", 1, stats["erros"])
+    check("Lote", "lento abandonado", False, "lento" in feitos)
+    check("Lote", "duração do ciclo", True, 0 < stats["segundos"] < 1)
+    check("Lote", "lista vazia", 0, asyncio.run(agendador.processar_lote([], processar, 3))["feitos"])
+
+    async def com_limite():
+        limite = agendador.LimiteTaxa(por_minuto=600, rajada=2)  # 10/s
+        inicio = time.monotonic()
+        for _ in range(4):
+            await limite.aguardar()
+        return time.monotonic() - inicio
+
+    duracao = asyncio.run(com_limite())
+    check("Lote", "limite de taxa", True, 0.15 <= duracao < 0.5, f"{duracao:.2f}s para 2 além da rajada")
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  34. TESTES — AGENDA ESCALONADA POR USUÁRIO (proxima_verificacao)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_agenda_escalonada():
+    """Testa o horário fixo por usuário dentro do intervalo e a fila de vencidos no banco."""
+    print(f"\n{BOLD}══ 34. AGENDA ESCALONADA — horário por usuário ══{RESET}\n")
+
+    from datetime import datetime, timedelta
+    import agendador
+    import db as db_module
+
+    agora = datetime(2025, 4, 1, 12, 0, tzinfo=db_module.TZ)
+    proximos = [agendador.proximo_horario(1_000_000_000 + i * 7, agora, 7200) for i in range(1200)]
+    check("Agenda", "sempre no futuro", True, all(agora < p <= agora + timedelta(seconds=7200) for p in proximos))
+    faixas = [0] * 12  # fatias de 10 min
+    for p in proximos:
+        faixas[int((p - agora).total_seconds() // 600) % 12] += 1
+    check("Agenda", "espalhado no intervalo", True, max(faixas) < 1.5 * min(faixas), f"{faixas}")
+
+    slot = agendador.proximo_horario(123456789, agora, 7200)
+    check("Agenda", "mesmo horário no ciclo seguinte", slot + timedelta(seconds=7200),
+          agendador.proximo_horario(123456789, slot, 7200))
+
+    original_path = db_module.DB_PATH
+    test_db = "/tmp/famus_test_agenda.db"
+    db_module.DB_PATH = test_db
+    try:
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        with patch.dict(os.environ, {"TELEGRAM_CHAT_ID": ""}):
+            db_module.init_db()
+        for chat_id in (1, 2, 3, 4):
+            db_module.create_user(chat_id, "Teste")
+            db_module.update_user(chat_id, onboarding_completo=1)
+        db_module.create_user(5, "Incompleto")
+        db_module.set_proxima_verificacao(1, agora - timedelta(minutes=5))
+        db_module.set_proxima_verificacao(2, agora - timedelta(minutes=50))
+        db_module.set_proxima_verificacao(3, agora + timedelta(minutes=30))
+
+        vencidos = list(db_module.iter_verificacoes_vencidas(agora, 10))
+        check("Agenda", "vencidos em ordem", [4, 2, 1], [u["chat_id"] for u in vencidos],
+              "nunca agendado, depois o mais atrasado")
+        check("Agenda", "limite por tick", [4, 2], [u["chat_id"] for u in db_module.iter_verificacoes_vencidas(agora, 2)])
+
+        # Tick reagenda os vencidos; um restart logo depois não acha ninguém
+        for u in vencidos:
+            db_module.set_proxima_verificacao(u["chat_id"], agendador.proximo_horario(u["chat_id"], agora, 7200))
+        check("Agenda", "restart não varre de novo", [], list(db_module.iter_verificacoes_vencidas(agora, 10)))
+    finally:
+        db_module.DB_PATH = original_path
+        if os.path.exists(test_db):
+            os.remove(test_db)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  35. TESTES — POLÍTICA ADAPTATIVA DE VERIFICAÇÃO
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_politica_verificacao():
+    """Testa fatores do intervalo (mudança, pós-aula, provas, férias, madrugada) e o histórico."""
+    print(f"\n{BOLD}══ 35. POLÍTICA DE VERIFICAÇÃO — intervalo adaptativo ══{RESET}\n")
+
+    from datetime import date, datetime, timedelta, timezone
+    import db as db_module
+    import politica_verificacao as pol
+
+    tz = db_module.TZ
+    terca_tarde = datetime(2025, 4, 1, 15, 0, tzinfo=tz)  # terça, sem aula à tarde
+    grade = {"1": [{"materia": "Redes", "inicio": "19:00", "fim": "22:30"}]}
+
+    def mudanca(horas_atras, disciplina="Redes"):
+        quando = (terca_tarde - timedelta(hours=horas_atras)).astimezone(timezone.utc)
+        return {"disciplina": disciplina, "tipo": "nota", "criado_em": quando.strftime("%Y-%m-%d %H:%M:%S")}
+
+    antigas = [mudanca(24 * 20)]
+    fator, _ = pol.fator_intervalo(terca_tarde, grade, antigas)
+    check("Política", "dia comum", 1.0, fator)
+
+    fator, motivos = pol.fator_intervalo(terca_tarde, grade, antigas + [mudanca(2)])
+    check("Política", "mudança recente", True, fator < 0.5 and "mudança recente" in motivos)
+
+    fator, motivos = pol.fator_intervalo(terca_tarde.replace(hour=23), grade, antigas)
+    check("Política", "pós-aula", True, "pós-aula" in motivos and fator < 1)
+
+    fator, motivos = pol.fator_intervalo(terca_tarde, grade, [])
+    check("Política", "nada muda", True, fator > 1, ", ".join(motivos))
+
+    ativas = [mudanca(24 * d) for d in range(2, 60, 5)]
+    fator, motivos = pol.fator_intervalo(terca_tarde, grade, ativas)
+    check("Política", "disciplina ativa", True, fator < 1 and any("Redes" in m for m in motivos))
+    check("Política", "taxa por disciplina", True,
+          1 < pol.taxas_por_disciplina(ativas + [mudanca(30, "Física")], terca_tarde)["Redes"] < 2)
+
+    with patch.object(pol, "SEMANAS_PROVA", pol._periodos("2025-03-31:2025-04-11")), \
+            patch.object(pol, "FERIAS", pol._periodos("2025-07-01:2025-07-31,lixo")):
+        fator, motivos = pol.fator_intervalo(terca_tarde, grade, antigas)
+        check("Política", "semana de provas", (0.5, ["semana de provas"]), (fator, motivos))
+        fator, motivos = pol.fator_intervalo(terca_tarde.replace(month=7), grade, antigas)
+        check("Política", "férias", True, fator >= 4 and "férias" in motivos)
+
+    proxima, _ = pol.proxima_verificacao(42, terca_tarde, grade, antigas)
+    check("Política", "intervalo base", True,
+          timedelta(hours=2) <= proxima - terca_tarde < timedelta(hours=2.2))
+    proxima, motivos = pol.proxima_verificacao(42, terca_tarde.replace(hour=23, minute=30), grade, [])
+    check("Política", "pula madrugada", True, 7 <= proxima.hour < 8 and "madrugada" in motivos)
+    # Noturno: verificado durante a aula, o intervalo cairia na madrugada → fica logo após as 22:30
+    durante_aula = terca_tarde.replace(hour=21)
+    proxima, motivos = pol.proxima_verificacao(42, durante_aula, grade, [])
+    check("Política", "pós-aula noturno", True,
+          durante_aula.replace(hour=23) <= proxima < durante_aula.replace(hour=23, minute=30)
+          and "madrugada" not in motivos, f"{proxima:%H:%M} {motivos}")
+    proxima, _ = pol.proxima_verificacao(42, terca_tarde, grade, antigas + [mudanca(1)])
+    check("Política", "mínimo respeitado", True, proxima - terca_tarde >= timedelta(seconds=pol.INTERVALO_MIN_S))
+
+    original_path = db_module.DB_PATH
+    test_db = "/tmp/famus_test_politica.db"
+    db_module.DB_PATH = test_db
+    try:
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        with patch.dict(os.environ, {"TELEGRAM_CHAT_ID": ""}):
+            db_module.init_db()
+        db_module.registrar_mudancas(77, ["Redes"], ["Redes", "Física"])
+        db_module.registrar_mudancas(78, [], [])
+        historico = db_module.get_mudancas(77, 60)
+        check("Política", "histórico gravado", [("Redes", "nota"), ("Redes", "falta"), ("Física", "falta")],
+              [(m["disciplina"], m["tipo"]) for m in historico])
+        fator, motivos = pol.fator_intervalo(datetime.now(tz), None, historico)
+        check("Política", "histórico do banco", True, "mudança recente" in motivos)
+    finally:
+        db_module.DB_PATH = original_path
+        if os.path.exists(test_db):
+            os.remove(test_db)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  36. TESTES — FILTRO PRO NO SQL (job periódico)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_filtro_pro_sql():
+    """Testa que o filtro Pro/Trial do job no SQL bate com is_pro (fuso, sem fuso, inválido)."""
+    print(f"\n{BOLD}══ 36. FILTRO PRO NO SQL — job periódico ══{RESET}\n")
+
+    from datetime import datetime, timedelta, timezone
+    import db as db_module
+
+    original_path = db_module.DB_PATH
+    test_db = "/tmp/famus_test_filtro_pro.db"
+    db_module.DB_PATH = test_db
+    try:
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        with patch.dict(os.environ, {"TELEGRAM_CHAT_ID": ""}):
+            db_module.init_db()
+        agora = datetime.now(db_module.TZ)
+        planos = {
+            1: ("pro", None),
+            2: ("trial", (agora + timedelta(days=3)).isoformat()),
+            3: ("pro", (agora - timedelta(minutes=5)).isoformat()),
+            4: ("free", None),
+            # Sem fuso = horário local: venceu há 1h mesmo parecendo futuro em UTC
+            5: ("pro", (agora - timedelta(hours=1)).replace(tzinfo=None).isoformat()),
+            6: ("trial", (agora + timedelta(hours=1)).replace(tzinfo=None).isoformat()),
+            7: ("pro", (agora + timedelta(days=1)).astimezone(timezone.utc).isoformat()),
+            8: ("pro", "data-invalida"),
+            9: ("pro", ""),
+        }
+        for chat_id, (plano, expira) in planos.items():
+            db_module.create_user(chat_id, "Teste")
+            db_module.update_user(chat_id, onboarding_completo=1)
+            db_module.set_plano(chat_id, plano, expira)
+
+        esperado = [c for c in planos if db_module.is_pro(c)]
+        check("Filtro Pro", "SQL == is_pro", esperado,
+              sorted(u["chat_id"] for u in db_module.iter_verificacoes_vencidas(agora, 100, apenas_pro=True)))
+        check("Filtro Pro", "regra esperada", [1, 2, 6, 7, 9], esperado)
+
+        gerador = db_module.iter_verificacoes_vencidas(agora, 100, apenas_pro=True)
+        primeiro = next(gerador)
+        gerador.close()
+        check("Filtro Pro", "só campos do job", ["chat_id", "proxima_verificacao"], sorted(primeiro))
+        check("Filtro Pro", "sem filtro traz todos", len(planos),
+              len(list(db_module.iter_verificacoes_vencidas(agora, 100))))
+    finally:
+        db_module.DB_PATH = original_path
+        if os.path.exists(test_db):
+            os.remove(test_db)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  37. TESTES — CONEXÕES PERSISTENTES POR THREAD (WAL)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_conexoes_db():
+    """Testa reuso da conexão por thread, WAL, rollback de operação com erro e shutdown."""
+    print(f"\n{BOLD}══ 37. CONEXÕES DO BANCO — por thread, WAL ══{RESET}\n")
+
+    import threading
+    import db as db_module
+
+    original_path = db_module.DB_PATH
+    test_db = "/tmp/famus_test_conexoes.db"
+    db_module.DB_PATH = test_db
+    try:
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        with patch.dict(os.environ, {"TELEGRAM_CHAT_ID": ""}):
+            db_module.init_db()
+        db_module.create_user(1, "Teste")
+
+        con = db_module._conn()
+        check("Conexões", "reuso na mesma thread", True, con is db_module._conn())
+        check("Conexões", "journal WAL", "wal", con.execute("PRAGMA journal_mode").fetchone()[0])
+        outra = []
+        t = threading.Thread(target=lambda: outra.append(db_module._conn()))
+        t.start()
+        t.join()
+        check("Conexões", "thread nova → conexão própria", True, outra[0] is not con)
+
+        # Escrita pendente em outra thread não bloqueia leitura (WAL)
+        escrevendo, liberar = threading.Event(), threading.Event()
+
+        def escritor():
+            c = db_module._conn()
+            c.execute("UPDATE usuarios SET nome = 'Novo' WHERE chat_id = 1")
+            escrevendo.set()
+            liberar.wait(5)
+            c.commit()
+
+        t = threading.Thread(target=escritor)
+        t.start()
+        escrevendo.wait(5)
+        check("Conexões", "leitura durante escrita", "Teste", db_module.get_user(1)["nome"], "lê o último commit")
+        liberar.set()
+        t.join()
+        # UPDATE cru (fora de update_user) não invalida o cache de get_user
+        db_module.limpar_cache_usuarios()
+        check("Conexões", "commit visível depois", "Novo", db_module.get_user(1)["nome"])
+
+        try:
+            db_module.update_user(1, coluna_inexistente=1)
+        except Exception:
+            pass
+        check("Conexões", "erro não deixa transação aberta", False, db_module._conn().in_transaction)
+
+        os.remove(test_db)
+        with patch.dict(os.environ, {"TELEGRAM_CHAT_ID": ""}):
+            db_module.init_db()
+        check("Conexões", "arquivo recriado → reabre", None, db_module.get_user(1))
+
+        db_module.fechar_conexoes()
+        check("Conexões", "shutdown fecha e reabre sob demanda", True, db_module._conn() is not con)
+    finally:
+        db_module.DB_PATH = original_path
+        if os.path.exists(test_db):
+            os.remove(test_db)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  38. TESTES — FACHADA ASYNC DO BANCO (db_async)
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_db_async():
+    """Testa que db_async não bloqueia o event loop, serializa escritas e lê o mesmo que db."""
+    print(f"\n{BOLD}══ 38. DB ASYNC — event loop livre ══{RESET}\n")
+
+    import threading
+    import time as _time
+    from datetime import datetime
+    import db as db_module
+    import db_async
+
+    original_path = db_module.DB_PATH
+    test_db = "/tmp/famus_test_db_async.db"
+    db_module.DB_PATH = test_db
+    try:
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        with patch.dict(os.environ, {"TELEGRAM_CHAT_ID": ""}):
+            db_module.init_db()
+
+        async def cenario():
+            await db_async.create_user(10, "Async")
+            await db_async.update_user(10, onboarding_completo=1)
+            user = await db_async.get_user(10)
+            registrado = await db_async.is_registered(10)
+            vencidos = [u["chat_id"] async for u in db_async.iter_verificacoes_vencidas(
+                datetime.now(db_module.TZ), 10)]
+            return user, registrado, vencidos
+
+        user, registrado, vencidos = asyncio.run(cenario())
+        check("DB async", "escrita + leitura", ("Async", True), (user["nome"], registrado))
+        check("DB async", "iter_verificacoes_vencidas", [10], vencidos)
+
+        # Escrita lenta (disco/lock): o loop continua rodando outras tarefas
+        threads = set()
+
+        def update_lento(chat_id, **campos):
+            threads.add(threading.current_thread().name)
+            _time.sleep(0.1)
+
+        async def loop_livre():
+            ticks = 0
+
+            async def relogio():
+                nonlocal ticks
+                while True:
+                    await asyncio.sleep(0.01)
+                    ticks += 1
+
+            tarefa = asyncio.create_task(relogio())
+            await asyncio.gather(*(db_async.update_user(10, nome="x") for _ in range(3)))
+            tarefa.cancel()
+            return ticks
+
+        with patch.object(db_module, "update_user", update_lento):
+            inicio = _time.monotonic()
+            ticks = asyncio.run(loop_livre())
+            segundos = _time.monotonic() - inicio
+        check("DB async", "loop não bloqueia", True, ticks >= 10, f"{ticks} ticks em {segundos:.2f}s")
+        check("DB async", "escritas numa thread só", 1, len(threads), f"{threads}")
+        check("DB async", "escritas em fila", True, segundos >= 0.3, f"{segundos:.2f}s")
+        check("DB async", "nome preservado", "is_pro", db_async.is_pro.__name__)
+    finally:
+        db_module.DB_PATH = original_path
+        if os.path.exists(test_db):
+            os.remove(test_db)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  39. TESTES — CONTEXTO DO USUÁRIO POR UPDATE
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_contexto_usuario():
+    """Testa que o snapshot segue as regras do db, parseia JSON sob demanda e evita releituras."""
+    print(f"\n{BOLD}══ 39. CONTEXTO DO USUÁRIO — uma leitura por update ══{RESET}\n")
+
+    from datetime import datetime, timedelta
+    import db as db_module
+    from contexto_usuario import ContextoUsuario
+    from gemini import _contexto_dinamico, build_system_prompt
+    from aulas import _grade_por_dia
+
+    original_path = db_module.DB_PATH
+    test_db = "/tmp/famus_test_contexto.db"
+    db_module.DB_PATH = test_db
+    try:
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        with patch.dict(os.environ, {"TELEGRAM_CHAT_ID": ""}):
+            db_module.init_db()
+        db_module.create_user(50, "Ana")
+        db_module.update_user(50, onboarding_completo=1, transporte="sou")
+        db_module.set_plano(50, "trial", (datetime.now(db_module.TZ) + timedelta(days=2)).isoformat())
+        db_module.set_grade(50, {"0": [{"materia": "Redes", "prof": "", "inicio": "19:00", "fim": "22:30"}]})
+        db_module.set_notas(50, [{"disciplina": "Redes", "n1": 7.0, "faltas": 2, "max_faltas": 20}])
+        db_module.set_historico(50, [{"disciplina": "Física", "situacao": "Reprovado", "semestre": "2024/1"}])
+
+        usuario = ContextoUsuario.carregar_bloqueante(50)
+        check("Contexto", "mesmas regras do db",
+              (db_module.is_registered(50), db_module.is_pro(50), db_module.get_plano(50),
+               db_module.get_notas(50), db_module.get_grade(50)),
+              (usuario.registrado, usuario.is_pro, usuario.plano, usuario.notas, usuario.grade))
+        vazio = ContextoUsuario(51, None)
+        check("Contexto", "usuário inexistente", (False, False, False, None, None),
+              (vazio.existe, vazio.registrado, vazio.is_pro, vazio.plano, vazio.notas))
+
+        # JSON parseado só quando lido, e uma vez
+        usuario = ContextoUsuario.carregar_bloqueante(50)
+        with patch.object(db_module.json, "loads", wraps=json.loads) as loads:
+            usuario.notas
+            usuario.notas
+            check("Contexto", "JSON sob demanda", 1, loads.call_count, "grade/histórico não lidos")
+
+        # Prompt + contexto da IA sem nenhuma leitura extra do banco
+        # (Free: a simulação Pro importa monitor, que depende do Mercado Pago)
+        usuario = ContextoUsuario(50, {**usuario.user, "plano": "free"})
+        with patch.object(db_module, "get_user", wraps=db_module.get_user) as get_user:
+            grade = _grade_por_dia(usuario.grade)
+            contexto = _contexto_dinamico(usuario.user, grade, usuario)
+            build_system_prompt(usuario.user, grade, usuario)
+            check("Contexto", "IA sem releitura", 0, get_user.call_count)
+        check("Contexto", "dados no contexto da IA", True,
+              "N1=7.0" in contexto and "Física" in contexto and "PRÓXIMOS ÔNIBUS" not in contexto)
+    finally:
+        db_module.DB_PATH = original_path
+        if os.path.exists(test_db):
+            os.remove(test_db)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  40. TESTES — CACHE DE USUÁRIOS
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_cache_usuarios():
+    """Testa o cache de get_user: acertos, invalidação por escrita, TTL e limite LRU."""
+    print(f"\n{BOLD}══ 40. CACHE DE USUÁRIOS — get_user em memória ══{RESET}\n")
+
+    import db as db_module
+
+    original_path = db_module.DB_PATH
+    test_db = "/tmp/famus_test_cache.db"
+    db_module.DB_PATH = test_db
+    try:
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        with patch.dict(os.environ, {"TELEGRAM_CHAT_ID": ""}):
+            db_module.init_db()
+        db_module.create_user(60, "Bia")
+
+        antes = db_module.estatisticas_cache_usuarios()
+        db_module.get_user(60)
+        with patch.object(db_module, "_conn", side_effect=AssertionError("foi ao banco")):
+            user = db_module.get_user(60)
+        depois = db_module.estatisticas_cache_usuarios()
+        check("Cache", "2ª leitura sem banco", "Bia", user["nome"])
+        check("Cache", "contadores", (1, 1),
+              (depois["misses"] - antes["misses"], depois["hits"] - antes["hits"]))
+
+        user["nome"] = "Sujo"
+        check("Cache", "cópia por chamada", "Bia", db_module.get_user(60)["nome"])
+
+        # Toda escrita em usuarios invalida
+        db_module.update_user(60, nome="Bia Souza")
+        check("Cache", "update_user", "Bia Souza", db_module.get_user(60)["nome"])
+        db_module.set_plano(60, "pro", None)
+        check("Cache", "set_plano", True, db_module.is_pro(60))
+        db_module.create_user(61, "Caio")
+        db_module.get_user(61)
+        check("Cache", "ativar_trial", ("trial", True),
+              (db_module.ativar_trial(61) and db_module.get_user(61)["plano"], db_module.is_pro(61)))
+        check("Cache", "inexistente → criado", None, db_module.get_user(62))
+        db_module.create_user(62, "Duda")
+        check("Cache", "create_user", "Duda", (db_module.get_user(62) or {}).get("nome"))
+
+        # TTL vencido → relê do banco
+        with patch.object(db_module, "CACHE_USUARIOS_TTL_S", 0):
+            antes = db_module.estatisticas_cache_usuarios()["misses"]
+            db_module.get_user(60)
+            check("Cache", "TTL vencido", 1, db_module.estatisticas_cache_usuarios()["misses"] - antes)
+
+        # Limite: descarta o menos usado
+        with patch.object(db_module, "CACHE_USUARIOS_MAX", 2):
+            db_module.limpar_cache_usuarios()
+            for cid in (60, 61, 62):
+                db_module.get_user(cid)
+            chaves = [c for _, c in db_module._cache_usuarios]
+            check("Cache", "LRU", [61, 62], chaves)
+    finally:
+        db_module.DB_PATH = original_path
+        db_module.limpar_cache_usuarios()
+        if os.path.exists(test_db):
+            os.remove(test_db)
+
+
+# ══════════════════════════════════════════════════════════════════════════════
+#  41. TESTES — BUFFER DE ANALYTICS
+# ══════════════════════════════════════════════════════════════════════════════
+
+def test_analytics():
+    """Testa que eventos/leads ficam em memória e vão ao banco em lote, sem perder nada."""
+    print(f"\n{BOLD}══ 41. ANALYTICS — eventos e leads em lote ══{RESET}\n")
+
+    import asyncio
+    import time as _time
+    import db as db_module
+    import db_async
+    import analytics
+
+    def contar(sql):
+        return db_module._conn().execute(sql).fetchone()[0]
+
+    original_path = db_module.DB_PATH
+    test_db = "/tmp/famus_test_analytics.db"
+    db_module.DB_PATH = test_db
+    try:
+        if os.path.exists(test_db):
+            os.remove(test_db)
+        with patch.dict(os.environ, {"TELEGRAM_CHAT_ID": ""}):
+            db_module.init_db()
+        analytics.descarregar()
+
+        async def cenario():
+            for _ in range(5):
+                await db_async.log_evento(70, "msg_ia")
+            await db_async.log_evento(70, "cmd_notas")
+            await db_async.registrar_lead(70, username="ana")
+            await db_async.registrar_lead(70, primeiro_nome="Ana")
+            return await db_async.ultimo_evento(70, "cmd_notas")
+
+        with patch.object(analytics, "LOTE", 1000), patch.object(analytics, "INTERVALO_MS", 60_000), \
+                patch.object(db_module, "gravar_analytics", wraps=db_module.gravar_analytics) as gravar:
+            ultimo = asyncio.run(cenario())
+            check("Analytics", "nada no banco antes do lote", (0, 0),
+                  (contar("SELECT COUNT(*) FROM eventos"), contar("SELECT COUNT(*) FROM leads")))
+            check("Analytics", "ultimo_evento vê o buffer", True, ultimo is not None)
+            check("Analytics", "leads fundidos por chat", 7, analytics.pendentes(), "6 eventos + 1 lead")
+            check("Analytics", "descarregar", 7, analytics.descarregar())
+            check("Analytics", "uma transação", 1, gravar.call_count)
+        check("Analytics", "eventos gravados", 6, contar("SELECT COUNT(*) FROM eventos"))
+        lead = db_module._conn().execute(
+            "SELECT username, primeiro_nome FROM leads WHERE chat_id = 70").fetchone()
+        check("Analytics", "lead com os dois campos", ("ana", "Ana"), tuple(lead))
+        check("Analytics", "ultimo_evento do banco", ultimo, db_module.ultimo_evento(70, "cmd_notas"))
+
+        # Lote cheio acorda a thread de gravação
+        with patch.object(analytics, "LOTE", 3):
+            for _ in range(3):
+                analytics.log_evento(71, "cmd_aula")
+            limite = _time.monotonic() + 3
+            while analytics.pendentes() and _time.monotonic() < limite:
+                _time.sleep(0.02)
+        check("Analytics", "lote cheio grava sozinho", 3,
+              contar("SELECT COUNT(*) FROM eventos WHERE chat_id = 71"))
+
+        # /stats e shutdown não perdem o que está no buffer
+        analytics.log_evento(72, "cmd_grade")
+        stats = asyncio.run(db_async.get_stats())
+        check("Analytics", "stats com o buffer", 10, stats["eventos_hoje"])
+        analytics.log_evento(72, "cmd_dp")
+        analytics.encerrar()
+        check("Analytics", "encerrar grava pendentes", 11, contar("SELECT COUNT(*) FROM eventos"))
+    finally:
+        analytics.encerrar()
+        db_module.DB_PATH = original_path
+        if os.path.exists(test_db):
+            os.remove(test_db)
+
+
 # ══════════════════════════════════════════════════════════════════════════════
 #  MAIN
 # ══════════════════════════════════════════════════════════════════════════════
@@ -782,6 +2414,32 @@ def main():
     test_fluxo_completo()
     test_fluxo_com_trabalho()
 
+    # Portal FAM (sem internet)
+    test_portal_http()
+    test_browser_pool()
+    test_sessao_portal()
+    test_prontidao()
+    test_detalhes_paralelos()
+    test_atividades_conhecidas()
+    test_arvore_compartilhada()
+    test_parse_restrito()
+    test_impressao_pagina()
+    test_captura()
+    test_chrome_enxuto()
+    test_portal_local()
+    test_portal_sync()
+    test_single_flight()
+    test_agendador()
+    test_processar_lote()
+    test_agenda_escalonada()
+    test_politica_verificacao()
+    test_filtro_pro_sql()
+    test_conexoes_db()
+    test_db_async()
+    test_contexto_usuario()
+    test_cache_usuarios()
+    test_analytics()
+
     # Testes com internet (lentos)
     skip_nominatim = "--skip-nominatim" in sys.argv
     if skip_nominatim: